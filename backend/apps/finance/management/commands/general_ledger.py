@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.organizations.models import Organization
+from apps.finance.services.posting import backfill_general_ledger, rebuild_account_balances
+
+
+class Command(BaseCommand):
+    help = "Post existing documents to the general ledger or rebuild AccountBalance from the vouchers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['backfill', 'rebuild-balances'],
+            help="backfill: post documents / stock recorded before posting existed | "
+                 "rebuild-balances: recompute monthly account balances"
+        )
+        parser.add_argument(
+            '--organization',
+            type=int,
+            help="Limit to one organization id (default: all)"
+        )
+
+    def handle(self, *args, **options):
+        organization = None
+        if options['organization']:
+            try:
+                organization = Organization.objects.get(id=options['organization'])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} not found")
+
+        if options['action'] == 'rebuild-balances':
+            count = rebuild_account_balances(organization)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} account balance row(s)"))
+            return
+
+        counts = backfill_general_ledger(organization)
+        for source, count in counts.items():
+            self.stdout.write(f"{source}: {count}")
+        self.stdout.write(self.style.SUCCESS("General ledger backfilled"))
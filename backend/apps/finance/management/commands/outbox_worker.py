@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.finance.outbox import BATCH_SIZE, process_batch, retry_dead_events
+
+
+class Command(BaseCommand):
+    help = "Carry out queued accounting side-effects (run as a long-lived worker, or with --once from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the outbox once and exit instead of polling"
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when nothing is due (default: 5)"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Events claimed per transaction (default: {BATCH_SIZE})"
+        )
+        parser.add_argument(
+            '--retry-dead',
+            action='store_true',
+            help="Requeue dead events before starting"
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_dead']:
+            self.stdout.write(f"Requeued {retry_dead_events()} dead events")
+
+        self.stdout.write("Outbox worker started")
+
+        while True:
+            claimed = process_batch(options['batch_size'])
+
+            if not claimed:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Processed {claimed} outbox events")
+
+        self.stdout.write("Outbox empty")
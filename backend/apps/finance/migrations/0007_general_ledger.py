@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-17 20:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_bankaccount_banktransaction_gstreconciliation'),
+        ('organizations', '0021_documentsequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='First day of the month')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='reference',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='source_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='source_type',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='voucher_date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AlterField(
+            model_name='voucher',
+            name='voucher_type',
+            field=models.CharField(choices=[('PAYMENT', 'Payment'), ('RECEIPT', 'Receipt'), ('JOURNAL', 'Journal'), ('SALES', 'Sales'), ('PURCHASE', 'Purchase'), ('CREDIT_NOTE', 'Credit Note'), ('DEBIT_NOTE', 'Debit Note'), ('STOCK', 'Stock')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['source_type', 'source_id'], name='voucher_source_idx'),
+        ),
+        migrations.AddField(
+            model_name='accountbalance',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='finance.chartofaccount'),
+        ),
+        migrations.AddField(
+            model_name='accountbalance',
+            name='organization',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organizations.organization'),
+        ),
+        migrations.AddIndex(
+            model_name='accountbalance',
+            index=models.Index(fields=['organization', 'period'], name='account_balance_period_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountbalance',
+            unique_together={('account', 'period')},
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-17 20:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+
+def key_document_vouchers(apps, schema_editor):
+    """Vouchers posted from documents get their "<source_type>:<source_id>" key"""
+    Voucher = apps.get_model('finance', 'Voucher')
+    Voucher.objects.filter(source_id__isnull=False).exclude(source_type='').update(
+        idempotency_key=Concat('source_type', Value(':'), Cast('source_id', CharField()))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_periodclose'),
+        ('organizations', '0021_documentsequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(key_document_vouchers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='voucher',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('organization', 'idempotency_key'), name='unique_voucher_idempotency_key'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from .voucher import Voucher
 from .transaction import Transaction
 from .chart_of_accounts import ChartOfAccount
+from .account_balance import AccountBalance
+from .period_close import PeriodClose
+from .outbox import OutboxEvent
 from .party import Party
 from .bank_reconciliation import *
-from .gst_reconciliation import *
\ No newline at end of file
+from .gst_reconciliation import *
@@ -0,0 +1,31 @@
+from django.db import models
+
+from apps.organizations.models import Organization
+from .chart_of_accounts import ChartOfAccount
+
+
+class AccountBalance(models.Model):
+    """
+    Debit / credit totals of one account for one month, kept up to date
+    as vouchers are posted. Reports add up these rows instead of the
+    transactions, so their cost depends on accounts, not history.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    account = models.ForeignKey(
+        ChartOfAccount,
+        related_name="balances",
+        on_delete=models.CASCADE
+    )
+    period = models.DateField(help_text="First day of the month")
+    debit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("account", "period")
+        indexes = [
+            models.Index(fields=["organization", "period"], name="account_balance_period_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.period:%Y-%m}: Dr {self.debit} / Cr {self.credit}"
@@ -0,0 +1,53 @@
+from django.db import models
+from django.utils import timezone
+
+from apps.organizations.models import Organization
+
+
+class OutboxEvent(models.Model):
+    """
+    Accounting side-effect of a business write, stored in the same
+    transaction as the document and carried out later by
+    `manage.py outbox_worker` (see finance.outbox). Saving a document
+    therefore never waits on voucher posting, and nothing is lost if
+    posting fails: the event is retried and finally parked as dead.
+    """
+    TOPIC_CHOICES = [
+        ("document", "Document Voucher"),
+        ("stock", "Stock Movement"),
+    ]
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("done", "Done"),
+        ("dead", "Dead"),
+    ]
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="outbox_events"
+    )
+    topic = models.CharField(max_length=20, choices=TOPIC_CHOICES)
+    source_type = models.CharField(max_length=30)
+    source_id = models.PositiveIntegerField()
+    payload = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="outbox_status_idx"),
+            models.Index(fields=["source_type", "source_id"], name="outbox_source_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} {self.source_type}#{self.source_id} ({self.status})"
@@ -0,0 +1,30 @@
+from django.db import models
+from django.conf import settings
+
+from apps.organizations.models import Organization
+
+
+class PeriodClose(models.Model):
+    """
+    Books of an organization are closed up to and including
+    `closed_through` (a month end): nothing may be posted on or before
+    it. `version` changes whenever closed figures could change (a
+    reopen or a balance rebuild), which retires cached statements.
+    """
+    organization = models.OneToOneField(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name="period_close"
+    )
+    closed_through = models.DateField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0)
+    updated_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.organization_id} closed through {self.closed_through or '-'} (v{self.version})"
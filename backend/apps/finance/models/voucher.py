@@ -9,12 +9,24 @@ class Voucher(models.Model):
         ("PAYMENT", "Payment"),
         ("RECEIPT", "Receipt"),
         ("JOURNAL", "Journal"),
+        ("SALES", "Sales"),
+        ("PURCHASE", "Purchase"),
+        ("CREDIT_NOTE", "Credit Note"),
+        ("DEBIT_NOTE", "Debit Note"),
+        ("STOCK", "Stock"),
     )
 
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
     voucher_type = models.CharField(max_length=20, choices=VOUCHER_TYPES)
     amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
     narration = models.TextField()
+    voucher_date = models.DateField(default=timezone.localdate)
+    reference = models.CharField(max_length=100, blank=True)
+    # Document the voucher was posted from (see finance.services.posting)
+    source_type = models.CharField(max_length=30, blank=True)
+    source_id = models.PositiveBigIntegerField(null=True, blank=True)
+    # Posting the same key twice returns the first voucher (retries, imports)
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -36,3 +48,13 @@ class Voucher(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['source_type', 'source_id'], name='voucher_source_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='unique_voucher_idempotency_key',
+            ),
+        ]
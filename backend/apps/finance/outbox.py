@@ -0,0 +1,238 @@
+# apps/finance/outbox.py
+
+import logging
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.finance.models import OutboxEvent
+from apps.finance.services.posting import (
+    post_sales_invoice, post_sales_payment, post_sales_return,
+    post_vendor_invoice, post_vendor_payment, post_purchase_return,
+    post_stock_entries, remove_document_voucher,
+)
+
+logger = logging.getLogger(__name__)
+
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 30          # 30s, 1m, 2m, 4m ... capped below
+RETRY_MAX_SECONDS = 6 * 60 * 60
+
+
+# =========================================================
+# Enqueue (called inside the business transaction)
+# =========================================================
+
+def enqueue_document(source_type, source_id, organization_id=None):
+    """
+    Ask the worker to bring a document's voucher in line with the
+    document (posted, reposted or removed if it no longer exists).
+    A pending event for the same document already covers it; one the
+    worker holds right now is skipped over, so the new state still
+    gets its own event.
+    """
+    pending = OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+        topic="document",
+        source_type=source_type,
+        source_id=source_id,
+        status="pending",
+    )
+    if pending.exists():
+        return None
+    return OutboxEvent.objects.create(
+        organization_id=organization_id,
+        topic="document",
+        source_type=source_type,
+        source_id=source_id,
+    )
+
+
+def enqueue_stock_entries(entries, item_orgs):
+    """One event per organization for a batch of saved, costed ledger rows"""
+    by_org = defaultdict(list)
+    for entry in entries:
+        if entry.quantity:
+            by_org[item_orgs.get(entry.item_id)].append(entry.pk)
+
+    return OutboxEvent.objects.bulk_create([
+        OutboxEvent(
+            organization_id=organization_id,
+            topic="stock",
+            source_type="stock_ledger",
+            source_id=min(ledger_ids),
+            payload={"ledger_ids": sorted(ledger_ids)},
+        )
+        for organization_id, ledger_ids in by_org.items()
+        if organization_id is not None
+    ])
+
+
+# =========================================================
+# Handlers
+# =========================================================
+
+def _document_sources():
+    from apps.inventory.models import VendorInvoice, VendorPayment, PurchaseReturn
+    from apps.sales.models import SalesInvoice, SalesPayment, SalesReturn
+
+    return {
+        "sales_invoice": (SalesInvoice.objects.all(), post_sales_invoice),
+        "sales_payment": (SalesPayment.objects.select_related("invoice"), post_sales_payment),
+        "sales_return": (SalesReturn.objects.select_related("invoice"), post_sales_return),
+        "vendor_invoice": (VendorInvoice.objects.all(), post_vendor_invoice),
+        "vendor_payment": (VendorPayment.objects.select_related("invoice"), post_vendor_payment),
+        "purchase_return": (PurchaseReturn.objects.all(), post_purchase_return),
+    }
+
+
+def _load_documents(events):
+    """
+    (source_type, id) -> document for the batch, one query per source
+    type. A source type whose bulk load fails is left to be loaded per
+    event inside that event's savepoint, so the error lands on (and
+    counts an attempt against) the events that cause it instead of
+    stalling the whole batch. Returns (sources, documents, unloaded).
+    """
+    sources = _document_sources()
+    wanted = defaultdict(set)
+    for event in events:
+        if event.topic == "document":
+            wanted[event.source_type].add(event.source_id)
+
+    documents = {}
+    unloaded = set()
+    for source_type, ids in wanted.items():
+        if source_type not in sources:
+            continue
+        qs, _ = sources[source_type]
+        try:
+            with transaction.atomic():
+                loaded = qs.in_bulk(ids)
+        except Exception:
+            logger.exception("Outbox: loading %s documents failed, loading one by one", source_type)
+            unloaded.add(source_type)
+            continue
+        for pk, document in loaded.items():
+            documents[(source_type, pk)] = document
+    return sources, documents, unloaded
+
+
+def _handle_document(event, sources, documents, unloaded):
+    if event.source_type not in sources:
+        raise ValueError(f"Unknown document type '{event.source_type}'")
+
+    qs, post = sources[event.source_type]
+    if event.source_type in unloaded:
+        document = qs.filter(pk=event.source_id).first()
+    else:
+        document = documents.get((event.source_type, event.source_id))
+
+    if document is None:
+        remove_document_voucher(event.source_type, event.source_id)
+    else:
+        post(document)
+
+
+def _handle_stock(event):
+    from apps.inventory.models import StockLedger
+
+    entries = list(
+        StockLedger.objects.filter(id__in=event.payload.get("ledger_ids", []))
+        .select_related("item")
+        .order_by("id")
+    )
+    post_stock_entries(entries, {e.item_id: e.item.organization_id for e in entries})
+
+
+# =========================================================
+# Worker
+# =========================================================
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def process_batch(batch_size=BATCH_SIZE):
+    """
+    Claim up to `batch_size` due events and carry them out in one
+    transaction, each inside its own savepoint: the postings and the
+    event's new status commit together, and a failing event only rolls
+    back itself. SKIP LOCKED lets several workers share the table.
+    Returns the number of events claimed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", available_at__lte=now)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        sources, documents, unloaded = _load_documents(events)
+        done = {}    # document events already carried out in this batch
+
+        for event in events:
+            key = (event.topic, event.source_type, event.source_id)
+            if event.topic == "document" and key in done:
+                first = done[key]
+                event.status, event.attempts = first.status, first.attempts
+                event.available_at, event.processed_at = first.available_at, first.processed_at
+                event.last_error = first.last_error
+                continue
+
+            event.attempts += 1
+            try:
+                with transaction.atomic():
+                    if event.topic == "document":
+                        _handle_document(event, sources, documents, unloaded)
+                    elif event.topic == "stock":
+                        _handle_stock(event)
+                    else:
+                        raise ValueError(f"Unknown outbox topic '{event.topic}'")
+            except Exception as e:
+                logger.exception("Outbox event %s failed", event.id)
+                event.last_error = f"{e}\n\n{traceback.format_exc()}"
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = "dead"
+                    event.processed_at = timezone.now()
+                else:
+                    event.available_at = timezone.now() + _retry_delay(event.attempts)
+            else:
+                event.status = "done"
+                event.last_error = ""
+                event.processed_at = timezone.now()
+
+            if event.topic == "document":
+                done[key] = event
+
+        OutboxEvent.objects.bulk_update(
+            events, ["status", "attempts", "available_at", "last_error", "processed_at"]
+        )
+    return len(events)
+
+
+def run_pending(batch_size=BATCH_SIZE, limit=None):
+    """Process due events until none are left (or `limit` reached)"""
+    processed = 0
+    while limit is None or processed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - processed)
+        claimed = process_batch(size)
+        if not claimed:
+            break
+        processed += claimed
+    return processed
+
+
+def retry_dead_events(organization=None):
+    """Put dead events back in the queue (after the cause is fixed)"""
+    events = OutboxEvent.objects.filter(status="dead")
+    if organization is not None:
+        events = events.filter(organization=organization)
+    return events.update(status="pending", attempts=0, available_at=timezone.now())
@@ -0,0 +1,65 @@
+# apps/finance/services/period_close.py
+
+import calendar
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.finance.models import PeriodClose
+
+
+class PeriodClosedError(ValueError):
+    pass
+
+
+def month_end(day):
+    return date(day.year, day.month, calendar.monthrange(day.year, day.month)[1])
+
+
+def get_period_close(organization_id):
+    """(closed_through, version) for an organization; (None, 0) if never closed"""
+    row = PeriodClose.objects.filter(
+        organization_id=organization_id
+    ).values_list('closed_through', 'version').first()
+    return row or (None, 0)
+
+
+def check_period_open(organization_id, days):
+    """Raise PeriodClosedError if any of `days` falls in closed books"""
+    closed_through, _ = get_period_close(organization_id)
+    if closed_through is None:
+        return
+    closed = sorted(d for d in days if d <= closed_through)
+    if closed:
+        raise PeriodClosedError(
+            f"Books are closed through {closed_through}; cannot post on {closed[0]}"
+        )
+
+
+@transaction.atomic
+def close_books(organization, through, user=None):
+    """
+    Move the close date to the end of `through`'s month. Moving it back
+    reopens those months and retires every cached closed statement.
+    """
+    organization_id = getattr(organization, 'pk', organization)
+    through = month_end(through) if through else None
+
+    close, _ = PeriodClose.objects.select_for_update().get_or_create(organization_id=organization_id)
+    reopened = close.closed_through is not None and (through is None or through < close.closed_through)
+
+    close.closed_through = through
+    close.updated_by = user
+    if reopened:
+        close.version += 1
+    close.save()
+    return close
+
+
+def bump_statement_version(organization_id=None):
+    """Closed figures were rewritten (e.g. a balance rebuild): drop cached statements"""
+    qs = PeriodClose.objects.all()
+    if organization_id is not None:
+        qs = qs.filter(organization_id=organization_id)
+    qs.update(version=F('version') + 1)
@@ -0,0 +1,631 @@
+# apps/finance/services/posting.py
+
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.finance.models import Voucher, Transaction, ChartOfAccount, AccountBalance, OutboxEvent
+from apps.finance.services.period_close import check_period_open, bump_statement_version
+
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+# Accounts the posting engine books to, created per organization on
+# first use. An existing account with the same code is used as is.
+SYSTEM_ACCOUNTS = {
+    'cash':             ('1000', 'Cash in Hand', ChartOfAccount.ASSET),
+    'bank':             ('1010', 'Bank', ChartOfAccount.ASSET),
+    'receivables':      ('1100', 'Accounts Receivable', ChartOfAccount.ASSET),
+    'inventory':        ('1200', 'Inventory', ChartOfAccount.ASSET),
+    'gst_input':        ('1300', 'GST Input Credit', ChartOfAccount.ASSET),
+    'payables':         ('2000', 'Accounts Payable', ChartOfAccount.LIABILITY),
+    'grni':             ('2010', 'Goods Received Not Invoiced', ChartOfAccount.LIABILITY),
+    'gst_output':       ('2100', 'GST Payable', ChartOfAccount.LIABILITY),
+    'sales':            ('4000', 'Sales', ChartOfAccount.INCOME),
+    'sales_returns':    ('4010', 'Sales Returns', ChartOfAccount.INCOME),
+    'cogs':             ('5000', 'Cost of Goods Sold', ChartOfAccount.EXPENSE),
+    'stock_adjustment': ('5010', 'Inventory Adjustments', ChartOfAccount.EXPENSE),
+}
+
+# Stock ledger reference prefix -> account the inventory movement is
+# booked against. Transfers book against inventory itself and cancel out.
+STOCK_CONTRA_ACCOUNTS = (
+    ('GRN-', 'grni'),
+    ('DN/', 'grni'),
+    ('DC-', 'cogs'),
+    ('Transfer #', 'inventory'),
+    ('Dept Issue #', 'inventory'),
+)
+
+
+class UnbalancedVoucherError(ValueError):
+    pass
+
+
+def _amount(value):
+    value = value if isinstance(value, Decimal) else Decimal(str(value or 0))
+    return value.quantize(CENT)
+
+
+def _as_date(value):
+    """Document dates may still be strings or datetimes right after create()"""
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    if isinstance(value, str):
+        return parse_date(value) or timezone.localdate()
+    return value or timezone.localdate()
+
+
+def _month(day):
+    return date(day.year, day.month, 1)
+
+
+# ========================= ACCOUNTS =========================
+
+def system_accounts(organization_id):
+    """{key: ChartOfAccount} for SYSTEM_ACCOUNTS, creating missing ones"""
+    codes = {code: key for key, (code, _, _) in SYSTEM_ACCOUNTS.items()}
+
+    def fetch():
+        return {
+            codes[a.code]: a
+            for a in ChartOfAccount.objects.filter(organization_id=organization_id, code__in=codes)
+        }
+
+    accounts = fetch()
+    missing = [key for key in SYSTEM_ACCOUNTS if key not in accounts]
+    if missing:
+        ChartOfAccount.objects.bulk_create(
+            [
+                ChartOfAccount(
+                    organization_id=organization_id,
+                    code=SYSTEM_ACCOUNTS[key][0],
+                    name=SYSTEM_ACCOUNTS[key][1],
+                    account_type=SYSTEM_ACCOUNTS[key][2],
+                )
+                for key in missing
+            ],
+            ignore_conflicts=True,   # another transaction may have created it
+        )
+        accounts = fetch()
+    return accounts
+
+
+# ========================= BALANCES =========================
+
+def apply_account_balances(organization_id, movements):
+    """
+    Add (account_id, day, debit, credit) movements to the monthly
+    AccountBalance rows, locking each touched row once.
+    Pass negative amounts to take a posting back out. Raises
+    PeriodClosedError for days in closed books.
+    """
+    deltas = defaultdict(lambda: [ZERO, ZERO])
+    days = set()
+    for account_id, day, debit, credit in movements:
+        delta = deltas[(account_id, _month(day))]
+        delta[0] += debit
+        delta[1] += credit
+        days.add(day)
+
+    if not deltas:
+        return
+    check_period_open(organization_id, days)
+
+    account_ids = {account_id for account_id, _ in deltas}
+    periods = {period for _, period in deltas}
+
+    def fetch():
+        rows = AccountBalance.objects.select_for_update().filter(
+            account_id__in=account_ids, period__in=periods
+        )
+        return {(b.account_id, b.period): b for b in rows if (b.account_id, b.period) in deltas}
+
+    balances = fetch()
+    missing = [key for key in deltas if key not in balances]
+    if missing:
+        AccountBalance.objects.bulk_create(
+            [
+                AccountBalance(organization_id=organization_id, account_id=account_id, period=period)
+                for account_id, period in missing
+            ],
+            ignore_conflicts=True,
+        )
+        balances = fetch()
+
+    now = timezone.now()
+    for key, (debit, credit) in deltas.items():
+        balances[key].debit += debit
+        balances[key].credit += credit
+        balances[key].updated_at = now
+    AccountBalance.objects.bulk_update(balances.values(), ['debit', 'credit', 'updated_at'])
+
+
+# ========================= POSTING =========================
+
+def _clean_lines(lines):
+    """
+    [(account, debit, credit)] -> [(account_id, debit, credit)] with
+    amounts rounded and empty lines dropped. Raises UnbalancedVoucherError.
+    """
+    cleaned = []
+    for account, debit, credit in lines:
+        debit, credit = _amount(debit), _amount(credit)
+        # A negative amount belongs on the other side
+        if debit < 0:
+            debit, credit = ZERO, credit - debit
+        if credit < 0:
+            debit, credit = debit - credit, ZERO
+        if debit or credit:
+            cleaned.append((getattr(account, 'pk', account), debit, credit))
+
+    total_debit = sum((d for _, d, _ in cleaned), ZERO)
+    total_credit = sum((c for _, _, c in cleaned), ZERO)
+    if total_debit != total_credit:
+        raise UnbalancedVoucherError(
+            f"Debit {total_debit} does not equal credit {total_credit}"
+        )
+    return cleaned
+
+
+class VoucherBatchError(ValueError):
+    """Vouchers of a batch that failed validation: [(index, message)]"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"voucher {i}: {message}" for i, message in errors))
+
+
+def _idempotency_key(voucher):
+    key = voucher.get('idempotency_key')
+    if not key and voucher.get('source_type') and voucher.get('source_id') is not None:
+        key = f"{voucher['source_type']}:{voucher['source_id']}"
+    return key or None
+
+
+def post_vouchers(organization_id, vouchers, user=None):
+    """
+    Post many balanced vouchers in one transaction.
+
+    Each voucher is a dict: voucher_type, lines [(account, debit, credit)],
+    narration, and optionally day, reference, source_type, source_id and
+    idempotency_key (defaults to "<source_type>:<source_id>"). A key the
+    organization already used returns the voucher posted under it
+    instead of posting again, so retries and repeated signals are safe.
+
+    Everything is validated first (VoucherBatchError lists all
+    problems), then inserted with bulk_create and added to the
+    balances once. Returns [(Voucher or None, created)] in input order;
+    None for vouchers whose lines are all zero.
+    """
+    prepared, errors = [], []
+    for index, voucher in enumerate(vouchers):
+        try:
+            prepared.append((
+                index,
+                _idempotency_key(voucher),
+                _as_date(voucher.get('day')),
+                _clean_lines(voucher['lines']),
+            ))
+        except (KeyError, TypeError, ArithmeticError, ValueError) as e:
+            errors.append((index, str(e)))
+    if errors:
+        raise VoucherBatchError(errors)
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                return _insert_vouchers(organization_id, vouchers, prepared, user)
+        except IntegrityError:
+            # A concurrent request used one of the keys first; the
+            # second pass finds it and returns it as a duplicate
+            if attempt:
+                raise
+
+
+def _insert_vouchers(organization_id, vouchers, prepared, user):
+    keys = {key for _, key, _, _ in prepared if key}
+    existing = {
+        v.idempotency_key: v
+        for v in Voucher.objects.filter(organization_id=organization_id, idempotency_key__in=keys)
+    } if keys else {}
+
+    results = [(None, False)] * len(vouchers)
+    new, seen = [], {}
+    for index, key, day, lines in prepared:
+        if key in existing:
+            results[index] = (existing[key], False)
+            continue
+        if key in seen:                 # same key twice in one batch
+            seen[key].append(index)
+            continue
+        if not lines:
+            continue
+        data = vouchers[index]
+        new.append((index, lines, Voucher(
+            organization_id=organization_id,
+            voucher_type=data['voucher_type'],
+            amount=sum(d for _, d, _ in lines),
+            narration=data.get('narration', ''),
+            voucher_date=day,
+            reference=(data.get('reference') or '')[:100],
+            source_type=data.get('source_type') or '',
+            source_id=data.get('source_id'),
+            idempotency_key=key,
+            created_by=user,
+        )))
+        if key:
+            seen[key] = []
+
+    if not new:
+        return results
+
+    created = Voucher.objects.bulk_create([voucher for _, _, voucher in new], batch_size=1000)
+    Transaction.objects.bulk_create(
+        [
+            Transaction(voucher=voucher, account_id=account_id, debit=debit, credit=credit)
+            for (_, lines, _), voucher in zip(new, created)
+            for account_id, debit, credit in lines
+        ],
+        batch_size=1000,
+    )
+    apply_account_balances(organization_id, [
+        (account_id, voucher.voucher_date, debit, credit)
+        for (_, lines, _), voucher in zip(new, created)
+        for account_id, debit, credit in lines
+    ])
+
+    for (index, _, _), voucher in zip(new, created):
+        results[index] = (voucher, True)
+        for duplicate in seen.get(voucher.idempotency_key, ()):
+            results[duplicate] = (voucher, False)
+    return results
+
+
+def post_voucher(organization_id, voucher_type, lines, narration, day=None, reference='',
+                 source_type='', source_id=None, user=None, idempotency_key=None):
+    """
+    Post one balanced voucher: [(account, debit, credit)] lines become
+    Transactions and are added to AccountBalance. Returns the Voucher
+    (the earlier one if the idempotency key was used before), or None
+    when every line is zero.
+    """
+    return post_vouchers(organization_id, [{
+        'voucher_type': voucher_type,
+        'lines': lines,
+        'narration': narration,
+        'day': day,
+        'reference': reference,
+        'source_type': source_type,
+        'source_id': source_id,
+        'idempotency_key': idempotency_key,
+    }], user)[0][0]
+
+
+@transaction.atomic
+def sync_document_voucher(organization_id, source_type, source_id, voucher_type, lines,
+                          narration, day=None, reference='', user=None):
+    """
+    Make the voucher of a source document match `lines`. Documents are
+    saved many times (totals, status, payments), so this is idempotent:
+    unchanged lines are a no-op, changed ones replace the old posting
+    and no lines remove it.
+    """
+    day = _as_date(day)
+    lines = _clean_lines(lines)
+
+    voucher = Voucher.objects.select_for_update().filter(
+        organization_id=organization_id, source_type=source_type, source_id=source_id
+    ).first()
+
+    if voucher is None:
+        if not lines:
+            return None
+        voucher, created = post_vouchers(organization_id, [{
+            'voucher_type': voucher_type,
+            'lines': lines,
+            'narration': narration,
+            'day': day,
+            'reference': reference,
+            'source_type': source_type,
+            'source_id': source_id,
+        }], user)[0]
+        if created:
+            return voucher
+        # Posted meanwhile by a concurrent save; bring it up to date
+        voucher = Voucher.objects.select_for_update().get(pk=voucher.pk)
+
+    old_lines = list(voucher.transactions.values_list('account_id', 'debit', 'credit'))
+    if voucher.voucher_date == day and sorted(old_lines) == sorted(lines):
+        return voucher
+
+    apply_account_balances(organization_id, [
+        (account_id, voucher.voucher_date, -debit, -credit) for account_id, debit, credit in old_lines
+    ])
+    if not lines:
+        voucher.delete()
+        return None
+
+    voucher.transactions.all().delete()
+    Transaction.objects.bulk_create([
+        Transaction(voucher=voucher, account_id=account_id, debit=debit, credit=credit)
+        for account_id, debit, credit in lines
+    ])
+    apply_account_balances(organization_id, [
+        (account_id, day, debit, credit) for account_id, debit, credit in lines
+    ])
+    voucher.amount = sum(d for _, d, _ in lines)
+    voucher.voucher_date = day
+    voucher.narration = narration
+    voucher.reference = reference[:100]
+    voucher.save(update_fields=['amount', 'voucher_date', 'narration', 'reference', 'updated_at'])
+    return voucher
+
+
+@transaction.atomic
+def remove_document_voucher(source_type, source_id):
+    """Take a deleted document's voucher back out of the ledger"""
+    for voucher in Voucher.objects.select_for_update().filter(
+        source_type=source_type, source_id=source_id
+    ):
+        apply_account_balances(voucher.organization_id, [
+            (account_id, voucher.voucher_date, -debit, -credit)
+            for account_id, debit, credit in voucher.transactions.values_list('account_id', 'debit', 'credit')
+        ])
+        voucher.delete()
+
+
+# ========================= DOCUMENTS =========================
+
+def _payment_account(accounts, mode):
+    return accounts['cash'] if mode == 'cash' else accounts['bank']
+
+
+def post_sales_invoice(invoice):
+    """Dr receivables / Cr sales + GST output, once the invoice is issued"""
+    a = system_accounts(invoice.organization_id)
+    lines = []
+    if invoice.status not in ('draft', 'cancelled'):
+        total, gst = _amount(invoice.grand_total), _amount(invoice.total_gst)
+        lines = [
+            (a['receivables'], total, ZERO),
+            (a['sales'], ZERO, total - gst),
+            (a['gst_output'], ZERO, gst),
+        ]
+    return sync_document_voucher(
+        invoice.organization_id, 'sales_invoice', invoice.pk, 'SALES', lines,
+        f"Sales invoice {invoice.invoice_number}", invoice.invoice_date,
+        invoice.invoice_number, invoice.created_by,
+    )
+
+
+def post_sales_payment(payment):
+    """Dr cash / bank, Cr receivables"""
+    organization_id = payment.invoice.organization_id
+    a = system_accounts(organization_id)
+    return sync_document_voucher(
+        organization_id, 'sales_payment', payment.pk, 'RECEIPT',
+        [
+            (_payment_account(a, payment.mode), payment.amount, ZERO),
+            (a['receivables'], ZERO, payment.amount),
+        ],
+        f"Receipt for invoice {payment.invoice.invoice_number}", payment.payment_date,
+        payment.reference or payment.invoice.invoice_number, payment.created_by,
+    )
+
+
+def post_sales_return(sales_return):
+    """Dr sales returns + GST output, Cr receivables"""
+    organization_id = sales_return.invoice.organization_id
+    a = system_accounts(organization_id)
+    taxable = sales_return.items.aggregate(total=Sum(F('qty') * F('rate')))['total'] or ZERO
+    total = _amount(sales_return.total_amount)
+    taxable = min(_amount(taxable), total)
+    return sync_document_voucher(
+        organization_id, 'sales_return', sales_return.pk, 'CREDIT_NOTE',
+        [
+            (a['sales_returns'], taxable, ZERO),
+            (a['gst_output'], total - taxable, ZERO),
+            (a['receivables'], ZERO, total),
+        ],
+        f"Sales return SR-{str(sales_return.pk).zfill(5)}", sales_return.return_date,
+        sales_return.invoice.invoice_number,
+    )
+
+
+def post_vendor_invoice(invoice):
+    """Dr goods received not invoiced + GST input, Cr payables"""
+    a = system_accounts(invoice.organization_id)
+    total = _amount(invoice.total_amount)
+    taxable = invoice.items.aggregate(total=Sum(F('qty') * F('rate')))['total']
+    taxable = total if taxable is None else min(_amount(taxable), total)
+    return sync_document_voucher(
+        invoice.organization_id, 'vendor_invoice', invoice.pk, 'PURCHASE',
+        [
+            (a['grni'], taxable, ZERO),
+            (a['gst_input'], total - taxable, ZERO),
+            (a['payables'], ZERO, total),
+        ],
+        f"Purchase invoice {invoice.invoice_number}", invoice.invoice_date,
+        invoice.invoice_number,
+    )
+
+
+def post_vendor_payment(payment):
+    """Dr payables, Cr cash / bank"""
+    organization_id = payment.organization_id or payment.invoice.organization_id
+    a = system_accounts(organization_id)
+    return sync_document_voucher(
+        organization_id, 'vendor_payment', payment.pk, 'PAYMENT',
+        [
+            (a['payables'], payment.amount, ZERO),
+            (_payment_account(a, payment.payment_mode), ZERO, payment.amount),
+        ],
+        f"Payment for invoice {payment.invoice.invoice_number}", payment.payment_date,
+        payment.reference_number or payment.invoice.invoice_number, payment.created_by,
+    )
+
+
+def post_purchase_return(purchase_return):
+    """Dr payables, Cr goods received not invoiced + GST input"""
+    a = system_accounts(purchase_return.organization_id)
+    tax = _amount(purchase_return.cgst) + _amount(purchase_return.sgst) + _amount(purchase_return.igst)
+    return sync_document_voucher(
+        purchase_return.organization_id, 'purchase_return', purchase_return.pk, 'DEBIT_NOTE',
+        [
+            (a['payables'], purchase_return.total_amount, ZERO),
+            (a['grni'], ZERO, purchase_return.taxable_value),
+            (a['gst_input'], ZERO, tax),
+        ],
+        f"Debit note {purchase_return.debit_note_number}", purchase_return.return_date,
+        purchase_return.debit_note_number, purchase_return.created_by,
+    )
+
+
+# ========================= STOCK =========================
+
+def _stock_contra(reference):
+    for prefix, key in STOCK_CONTRA_ACCOUNTS:
+        if reference.startswith(prefix):
+            return key
+    return 'stock_adjustment'
+
+
+def post_stock_entries(entries, item_orgs, source_type='stock_ledger'):
+    """
+    Book the value of costed StockLedger rows: inventory against the
+    account their reference points to (GRN, dispatch, return, transfer).
+    One voucher per organization per batch, lines netted per account.
+    """
+    by_org = defaultdict(list)
+    for entry in entries:
+        if entry.quantity and entry.unit_cost is not None:
+            by_org[item_orgs.get(entry.item_id)].append(entry)
+
+    vouchers = []
+    for organization_id, org_entries in by_org.items():
+        if organization_id is None:
+            continue
+        a = system_accounts(organization_id)
+
+        net = defaultdict(Decimal)   # rounded per row, so the lines always balance
+        for entry in org_entries:
+            value = _amount(Decimal(str(entry.signed_quantity)) * entry.unit_cost)
+            net['inventory'] += value
+            net[_stock_contra(entry.reference or '')] -= value
+
+        first = min(org_entries, key=lambda e: e.pk)
+        voucher = sync_document_voucher(
+            organization_id, source_type, first.pk, 'STOCK',
+            [(a[key], amount, ZERO) for key, amount in net.items()],
+            f"Stock movement {first.reference}".strip(),
+            first.created_at, first.reference or '',
+        )
+        if voucher:
+            vouchers.append(voucher)
+    return vouchers
+
+
+# ========================= BACKFILL / REBUILD =========================
+
+def backfill_general_ledger(organization=None, chunk_size=1000):
+    """
+    Post documents and stock movements recorded before the posting
+    engine existed. Document vouchers are synced, so re-running is safe;
+    stock rows are only posted up to the first live stock voucher.
+    Returns {source: documents processed}.
+    """
+    from apps.inventory.models import Item, StockLedger, VendorInvoice, VendorPayment, PurchaseReturn
+    from apps.sales.models import SalesInvoice, SalesPayment, SalesReturn
+
+    def scoped(qs, field='organization'):
+        return qs if organization is None else qs.filter(**{field: organization})
+
+    sources = (
+        ('vendor_invoice', scoped(VendorInvoice.objects.all()), post_vendor_invoice),
+        ('vendor_payment', scoped(VendorPayment.objects.select_related('invoice'), 'invoice__organization'), post_vendor_payment),
+        ('purchase_return', scoped(PurchaseReturn.objects.all()), post_purchase_return),
+        ('sales_invoice', scoped(SalesInvoice.objects.all()), post_sales_invoice),
+        ('sales_payment', scoped(SalesPayment.objects.select_related('invoice'), 'invoice__organization'), post_sales_payment),
+        ('sales_return', scoped(SalesReturn.objects.select_related('invoice'), 'invoice__organization'), post_sales_return),
+    )
+    counts = {}
+    for source_type, qs, post in sources:
+        counts[source_type] = 0
+        for document in qs.order_by('id').iterator(chunk_size=chunk_size):
+            with transaction.atomic():
+                post(document)
+            counts[source_type] += 1
+
+    items = scoped(Item.objects.all())
+    item_orgs = dict(items.values_list('id', 'organization_id'))
+
+    # Live postings (made, or queued in the outbox) start here; anything
+    # earlier has no voucher yet
+    live = Voucher.objects.filter(source_type='stock_ledger')
+    queued = OutboxEvent.objects.filter(topic='stock')
+    if organization is not None:
+        live = live.filter(organization=organization)
+        queued = queued.filter(organization=organization)
+    starts = [
+        qs.order_by('source_id').values_list('source_id', flat=True).first()
+        for qs in (live, queued)
+    ]
+    cutoff = min((s for s in starts if s is not None), default=None)
+
+    ledger = StockLedger.objects.filter(item__in=items).order_by('id')
+    if cutoff is not None:
+        ledger = ledger.filter(id__lt=cutoff)
+
+    counts['stock_ledger'] = 0
+    chunk = []
+    for entry in ledger.iterator(chunk_size=chunk_size):
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            with transaction.atomic():
+                post_stock_entries(chunk, item_orgs, 'stock_backfill')
+            counts['stock_ledger'] += len(chunk)
+            chunk = []
+    if chunk:
+        with transaction.atomic():
+            post_stock_entries(chunk, item_orgs, 'stock_backfill')
+        counts['stock_ledger'] += len(chunk)
+    return counts
+
+
+@transaction.atomic
+def rebuild_account_balances(organization=None):
+    """Recompute AccountBalance from the posted transactions. Returns rows written."""
+    balances = AccountBalance.objects.all()
+    transactions = Transaction.objects.all()
+    if organization is not None:
+        balances = balances.filter(organization=organization)
+        transactions = transactions.filter(voucher__organization=organization)
+    balances.delete()
+
+    totals = defaultdict(lambda: [ZERO, ZERO])
+    for organization_id, account_id, day, debit, credit in transactions.values_list(
+        'voucher__organization_id', 'account_id', 'voucher__voucher_date', 'debit', 'credit'
+    ).iterator(chunk_size=5000):
+        total = totals[(organization_id, account_id, _month(day))]
+        total[0] += debit
+        total[1] += credit
+
+    AccountBalance.objects.bulk_create(
+        [
+            AccountBalance(
+                organization_id=organization_id, account_id=account_id,
+                period=period, debit=debit, credit=credit,
+            )
+            for (organization_id, account_id, period), (debit, credit) in totals.items()
+        ],
+        batch_size=1000,
+    )
+    bump_statement_version(getattr(organization, 'pk', organization))
+    return len(totals)
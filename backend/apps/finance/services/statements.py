@@ -0,0 +1,205 @@
+# apps/finance/services/statements.py
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from apps.finance.models import ChartOfAccount, AccountBalance
+from apps.finance.services.posting import SYSTEM_ACCOUNTS
+from apps.finance.services.period_close import get_period_close, month_end
+
+
+ZERO = Decimal('0.00')
+
+# First month of the financial year (April for Indian books)
+FISCAL_YEAR_START_MONTH = getattr(settings, 'FISCAL_YEAR_START_MONTH', 4)
+
+# Types whose balance is normally a debit; the rest are credit balances
+DEBIT_NATURE = (ChartOfAccount.ASSET, ChartOfAccount.EXPENSE)
+
+
+def _month(day):
+    return date(day.year, day.month, 1)
+
+
+def account_totals(organization, start=None, end=None):
+    """
+    Debit / credit totals per account from the monthly AccountBalance
+    rows (one grouped query; rows = accounts, not transactions).
+    `start` / `end` are dates, rounded to their month.
+    """
+    qs = AccountBalance.objects.filter(organization=organization)
+    if start:
+        qs = qs.filter(period__gte=_month(start))
+    if end:
+        qs = qs.filter(period__lte=_month(end))
+
+    rows = qs.values(
+        'account_id', 'account__code', 'account__name', 'account__account_type'
+    ).annotate(
+        debit=Sum('debit'), credit=Sum('credit')
+    ).order_by('account__code')
+
+    return [
+        {
+            'account_id': r['account_id'],
+            'code': r['account__code'],
+            'name': r['account__name'],
+            'account_type': r['account__account_type'],
+            'debit': r['debit'] or ZERO,
+            'credit': r['credit'] or ZERO,
+            # Positive in the account's normal direction
+            'balance': (
+                (r['debit'] or ZERO) - (r['credit'] or ZERO)
+                if r['account__account_type'] in DEBIT_NATURE
+                else (r['credit'] or ZERO) - (r['debit'] or ZERO)
+            ),
+        }
+        for r in rows
+    ]
+
+
+def trial_balance(organization, as_of=None):
+    rows = []
+    for r in account_totals(organization, end=as_of):
+        net = r['debit'] - r['credit']
+        if not net:
+            continue
+        rows.append({
+            'account_id': r['account_id'],
+            'code': r['code'],
+            'name': r['name'],
+            'account_type': r['account_type'],
+            'debit': max(net, ZERO),
+            'credit': max(-net, ZERO),
+        })
+    return {
+        'accounts': rows,
+        'total_debit': sum((r['debit'] for r in rows), ZERO),
+        'total_credit': sum((r['credit'] for r in rows), ZERO),
+    }
+
+
+def profit_and_loss(organization, start=None, end=None):
+    totals = account_totals(organization, start, end)
+    income = [r for r in totals if r['account_type'] == ChartOfAccount.INCOME and r['balance']]
+    expenses = [r for r in totals if r['account_type'] == ChartOfAccount.EXPENSE and r['balance']]
+
+    total_income = sum((r['balance'] for r in income), ZERO)
+    total_expenses = sum((r['balance'] for r in expenses), ZERO)
+    return {
+        'income': income,
+        'expenses': expenses,
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'net_profit': total_income - total_expenses,
+    }
+
+
+def balance_sheet(organization, as_of=None):
+    totals = account_totals(organization, end=as_of)
+
+    def section(account_type):
+        return [r for r in totals if r['account_type'] == account_type and r['balance']]
+
+    assets = section(ChartOfAccount.ASSET)
+    liabilities = section(ChartOfAccount.LIABILITY)
+    equity = section(ChartOfAccount.EQUITY)
+
+    # Profit not yet closed to an equity account
+    retained = (
+        sum((r['balance'] for r in section(ChartOfAccount.INCOME)), ZERO)
+        - sum((r['balance'] for r in section(ChartOfAccount.EXPENSE)), ZERO)
+    )
+
+    by_code = {r['code']: r['balance'] for r in totals}
+
+    def system_balance(*keys):
+        return sum((by_code.get(SYSTEM_ACCOUNTS[k][0], ZERO) for k in keys), ZERO)
+
+    total_assets = sum((r['balance'] for r in assets), ZERO)
+    total_liabilities = sum((r['balance'] for r in liabilities), ZERO)
+    return {
+        'assets': assets,
+        'liabilities': liabilities,
+        'equity': equity,
+        'retained_earnings': retained,
+        'total_assets': total_assets,
+        'total_liabilities': total_liabilities,
+        'total_equity': sum((r['balance'] for r in equity), ZERO) + retained,
+        'cash_balance': system_balance('cash', 'bank'),
+        'receivables': system_balance('receivables'),
+        'payables': system_balance('payables'),
+        'inventory_value': system_balance('inventory'),
+    }
+
+
+# ----------------------------------------------------------------------
+# Periods
+# ----------------------------------------------------------------------
+def add_months(day, months):
+    """First day of the month `months` away from `day`'s month"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def fiscal_year_range(year):
+    """(first day, last day) of the financial year starting in `year`"""
+    start = date(year, FISCAL_YEAR_START_MONTH, 1)
+    return start, add_months(start, 12) - timedelta(days=1)
+
+
+def comparison_range(start, end, compare):
+    """
+    Range to compare (start, end) with: "previous_year" shifts both ends
+    back twelve months, "previous_period" by the length of the range.
+    Statements are monthly, so ranges are whole months.
+    """
+    if compare == 'previous_year':
+        months = 12
+    elif compare == 'previous_period':
+        if start is None:
+            raise ValueError("previous_period needs a start date")
+        months = (end.year - start.year) * 12 + end.month - start.month + 1
+    else:
+        raise ValueError("compare must be 'previous_period' or 'previous_year'")
+
+    new_start = add_months(start, -months) if start else None
+    return new_start, month_end(add_months(end, -months))
+
+
+# ----------------------------------------------------------------------
+# Cached statements
+# ----------------------------------------------------------------------
+STATEMENTS = {
+    'profit_and_loss': lambda organization, start, end: profit_and_loss(organization, start, end),
+    'balance_sheet': lambda organization, start, end: balance_sheet(organization, end),
+    'trial_balance': lambda organization, start, end: trial_balance(organization, end),
+}
+
+
+def get_statement(kind, organization, start=None, end=None):
+    """
+    Statement for whole months from `start` to `end` (balance sheet and
+    trial balance use `end` only). A statement that ends inside closed
+    books cannot change, so it is cached without expiry under the
+    organization's close version; open periods are computed each time
+    (a grouped read of AccountBalance).
+    """
+    organization_id = getattr(organization, 'pk', organization)
+    if kind != 'profit_and_loss':
+        start = None
+    closed_through, version = get_period_close(organization_id)
+
+    if end is None or closed_through is None or month_end(end) > closed_through:
+        return STATEMENTS[kind](organization_id, start, end)
+
+    key = f"fin_statement:{organization_id}:{version}:{kind}:{_month(start) if start else '-'}:{month_end(end)}"
+    report = cache.get(key)
+    if report is None:
+        report = STATEMENTS[kind](organization_id, start, end)
+        cache.set(key, report, None)
+    return report
@@ -0,0 +1,41 @@
+# apps/finance/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.sales.models import SalesInvoice, SalesPayment, SalesReturn
+from apps.finance.outbox import enqueue_document
+
+
+# =========================================================
+# Sales documents: queue a voucher sync for the outbox worker
+# (purchase side lives in inventory.signals)
+# =========================================================
+
+@receiver(post_save, sender=SalesInvoice)
+def sales_invoice_accounting(sender, instance, **kwargs):
+    enqueue_document('sales_invoice', instance.pk, instance.organization_id)
+
+
+@receiver(post_save, sender=SalesPayment)
+def sales_payment_accounting(sender, instance, **kwargs):
+    enqueue_document('sales_payment', instance.pk, instance.invoice.organization_id)
+
+
+@receiver(post_save, sender=SalesReturn)
+def sales_return_accounting(sender, instance, **kwargs):
+    enqueue_document('sales_return', instance.pk, instance.invoice.organization_id)
+
+
+@receiver(post_delete, sender=SalesInvoice)
+def sales_invoice_deleted(sender, instance, **kwargs):
+    enqueue_document('sales_invoice', instance.pk, instance.organization_id)
+
+
+@receiver(post_delete, sender=SalesPayment)
+def sales_payment_deleted(sender, instance, **kwargs):
+    enqueue_document('sales_payment', instance.pk, instance.invoice.organization_id)
+
+
+@receiver(post_delete, sender=SalesReturn)
+def sales_return_deleted(sender, instance, **kwargs):
+    enqueue_document('sales_return', instance.pk, instance.invoice.organization_id)
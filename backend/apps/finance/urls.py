@@ -6,7 +6,8 @@ from apps.finance.views.department_budget import DepartmentBudgetViewSet
 from apps.finance.views.vendor import VendorViewSet
 from apps.finance.views.bank_reconciliation import BankAccountViewSet, BankReconciliationView, BankTransactionViewSet
 from apps.finance.views.gst_reconciliation import GSTReconciliationView
-from apps.finance.views.reports import ProfitLossReportView, BalanceSheetView
+from apps.finance.views.voucher import VoucherBulkPostView
+from apps.finance.views.reports import ProfitLossReportView, BalanceSheetView, TrialBalanceView, PeriodCloseView, InventoryValuationView
 router = DefaultRouter()
 router.register("monthly-budgets", MonthlyBudgetViewSet, basename="monthly-budget")
 router.register("department-budgets", DepartmentBudgetViewSet, basename="department-budget")
@@ -21,6 +22,10 @@ urlpatterns = [
 path('monthly-budgets/<int:pk>/allocations/', DepartmentAllocationView.as_view()),
 path('bank-reconciliation/', BankReconciliationView.as_view(), name='bank-reconciliation'),
 path('gst-reconciliation/', GSTReconciliationView.as_view(), name='gst-reconciliation'),
+path('vouchers/bulk/', VoucherBulkPostView.as_view(), name='voucher-bulk-post'),
 path('profit-loss/', ProfitLossReportView.as_view(), name='profit-loss-report'),
 path('balance-sheet/', BalanceSheetView.as_view(), name='balance-sheet-report'),
+path('trial-balance/', TrialBalanceView.as_view(), name='trial-balance-report'),
+path('period-close/', PeriodCloseView.as_view(), name='period-close'),
+path('inventory-valuation/', InventoryValuationView.as_view(), name='inventory-valuation-report'),
 ]
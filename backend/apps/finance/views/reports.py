@@ -9,96 +9,184 @@ from apps.inventory.models import StockLedger, VendorInvoice
 from apps.finance.models import Voucher
 # Remove JournalEntry import if not available
 
+from datetime import date
 from decimal import Decimal
 from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
 from apps.sales.models import SalesInvoice
 from apps.inventory.models import VendorInvoice
-
-
-class ProfitLossReportView(APIView):
+from apps.inventory.costing import get_inventory_valuation
+from apps.finance.services.statements import get_statement, fiscal_year_range, comparison_range
+from apps.finance.services.period_close import get_period_close, close_books, month_end
+
+
+def _account_rows(rows):
+    return [
+        {
+            "account_id": r["account_id"],
+            "code": r["code"],
+            "name": r["name"],
+            "account_type": r["account_type"],
+            "balance": float(r["balance"]),
+        }
+        for r in rows
+    ]
+
+
+def _statement_period(params):
+    """
+    (start, end) from ?fiscal_year=2026, ?period=2026-10, or ?from= / ?to=
+    (?as_of= for balance sheet / trial balance). Raises ValueError.
+    """
+    if params.get('fiscal_year'):
+        return fiscal_year_range(int(params['fiscal_year']))
+
+    if params.get('period'):
+        year, month = (int(part) for part in params['period'].split('-'))
+        start = date(year, month, 1)
+        return start, month_end(start)
+
+    dates = []
+    for name in ('from', 'to', 'as_of'):
+        value = params.get(name)
+        parsed = parse_date(value) if value else None
+        if value and parsed is None:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+        dates.append(parsed)
+    start, end, as_of = dates
+    return start, end or as_of
+
+
+class StatementView(APIView):
+    """
+    Base for financial statements read from monthly account balances.
+    Takes a period (see _statement_period) and optionally
+    ?compare=previous_period|previous_year for a comparison column.
+    """
     permission_classes = [IsAuthenticated]
+    kind = None
+
+    def serialize(self, report):
+        raise NotImplementedError
 
     def get(self, request):
         org = request.user.organization
+        try:
+            start, end = _statement_period(request.query_params)
+            compare = request.query_params.get('compare')
+            if compare:
+                end = end or timezone.localdate()
+                compare_start, compare_end = comparison_range(start, end, compare)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = self.serialize(get_statement(self.kind, org, start, end))
+        data["from"] = start
+        data["to"] = end
+        if compare:
+            data["comparison"] = {
+                **self.serialize(get_statement(self.kind, org, compare_start, compare_end)),
+                "from": compare_start,
+                "to": compare_end,
+            }
+        return Response(data)
+
+
+class ProfitLossReportView(StatementView):
+    """Income and expense accounts from the posted general ledger"""
+    kind = 'profit_and_loss'
+
+    def serialize(self, report):
+        return {
+            "sales": float(report["total_income"]),
+            "expenses": float(report["total_expenses"]),
+            "net_profit": float(report["net_profit"]),
+            "income_accounts": _account_rows(report["income"]),
+            "expense_accounts": _account_rows(report["expenses"]),
+        }
+
+
+class BalanceSheetView(StatementView):
+    """Asset, liability and equity balances from the posted general ledger"""
+    kind = 'balance_sheet'
+
+    def serialize(self, report):
+        return {
+            "total_assets": float(report["total_assets"]),
+            "total_liabilities": float(report["total_liabilities"]),
+            "total_equity": float(report["total_equity"]),
+            "cash_balance": float(report["cash_balance"]),
+            "receivables": float(report["receivables"]),
+            "payables": float(report["payables"]),
+            "inventory_value": float(report["inventory_value"]),
+            "retained_earnings": float(report["retained_earnings"]),
+            "assets": _account_rows(report["assets"]),
+            "liabilities": _account_rows(report["liabilities"]),
+            "equity": _account_rows(report["equity"]),
+        }
+
+
+class TrialBalanceView(StatementView):
+    kind = 'trial_balance'
+
+    def serialize(self, report):
+        return {
+            "accounts": [
+                {**row, "debit": float(row["debit"]), "credit": float(row["credit"])}
+                for row in report["accounts"]
+            ],
+            "total_debit": float(report["total_debit"]),
+            "total_credit": float(report["total_credit"]),
+        }
+
+
+class PeriodCloseView(APIView):
+    """
+    GET: date the books are closed through.
+    POST {"closed_through": "YYYY-MM-DD" | null}: close up to that
+    month's end, or move the date back to reopen months.
+    """
+    permission_classes = [IsAuthenticated]
 
-        total_sales = SalesInvoice.objects.filter(
-            organization=org
-        ).aggregate(
-            total=Sum('grand_total')
-        )['total'] or Decimal('0')
-
-        total_expenses = VendorInvoice.objects.filter(
-            organization=org
-        ).aggregate(
-            total=Sum('total_amount')
-        )['total'] or Decimal('0')
-
-        net_profit = total_sales - total_expenses
-
-        return Response({
-            "sales": float(total_sales),
-            "expenses": float(total_expenses),
-            "net_profit": float(net_profit),
-        })
-
-
-from decimal import Decimal
-from django.db.models import Sum
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+    def get(self, request):
+        closed_through, _ = get_period_close(request.user.organization.pk)
+        return Response({"closed_through": closed_through})
+
+    def post(self, request):
+        value = request.data.get('closed_through')
+        through = parse_date(str(value)) if value else None
+        if value and through is None:
+            return Response(
+                {"error": "closed_through must be a date (YYYY-MM-DD)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-from apps.sales.models import SalesInvoice
-from apps.inventory.models import VendorInvoice
-from apps.inventory.models import Item
+        close = close_books(request.user.organization, through, request.user)
+        return Response({"closed_through": close.closed_through})
 
 
-class BalanceSheetView(APIView):
+class InventoryValuationView(APIView):
+    """Per-item inventory valuation from the cost layers"""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        org = request.user.organization
-
-        total_receivables = SalesInvoice.objects.filter(
-            organization=org
-        ).aggregate(
-            total=Sum('grand_total')
-        )['total'] or Decimal('0')
-
-        total_payables = VendorInvoice.objects.filter(
-            organization=org
-        ).aggregate(
-            total=Sum('total_amount')
-        )['total'] or Decimal('0')
-
-        inventory_value = StockLedger.objects.filter(
-            item__organization=org
-        ).aggregate(
-            total=Coalesce(
-                Sum(
-                    F('quantity') * F('item__standard_price'),
-                    output_field=DecimalField()
-                ),
-                Decimal('0')
-            )
-        )['total']
-
-        cash_balance = total_receivables - total_payables
-
-        total_assets = total_receivables + inventory_value
-        total_liabilities = total_payables
-        total_equity = total_assets - total_liabilities
+        valuation = get_inventory_valuation(request.user.organization)
 
         return Response({
-            "total_assets": float(total_assets),
-            "total_liabilities": float(total_liabilities),
-            "total_equity": float(total_equity),
-            "cash_balance": float(cash_balance),
-            "receivables": float(total_receivables),
-            "payables": float(total_payables),
-            "inventory_value": float(inventory_value),
-        })
\ No newline at end of file
+            "total_value": float(valuation['total_value']),
+            "items": [
+                {
+                    **row,
+                    "quantity": float(row['quantity']),
+                    "unit_cost": float(row['unit_cost']),
+                    "value": float(row['value']),
+                }
+                for row in valuation['items']
+            ],
+        })
@@ -9,3 +9,128 @@ class VoucherViewSet(ModelViewSet):
 
     def get_queryset(self):
         return Voucher.objects.all()
+
+
+from decimal import Decimal
+
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.finance.models import ChartOfAccount
+from apps.finance.services.posting import post_vouchers, VoucherBatchError
+from apps.finance.services.period_close import PeriodClosedError
+
+
+class VoucherBulkPostView(APIView):
+    """
+    POST {"vouchers": [{"idempotency_key", "voucher_type", "date",
+    "narration", "reference", "lines": [{"account" | "account_code",
+    "debit", "credit"}]}]}
+
+    Posts the whole batch in one transaction (bank / GST imports).
+    Keys already posted come back as duplicates instead of posting twice.
+    Client keys are stored as "api:<key>", apart from the
+    "<source_type>:<source_id>" keys of document vouchers.
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_VOUCHERS = 5000
+    KEY_PREFIX = "api:"
+    MAX_KEY_LENGTH = Voucher._meta.get_field('idempotency_key').max_length - len(KEY_PREFIX)
+
+    def post(self, request):
+        org = request.user.organization
+        rows = request.data.get('vouchers')
+
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "vouchers must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.MAX_VOUCHERS:
+            return Response(
+                {"error": f"At most {self.MAX_VOUCHERS} vouchers per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        by_id, by_code = {}, {}
+        for account_id, code in ChartOfAccount.objects.filter(
+            organization=org, is_active=True
+        ).values_list('id', 'code'):
+            by_id[account_id] = account_id
+            by_code[code] = account_id
+        voucher_types = dict(Voucher.VOUCHER_TYPES)
+
+        vouchers, errors = [], []
+        for index, row in enumerate(rows):
+            try:
+                lines = []
+                for line in row.get('lines') or []:
+                    if line.get('account') is not None:
+                        account_id = by_id.get(int(line['account']))
+                    else:
+                        account_id = by_code.get(str(line.get('account_code')))
+                    if account_id is None:
+                        raise ValueError(f"Unknown account {line.get('account') or line.get('account_code')}")
+                    lines.append((
+                        account_id,
+                        Decimal(str(line.get('debit') or 0)),
+                        Decimal(str(line.get('credit') or 0)),
+                    ))
+                if len(lines) < 2:
+                    raise ValueError("At least two lines are required")
+
+                voucher_type = row.get('voucher_type') or 'JOURNAL'
+                if voucher_type not in voucher_types:
+                    raise ValueError(f"Unknown voucher_type '{voucher_type}'")
+
+                day = None
+                if row.get('date'):
+                    day = parse_date(str(row['date']))
+                    if day is None:
+                        raise ValueError("date must be YYYY-MM-DD")
+
+                key = row.get('idempotency_key') or None
+                if key is not None:
+                    key = str(key)
+                    if len(key) > self.MAX_KEY_LENGTH:
+                        raise ValueError(f"idempotency_key must be at most {self.MAX_KEY_LENGTH} characters")
+                    key = self.KEY_PREFIX + key
+
+                vouchers.append({
+                    'voucher_type': voucher_type,
+                    'lines': lines,
+                    'narration': row.get('narration') or '',
+                    'day': day,
+                    'reference': row.get('reference') or '',
+                    'idempotency_key': key,
+                })
+            except ArithmeticError:
+                errors.append({"index": index, "error": "Debit and credit must be numbers"})
+            except (AttributeError, TypeError, ValueError) as e:
+                errors.append({"index": index, "error": str(e)})
+
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = post_vouchers(org.pk, vouchers, request.user)
+        except VoucherBatchError as e:
+            return Response(
+                {"errors": [{"index": i, "error": message} for i, message in e.errors]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except PeriodClosedError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "posted": sum(1 for _, created in results if created),
+            "duplicates": sum(1 for voucher, created in results if voucher and not created),
+            "vouchers": [
+                {
+                    "index": index,
+                    "id": voucher.id if voucher else None,
+                    "idempotency_key": rows[index].get('idempotency_key') if voucher else None,
+                    "created": created,
+                }
+                for index, (voucher, created) in enumerate(results)
+            ],
+        }, status=status.HTTP_201_CREATED)
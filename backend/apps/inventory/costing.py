@@ -0,0 +1,273 @@
+# apps/inventory/costing.py
+
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Item, StockLedger, ItemCost, CostLayer
+
+
+ZERO = Decimal('0')
+COST_PLACES = Decimal('0.0001')
+
+
+def _d(value):
+    """Ledger rows built in code may still hold int / float values"""
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class CostingEngine:
+    """
+    Applies ledger rows to per-item cost state.
+
+    FIFO items keep open receipt layers and draw issues from the oldest;
+    moving-average items carry one running average. Either way ItemCost
+    holds the current quantity and value, so valuation never reads the
+    ledger. Issues beyond what is on hand go out at the last known cost
+    and leave a negative balance that the next receipt clears first.
+    """
+
+    def __init__(self, items, costs, layers):
+        self.items = items              # item_id -> Item
+        self.costs = costs              # item_id -> ItemCost
+        self.layers = layers            # item_id -> deque[CostLayer] (open, oldest first)
+        self.new_layers = []
+        self.touched_layers = {}
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _empty_cost(item):
+        return ItemCost(
+            organization_id=item.organization_id,
+            item_id=item.pk,
+            quantity=ZERO,
+            value=ZERO,
+            unit_cost=_d(item.standard_price),
+        )
+
+    @classmethod
+    def load(cls, item_ids, lock=True):
+        """
+        Cost state for the given items. With `lock`, missing ItemCost
+        rows are inserted first (ON CONFLICT DO NOTHING) so that every
+        row exists to be locked FOR UPDATE: two writers receiving a new
+        item's first stock then queue on the same row instead of both
+        inserting one.
+        """
+        item_ids = set(item_ids)
+        items = Item.objects.in_bulk(item_ids)
+
+        costs_qs = ItemCost.objects.filter(item_id__in=item_ids)
+        if lock:
+            missing = item_ids - set(costs_qs.values_list('item_id', flat=True))
+            if missing:
+                ItemCost.objects.bulk_create(
+                    [cls._empty_cost(items[item_id]) for item_id in missing],
+                    batch_size=1000,
+                    ignore_conflicts=True,
+                )
+            costs_qs = costs_qs.select_for_update().order_by('item_id')
+        costs = {c.item_id: c for c in costs_qs}
+
+        for item_id in item_ids - set(costs):
+            costs[item_id] = cls._empty_cost(items[item_id])
+
+        layers = defaultdict(deque)
+        fifo_ids = [i for i, item in items.items() if item.costing_method == 'fifo']
+        for layer in CostLayer.objects.filter(
+            item_id__in=fifo_ids, remaining_qty__gt=0
+        ).order_by('id'):
+            layers[layer.item_id].append(layer)
+
+        return cls(items, costs, layers)
+
+    def save(self):
+        """Write back everything the applied entries changed"""
+        if self.new_layers:
+            CostLayer.objects.bulk_create(self.new_layers, batch_size=1000)
+        if self.touched_layers:
+            CostLayer.objects.bulk_update(
+                self.touched_layers.values(), ['remaining_qty'], batch_size=1000
+            )
+
+        new_costs = [c for c in self.costs.values() if c.pk is None]
+        old_costs = [c for c in self.costs.values() if c.pk is not None]
+        if new_costs:
+            ItemCost.objects.bulk_create(new_costs, batch_size=1000)
+        if old_costs:
+            # bulk_update does not run auto_now
+            now = timezone.now()
+            for cost in old_costs:
+                cost.updated_at = now
+            ItemCost.objects.bulk_update(
+                old_costs, ['quantity', 'value', 'unit_cost', 'updated_at'], batch_size=1000
+            )
+
+    # ------------------------------------------------------------------
+    def apply(self, entry):
+        """Apply one saved StockLedger row; returns the unit cost assigned to it"""
+        qty = _d(entry.signed_quantity)
+        if qty > 0:
+            return self.receive(entry, qty)
+        if qty < 0:
+            return self.issue(entry, -qty)
+        return entry.unit_cost
+
+    def receive(self, entry, qty):
+        cost = self.costs[entry.item_id]
+        unit_cost = entry.unit_cost
+        if unit_cost is None:
+            unit_cost = cost.unit_cost or self.items[entry.item_id].standard_price
+        unit_cost = _d(unit_cost)
+
+        # A negative balance is cleared first, at the incoming cost
+        deficit = min(qty, -cost.quantity) if cost.quantity < 0 else ZERO
+        layer_qty = qty - deficit
+
+        if self.items[entry.item_id].costing_method == 'fifo' and layer_qty > 0:
+            layer = CostLayer(
+                organization_id=cost.organization_id,
+                item_id=entry.item_id,
+                ledger_id=entry.pk,
+                quantity=layer_qty,
+                remaining_qty=layer_qty,
+                unit_cost=unit_cost,
+            )
+            self.new_layers.append(layer)
+            self.layers[entry.item_id].append(layer)
+
+        if cost.quantity <= 0:
+            cost.value = (cost.quantity + qty) * unit_cost
+        else:
+            cost.value += qty * unit_cost
+        cost.quantity += qty
+        self._reprice(cost, unit_cost)
+        return unit_cost
+
+    def issue(self, entry, qty):
+        cost = self.costs[entry.item_id]
+        fallback = _d(cost.unit_cost or self.items[entry.item_id].standard_price)
+
+        if self.items[entry.item_id].costing_method == 'fifo':
+            amount, left = ZERO, qty
+            layers = self.layers[entry.item_id]
+            while left > 0 and layers:
+                layer = layers[0]
+                take = min(left, layer.remaining_qty)
+                amount += take * layer.unit_cost
+                layer.remaining_qty -= take
+                left -= take
+                if layer.pk is not None:
+                    self.touched_layers[layer.pk] = layer
+                if layer.remaining_qty <= 0:
+                    layers.popleft()
+            amount += left * fallback
+        else:
+            amount = qty * fallback
+
+        cost.quantity -= qty
+        cost.value -= amount
+        self._reprice(cost, fallback)
+        return (amount / qty).quantize(COST_PLACES)
+
+    @staticmethod
+    def _reprice(cost, last_unit_cost):
+        if cost.quantity > 0:
+            cost.unit_cost = (cost.value / cost.quantity).quantize(COST_PLACES)
+        else:
+            cost.unit_cost = last_unit_cost
+            cost.value = cost.quantity * last_unit_cost
+
+
+@transaction.atomic
+def apply_cost_entries(entries):
+    """
+    Run saved StockLedger rows through the costing engine and store the
+    unit cost each one was booked at. Called for every ledger write
+    from inventory.services.apply_ledger_entries.
+    """
+    entries = [e for e in entries if e.quantity]
+    if not entries:
+        return
+
+    engine = CostingEngine.load({e.item_id for e in entries})
+    for entry in sorted(entries, key=lambda e: e.pk):
+        entry.unit_cost = engine.apply(entry)
+    engine.save()
+
+    StockLedger.objects.bulk_update(entries, ['unit_cost'], batch_size=1000)
+
+
+@transaction.atomic
+def rebuild_item_costs(organization=None, chunk_size=2000):
+    """
+    Replay the whole ledger in posting order and rebuild ItemCost and
+    CostLayer from scratch. Returns the number of items costed.
+    """
+    items = Item.objects.all()
+    if organization is not None:
+        items = items.filter(organization=organization)
+
+    ItemCost.objects.filter(item__in=items).delete()
+    CostLayer.objects.filter(item__in=items).delete()
+
+    ledger = StockLedger.objects.filter(item__in=items).order_by('id')
+    # Recorded receipt costs are kept; issue costs are recomputed
+    StockLedger.objects.filter(item__in=items).exclude(
+        transaction_type='IN'
+    ).update(unit_cost=None)
+
+    engine = CostingEngine.load(items.values_list('id', flat=True), lock=False)
+    batch = []
+    for entry in ledger.iterator(chunk_size=chunk_size):
+        if entry.quantity:
+            entry.unit_cost = engine.apply(entry)
+            batch.append(entry)
+        if len(batch) >= chunk_size:
+            StockLedger.objects.bulk_update(batch, ['unit_cost'])
+            batch = []
+    if batch:
+        StockLedger.objects.bulk_update(batch, ['unit_cost'])
+
+    engine.save()
+    return len(engine.costs)
+
+
+# ----------------------------------------------------------------------
+# Valuation
+# ----------------------------------------------------------------------
+def get_inventory_value(organization) -> Decimal:
+    """Total inventory value for an organization (one row per item, no ledger scan)"""
+    return ItemCost.objects.filter(organization=organization).aggregate(
+        total=Coalesce(
+            Sum('value'),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=20, decimal_places=4)
+        )
+    )['total']
+
+
+def get_inventory_valuation(organization):
+    """Per-item valuation rows plus the total"""
+    rows = list(
+        ItemCost.objects.filter(organization=organization).select_related('item').order_by('item__name')
+    )
+    return {
+        'total_value': sum((r.value for r in rows), Decimal('0')),
+        'items': [
+            {
+                'item_id': r.item_id,
+                'item_code': r.item.code,
+                'item_name': r.item.name,
+                'costing_method': r.item.costing_method,
+                'quantity': r.quantity,
+                'unit_cost': r.unit_cost,
+                'value': r.value,
+            }
+            for r in rows
+        ],
+    }
@@ -0,0 +1,74 @@
+# apps/inventory/locations.py
+
+import time
+
+from .models import StockLocation
+
+
+# Locations change rarely; each process keeps them for a few minutes.
+# Saves in this process drop the entry at once (see inventory.signals).
+LOCATION_CACHE_TTL = 300
+
+_cache = {}   # organization_id -> (expires_at, [StockLocation])
+
+
+class LocationNotConfigured(ValueError):
+    pass
+
+
+def get_locations(organization):
+    """Active stock locations of an organization (default ones first)"""
+    organization_id = getattr(organization, 'pk', organization)
+    cached = _cache.get(organization_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    locations = list(
+        StockLocation.objects.filter(
+            organization_id=organization_id, is_active=True
+        ).select_related('department').order_by('-is_default', 'name')
+    )
+    _cache[organization_id] = (time.monotonic() + LOCATION_CACHE_TTL, locations)
+    return locations
+
+
+def invalidate_locations(organization_id):
+    _cache.pop(organization_id, None)
+
+
+def get_default_location(organization, location_type='finished_goods'):
+    for location in get_locations(organization):
+        if location.location_type == location_type and location.is_default:
+            return location
+    raise LocationNotConfigured(
+        f"No default {location_type.replace('_', ' ')} location configured"
+    )
+
+
+def finished_goods_department_id(organization):
+    """Department that dispatches pick from when only one location is used"""
+    return get_default_location(organization, 'finished_goods').department_id
+
+
+def pickable_department_ids(organization):
+    """Finished-goods departments a multi-location dispatch may pick from"""
+    return list(dict.fromkeys(
+        location.department_id
+        for location in get_locations(organization)
+        if location.location_type == 'finished_goods' and location.is_pickable
+    ))
+
+
+def resolve_department_id(organization, value):
+    """
+    Department id from a request value: a department id, or the code of
+    one of the organization's locations (e.g. "FG"). Raises ValueError.
+    """
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+
+    for location in get_locations(organization):
+        if location.code.lower() == value.lower():
+            return location.department_id
+    raise ValueError(f"Unknown location '{value}'")
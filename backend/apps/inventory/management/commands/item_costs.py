@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.organizations.models import Organization
+from apps.inventory.costing import rebuild_item_costs
+
+
+class Command(BaseCommand):
+    help = "Rebuild ItemCost / CostLayer by replaying StockLedger (initial load or after data fixes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organization',
+            type=int,
+            help="Limit to one organization id (default: all)"
+        )
+
+    def handle(self, *args, **options):
+        organization = None
+        if options['organization']:
+            try:
+                organization = Organization.objects.get(id=options['organization'])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} not found")
+
+        count = rebuild_item_costs(organization)
+        self.stdout.write(self.style.SUCCESS(f"Costed {count} item(s)"))
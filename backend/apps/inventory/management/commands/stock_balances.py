@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.organizations.models import Organization
+from apps.inventory.services import rebuild_stock_balances, verify_stock_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild or verify the StockBalance table against StockLedger and StockReservation"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['rebuild', 'verify'],
+            help="rebuild: recompute balances from the ledger and active reservations | verify: report drift only"
+        )
+        parser.add_argument(
+            '--organization',
+            type=int,
+            help="Limit to one organization id (default: all)"
+        )
+
+    def handle(self, *args, **options):
+        organization = None
+        if options['organization']:
+            try:
+                organization = Organization.objects.get(id=options['organization'])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} not found")
+
+        if options['action'] == 'rebuild':
+            count = rebuild_stock_balances(organization)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} stock balance row(s)"))
+            return
+
+        mismatches = verify_stock_balances(organization)
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Stock balances match the ledger and reservations"))
+            return
+
+        sources = {'quantity': 'ledger', 'reserved': 'reservations'}
+        for item_id, department_id, field, expected, actual in mismatches:
+            self.stdout.write(
+                f"Item {item_id} / Dept {department_id or '-'} {field}: "
+                f"{sources[field]}={expected} balance={actual}"
+            )
+        raise CommandError(f"{len(mismatches)} stock balance row(s) out of sync")
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.organizations.models import Organization
+from apps.inventory.services import take_stock_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write end-of-day StockSnapshot rows used by Item.stock_as_of (run daily from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            help="Snapshot date YYYY-MM-DD, before today (default: yesterday)"
+        )
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=date.fromisoformat,
+            help="Backfill every period from this date up to --date"
+        )
+        parser.add_argument(
+            '--period',
+            choices=['daily', 'monthly'],
+            default='daily',
+            help="Backfill step: every day, or the last day of each month (default: daily)"
+        )
+        parser.add_argument(
+            '--organization',
+            type=int,
+            help="Limit to one organization id (default: all)"
+        )
+
+    def snapshot_dates(self, start, end, period):
+        day = start
+        while day <= end:
+            next_day = day + timedelta(days=1)
+            if period == 'daily' or next_day.month != day.month or day == end:
+                yield day
+            day = next_day
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        end = options['date'] or today - timedelta(days=1)
+        if end >= today:
+            # Rows posted later that day would never be counted: reads
+            # start from the snapshot at the end of its date
+            raise CommandError("--date must be before today (only finished days can be snapshotted)")
+        start = options['date_from'] or end
+        if start > end:
+            raise CommandError("--from must not be after --date")
+
+        organizations = Organization.objects.all()
+        if options['organization']:
+            organizations = organizations.filter(id=options['organization'])
+            if not organizations.exists():
+                raise CommandError(f"Organization {options['organization']} not found")
+
+        # Oldest first: each snapshot builds on the previous one
+        for day in self.snapshot_dates(start, end, options['period']):
+            for organization in organizations:
+                count = take_stock_snapshot(organization, day)
+                self.stdout.write(f"{day} org {organization.id}: {count} row(s)")
+
+        self.stdout.write(self.style.SUCCESS("Stock snapshots written"))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, When
+
+
+def backfill_stock_balances(apps, schema_editor):
+    StockLedger = apps.get_model('inventory', 'StockLedger')
+    StockBalance = apps.get_model('inventory', 'StockBalance')
+
+    totals = StockLedger.objects.values('item_id', 'item__organization_id', 'department_id').annotate(
+        total=Sum(
+            Case(
+                When(transaction_type='OUT', then=-F('quantity')),
+                default=F('quantity'),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )
+        )
+    )
+
+    StockBalance.objects.bulk_create(
+        [
+            StockBalance(
+                organization_id=row['item__organization_id'],
+                item_id=row['item_id'],
+                department_id=row['department_id'],
+                quantity=row['total'] or 0,
+            )
+            for row in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps_hr', '0029_merge_20260110_1302'),
+        ('inventory', '0026_alter_machine_code'),
+        ('organizations', '0020_alter_organizationuser_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_balances', to='apps_hr.department')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_balances', to='inventory.item')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_balances', to='organizations.organization')),
+            ],
+            options={
+                'verbose_name': 'Stock Balance',
+                'verbose_name_plural': 'Stock Balances',
+                'indexes': [models.Index(fields=['organization', 'item'], name='inventory_s_organiz_884375_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'department'), name='unique_stock_balance_item_department', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(backfill_stock_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps_hr', '0029_merge_20260110_1302'),
+        ('inventory', '0027_stockbalance'),
+        ('organizations', '0020_alter_organizationuser_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField()),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='apps_hr.department')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='inventory.item')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='organizations.organization')),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'indexes': [models.Index(fields=['item', 'snapshot_date'], name='inventory_s_item_id_d684a6_idx'), models.Index(fields=['organization', 'snapshot_date'], name='inventory_s_organiz_2c071b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'department', 'snapshot_date'), name='unique_stock_snapshot_item_department_date', nulls_distinct=False)],
+            },
+        ),
+    ]
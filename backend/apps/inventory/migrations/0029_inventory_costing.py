@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-17 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0028_stocksnapshot'),
+        ('organizations', '0020_alter_organizationuser_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='costing_method',
+            field=models.CharField(choices=[('fifo', 'FIFO'), ('average', 'Moving Average')], default='fifo', help_text='How issues are costed for inventory valuation', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='stockledger',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True),
+        ),
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('remaining_qty', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='inventory.item')),
+                ('ledger', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cost_layers', to='inventory.stockledger')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='organizations.organization')),
+            ],
+            options={
+                'verbose_name': 'Cost Layer',
+                'verbose_name_plural': 'Cost Layers',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('remaining_qty__gt', 0)), fields=['item', 'id'], name='cost_layer_open_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemCost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('unit_cost', models.DecimalField(decimal_places=4, default=0, help_text='Average cost of stock on hand (last cost when none is on hand)', max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cost', to='inventory.item')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='item_costs', to='organizations.organization')),
+            ],
+            options={
+                'verbose_name': 'Item Cost',
+                'verbose_name_plural': 'Item Costs',
+                'indexes': [models.Index(fields=['organization', 'item'], name='inventory_i_organiz_b7a843_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-17 19:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+LEGACY_FINISHED_GOODS_DEPARTMENT_ID = 13
+
+
+def create_legacy_fg_location(apps, schema_editor):
+    """Dispatch used department 13 for every organization; keep it as its owner's FG default"""
+    Department = apps.get_model('apps_hr', 'Department')
+    StockLocation = apps.get_model('inventory', 'StockLocation')
+
+    department = Department.objects.filter(id=LEGACY_FINISHED_GOODS_DEPARTMENT_ID).first()
+    if department is None:
+        return
+
+    StockLocation.objects.get_or_create(
+        organization_id=department.organization_id,
+        code='FG',
+        defaults={
+            'name': department.name,
+            'department': department,
+            'location_type': 'finished_goods',
+            'is_default': True,
+        }
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps_hr', '0029_merge_20260110_1302'),
+        ('inventory', '0030_stock_reservation'),
+        ('organizations', '0020_alter_organizationuser_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispatch',
+            name='picking_mode',
+            field=models.CharField(choices=[('single', 'Default location'), ('multi', 'Multiple locations')], default='single', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='StockLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150)),
+                ('code', models.CharField(help_text='Short code usable in place of a department id, e.g. FG', max_length=30)),
+                ('location_type', models.CharField(choices=[('store', 'Store'), ('wip', 'Work in Progress'), ('finished_goods', 'Finished Goods')], default='store', max_length=20)),
+                ('is_default', models.BooleanField(default=False, help_text='Default location of its type for the organization')),
+                ('is_pickable', models.BooleanField(default=True, help_text='Dispatches may pick stock from here')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_locations', to='apps_hr.department')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_locations', to='organizations.organization')),
+            ],
+            options={
+                'verbose_name': 'Stock Location',
+                'verbose_name_plural': 'Stock Locations',
+                'ordering': ['name'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('organization', 'location_type'), name='unique_default_stock_location_per_type')],
+                'unique_together': {('organization', 'code')},
+            },
+        ),
+        migrations.RunPython(create_legacy_fg_location, migrations.RunPython.noop),
+    ]
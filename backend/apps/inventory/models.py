@@ -1,57 +1,101 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.db.models import Sum,Case, When, Value, DecimalField
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Coalesce, Length
 from decimal import Decimal
 from apps.finance.models.vendor import Vendor
 from apps.organizations.models import Organization
 User = settings.AUTH_USER_MODEL
 from django.db.models import F
 
+def _last_used_number(prefix, org_id, model_class):
+    """
+    Highest sequence already issued under this year's PREFIX/ORG/YEAR/
+    prefix, e.g. 12 for PO/5/2026/0012. Seeds a new DocumentSequence so
+    numbering carries on. Numbers are unique across organizations and
+    older code wrote some under another organization's prefix (every
+    debit note was DN/11/2026/...), so all rows with the prefix count,
+    not just this organization's.
+    """
+    # Map model to its number field
+    number_field = {
+        'GateEntry': 'gate_entry_number',
+        'PurchaseOrder': 'po_number',
+        'GRN': 'grn_number',
+        'Dispatch': 'dc_number',
+        'PurchaseReturn': 'debit_note_number',
+    }[model_class.__name__]
+
+    number_prefix = f"{prefix}/{org_id}/{timezone.localdate().year}/"
+
+    # Longest first, then highest: numeric order for the zero-padded suffix
+    last_number = model_class.objects.filter(
+        **{f"{number_field}__startswith": number_prefix}
+    ).order_by(
+        Length(number_field).desc(), f"-{number_field}"
+    ).values_list(number_field, flat=True).first()
+
+    try:
+        return int(last_number[len(number_prefix):])
+    except (TypeError, ValueError):
+        return 0
+
+
 def get_next_number(prefix, org_id, model_class):
     """
-    Generate next sequential number like: DC/11/2026/0001
+    Next number from the organization's DocumentSequence for `prefix`,
+    like DC/11/2026/0001. Call inside the transaction that saves the
+    document so the number is released again if the save fails.
     """
-    current_year = timezone.now().year
-    model_name = model_class.__name__
-
-    # Define date filter based on model
-    if model_name == 'GateEntry':
-        date_filter = {'entry_time__year': current_year}
-    elif model_name == 'GRN':
-        date_filter = {'received_date__year': current_year}
-    else:
-        date_filter = {'created_at__year': current_year}
-
-    # Get the last record for this organization and year
-    last_entry = model_class.objects.filter(
-        organization_id=org_id,
-        **date_filter
-    ).order_by('-id').first()
-
-    seq = 1
-    if last_entry:
-        # Map model to its number field
-        number_field_map = {
-            'GateEntry': 'gate_entry_number',
-            'PurchaseOrder': 'po_number',
-            'GRN': 'grn_number',
-            'Dispatch': 'dc_number',          # ← Added for Dispatch
-        }
-        number_field = getattr(last_entry, number_field_map.get(model_name, ''), '')
-
-        if number_field:
-            try:
-                # Extract sequence from format: PREFIX/ORG/YEAR/XXXX
-                parts = number_field.rsplit('/', 1)
-                if len(parts) == 2:
-                    seq = int(parts[1]) + 1
-            except (ValueError, IndexError):
-                seq = 1
-
-    return f"{prefix}/{org_id}/{current_year}/{seq:04d}"
+    from apps.organizations.sequences import next_document_number
+
+    return next_document_number(
+        org_id, prefix, seed=lambda: _last_used_number(prefix, org_id, model_class)
+    )
+
+class ItemQuerySet(models.QuerySet):
+    def with_stock(self, department_id=None):
+        """
+        Annotate on_hand, reserved, available (on hand less reservations)
+        and on_hand_value from StockBalance with grouped subqueries, so
+        filtering / ordering / paging by stock stays in SQL. Limit to one
+        department with `department_id`.
+        """
+        balances = StockBalance.objects.filter(item=models.OuterRef('pk'))
+        if department_id is not None:
+            balances = balances.filter(department_id=department_id)
+
+        decimal = DecimalField(max_digits=14, decimal_places=2)
+        on_hand = Coalesce(
+            models.Subquery(
+                balances.values('item').annotate(total=Sum('quantity')).values('total'),
+                output_field=decimal
+            ),
+            Value(Decimal('0.00')),
+            output_field=decimal
+        )
+        reserved = Coalesce(
+            models.Subquery(
+                balances.values('item').annotate(total=Sum('reserved')).values('total'),
+                output_field=decimal
+            ),
+            Value(Decimal('0.00')),
+            output_field=decimal
+        )
+        return self.annotate(on_hand=on_hand, reserved=reserved).annotate(
+            available=Case(
+                When(on_hand__gt=F('reserved'), then=F('on_hand') - F('reserved')),
+                default=Value(Decimal('0.00')),
+                output_field=decimal
+            ),
+            on_hand_value=models.ExpressionWrapper(
+                F('on_hand') * F('standard_price'),
+                output_field=DecimalField(max_digits=20, decimal_places=2)
+            ),
+        )
+
 
 class Item(models.Model):
     CATEGORY_CHOICES = [
@@ -63,6 +107,10 @@ class Item(models.Model):
         ('purchase', 'Purchase Item'),
         ('production', 'Production Item'),
     ]
+    COSTING_METHOD_CHOICES = [
+        ('fifo', 'FIFO'),
+        ('average', 'Moving Average'),
+    ]
     
     # NEW: Organization scoping (critical for multi-tenant)
     organization = models.ForeignKey(
@@ -84,8 +132,17 @@ class Item(models.Model):
     uom = models.CharField(max_length=20, help_text="Unit of Measurement (e.g. Kg, Nos, Liter)")
     vendors = models.ManyToManyField('finance.Vendor', blank=True, related_name='items')  # adjust app name if needed
     standard_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    costing_method = models.CharField(
+        max_length=10,
+        choices=COSTING_METHOD_CHOICES,
+        default='fifo',
+        help_text="How issues are costed for inventory valuation"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ItemQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
         verbose_name = "Item"
@@ -101,25 +158,10 @@ class Item(models.Model):
         ).aggregate(total=Sum('received_qty'))['total']
         return Decimal(total or '0.00')
     def get_department_stock(self, department_id=None):
-        from .models import StockLedger
-
-        qs = StockLedger.objects.filter(item=self)
-
-        if department_id:
-            qs = qs.filter(department_id=department_id)
-
-        stock = qs.aggregate(
-            total=Sum(
-                Case(
-                    When(transaction_type='IN', then='quantity'),
-                    When(transaction_type='OUT', then=-1 * F('quantity')),
-                    default=Value(0),
-                    output_field=DecimalField()
-                )
-            )
-        )['total']
+        """On-hand stock from StockBalance (single department, or all when None)"""
+        from .services import get_stock_balance
 
-        return Decimal(stock or 0)
+        return get_stock_balance(self, department_id)
 
     def is_production_item(self):
         return self.item_type == 'production'
@@ -132,36 +174,12 @@ class Item(models.Model):
     @property
     def stock_value(self) -> Decimal:
         return self.current_stock * self.standard_price
-    def stock_as_of(self, date):
-        from .models import GRNItem
-        total = GRNItem.objects.filter(
-            item=self,
-            grn__status='approved',
-            grn__received_date__lte=date
-        ).aggregate(total=Sum('received_qty'))['total']
-        return Decimal(total or '0.00')
-    def get_department_stock(self, department_id=None):
-        
-        from .models import StockLedger
+    def stock_as_of(self, date, department_id=None):
+        """Stock at the end of `date`: nearest StockSnapshot + ledger since then"""
+        from .services import get_stock_as_of
 
-        qs = StockLedger.objects.filter(item=self)
+        return get_stock_as_of([self.pk], date, department_id).get(self.pk, Decimal('0.00'))
 
-        if department_id:
-            qs = qs.filter(department_id=department_id)
-
-        stock = qs.aggregate(
-            total=Sum(
-                Case(
-                    When(transaction_type='IN', then='quantity'),
-                    When(transaction_type='OUT', then=-1 * F('quantity')),
-                    default=Value(0),
-                    output_field=DecimalField()
-                )
-            )
-        )['total']
-
-        return Decimal(stock or 0)
-    
 class ItemDependency(models.Model):
     """
     Defines BOM (Bill of Materials)
@@ -213,9 +231,10 @@ class PurchaseOrder(models.Model):
     tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def save(self, *args, **kwargs):
-        if not self.po_number:
-            self.po_number = get_next_number("PO", self.organization_id, PurchaseOrder)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.po_number:
+                self.po_number = get_next_number("PO", self.organization_id, PurchaseOrder)
+            super().save(*args, **kwargs)
 
     def update_totals(self):
         """Calculate and update subtotal, tax, and grand total"""
@@ -276,9 +295,10 @@ class GateEntry(models.Model):
     entry_time = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        if not self.gate_entry_number:
-            self.gate_entry_number = get_next_number("GE", self.organization_id, GateEntry)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.gate_entry_number:
+                self.gate_entry_number = get_next_number("GE", self.organization_id, GateEntry)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.vehicle_number} | {self.po.po_number}"
@@ -355,9 +375,10 @@ class GRN(models.Model):
     )
 
     def save(self, *args, **kwargs):
-        if not self.grn_number:
-            self.grn_number = get_next_number("GRN", self.organization_id, GRN)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.grn_number:
+                self.grn_number = get_next_number("GRN", self.organization_id, GRN)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.grn_number
@@ -490,9 +511,10 @@ class PurchaseReturn(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        if not self.debit_note_number:
-            self.debit_note_number = get_next_number("DN", self.organization_id, PurchaseReturn)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.debit_note_number:
+                self.debit_note_number = get_next_number("DN", self.organization_id, PurchaseReturn)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.debit_note_number
@@ -525,6 +547,9 @@ class StockLedger(models.Model):
     blank=True
     )
     reference = models.CharField(max_length=100, blank=True)
+    # Receipts: purchase cost per unit (leave empty to use the current cost).
+    # Issues: filled in by the costing engine with the cost actually drawn.
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
@@ -537,6 +562,281 @@ class StockLedger(models.Model):
     def __str__(self):
         return f"{self.item.code} | {self.quantity:+.2f} | {self.transaction_type}"
 
+    @property
+    def signed_quantity(self) -> Decimal:
+        """IN and ADJ add to stock (ADJ carries its own sign), OUT removes it."""
+        if self.transaction_type == 'OUT':
+            return -self.quantity
+        return self.quantity
+
+    def save(self, *args, **kwargs):
+        """Keep StockBalance in step with every new ledger row"""
+        from .services import apply_ledger_entries   # late import to avoid circular import
+
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                apply_ledger_entries([self])
+
+
+# ========================= STOCK BALANCE =========================
+class StockBalance(models.Model):
+    """
+    Materialised on-hand quantity per item / department.
+    Maintained from StockLedger inserts (see inventory.services);
+    rebuild or verify with `manage.py stock_balances`.
+    """
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='stock_balances',
+        null=True,
+        blank=True
+    )
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='stock_balances')
+    department = models.ForeignKey(
+        'apps_hr.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='stock_balances'
+    )
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Held by active StockReservations; available = quantity - reserved
+    reserved = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Stock Balance"
+        verbose_name_plural = "Stock Balances"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['item', 'department'],
+                name='unique_stock_balance_item_department',
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['organization', 'item']),
+        ]
+
+    def __str__(self):
+        dept = self.department.name if self.department else "Unassigned"
+        return f"{self.item.code} @ {dept}: {self.quantity}"
+
+
+# ========================= STOCK LOCATION =========================
+class StockLocation(models.Model):
+    """
+    A named stock location for an organization. Stock itself is booked
+    against the location's department (StockLedger / StockBalance);
+    locations say which departments act as stores, WIP or finished goods,
+    and which one is the default of each kind (see inventory.locations).
+    """
+    LOCATION_TYPE_CHOICES = [
+        ('store', 'Store'),
+        ('wip', 'Work in Progress'),
+        ('finished_goods', 'Finished Goods'),
+    ]
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='stock_locations'
+    )
+    name = models.CharField(max_length=150)
+    code = models.CharField(max_length=30, help_text="Short code usable in place of a department id, e.g. FG")
+    department = models.ForeignKey(
+        'apps_hr.Department',
+        on_delete=models.PROTECT,
+        related_name='stock_locations'
+    )
+    location_type = models.CharField(max_length=20, choices=LOCATION_TYPE_CHOICES, default='store')
+    is_default = models.BooleanField(default=False, help_text="Default location of its type for the organization")
+    is_pickable = models.BooleanField(default=True, help_text="Dispatches may pick stock from here")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Stock Location"
+        verbose_name_plural = "Stock Locations"
+        unique_together = ('organization', 'code')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization', 'location_type'],
+                condition=models.Q(is_default=True),
+                name='unique_default_stock_location_per_type',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.code})"
+
+
+# ========================= STOCK RESERVATION =========================
+class StockReservation(models.Model):
+    """
+    Stock held for a document (e.g. a draft dispatch) until it is
+    consumed into an OUT ledger row or released. Active reservations
+    are mirrored in StockBalance.reserved under the balance row lock.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('consumed', 'Consumed'),
+        ('released', 'Released'),
+    ]
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='stock_reservations',
+        null=True,
+        blank=True
+    )
+    item = models.ForeignKey(Item, on_delete=models.PROTECT, related_name='reservations')
+    department = models.ForeignKey(
+        'apps_hr.Department',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='stock_reservations'
+    )
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    reference = models.CharField(max_length=100, help_text="Document holding the stock, e.g. DC-<dc number>")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Stock Reservation"
+        verbose_name_plural = "Stock Reservations"
+        indexes = [
+            models.Index(fields=['reference', 'status']),
+            models.Index(fields=['item', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.reference}: {self.item.code} x {self.quantity} ({self.status})"
+
+
+# ========================= INVENTORY COSTING =========================
+class ItemCost(models.Model):
+    """
+    Running quantity and value per item, maintained by the costing
+    engine (inventory.costing) as ledger rows arrive. Valuation is a
+    sum over these rows rather than a scan of the ledger.
+    """
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='item_costs',
+        null=True,
+        blank=True
+    )
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, related_name='cost')
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    unit_cost = models.DecimalField(
+        max_digits=14, decimal_places=4, default=0,
+        help_text="Average cost of stock on hand (last cost when none is on hand)"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Item Cost"
+        verbose_name_plural = "Item Costs"
+        indexes = [
+            models.Index(fields=['organization', 'item']),
+        ]
+
+    def __str__(self):
+        return f"{self.item.code}: {self.quantity} @ {self.unit_cost}"
+
+
+class CostLayer(models.Model):
+    """FIFO receipt layer; remaining_qty is drawn down oldest first"""
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='cost_layers',
+        null=True,
+        blank=True
+    )
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='cost_layers')
+    ledger = models.ForeignKey(
+        StockLedger,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='cost_layers'
+    )
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    remaining_qty = models.DecimalField(max_digits=12, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Cost Layer"
+        verbose_name_plural = "Cost Layers"
+        indexes = [
+            models.Index(
+                fields=['item', 'id'],
+                name='cost_layer_open_idx',
+                condition=models.Q(remaining_qty__gt=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.item.code}: {self.remaining_qty}/{self.quantity} @ {self.unit_cost}"
+
+
+# ========================= STOCK SNAPSHOT =========================
+class StockSnapshot(models.Model):
+    """
+    On-hand quantity per item / department at the end of a day.
+    Written by `manage.py stock_snapshots`; historical stock is the
+    nearest snapshot plus the ledger movements after it.
+    """
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots'
+    )
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='stock_snapshots')
+    department = models.ForeignKey(
+        'apps_hr.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='stock_snapshots'
+    )
+    snapshot_date = models.DateField()
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Stock Snapshot"
+        verbose_name_plural = "Stock Snapshots"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['item', 'department', 'snapshot_date'],
+                name='unique_stock_snapshot_item_department_date',
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['item', 'snapshot_date']),
+            models.Index(fields=['organization', 'snapshot_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.item.code} @ {self.snapshot_date}: {self.quantity}"
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
@@ -806,13 +1106,22 @@ class Dispatch(models.Model):
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
 
+    # single: pick only from the default finished-goods location
+    # multi:  split lines across pickable finished-goods locations
+    picking_mode = models.CharField(
+        max_length=10,
+        choices=[('single', 'Default location'), ('multi', 'Multiple locations')],
+        default='single'
+    )
+
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
 
     def save(self, *args, **kwargs):
-        if not self.dc_number:
-            self.dc_number = get_next_number("DC", self.organization_id, Dispatch)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.dc_number:
+                self.dc_number = get_next_number("DC", self.organization_id, Dispatch)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.dc_number
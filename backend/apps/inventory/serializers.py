@@ -90,6 +90,8 @@ class ItemSerializer(serializers.ModelSerializer):
             'bom_components',
         ]
 
+    # Atomic so a rejected component (e.g. a BOM loop) leaves nothing half-saved
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context["request"]
         
@@ -107,6 +109,7 @@ class ItemSerializer(serializers.ModelSerializer):
         
         return item
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         components_data = validated_data.pop('components', None)
         
@@ -124,6 +127,8 @@ class ItemSerializer(serializers.ModelSerializer):
 
     def _create_components(self, parent_item, components_data):
         """Helper to create ItemDependency records"""
+        from apps.production.bom import BOMCycleError, check_bom_cycle   # late import to avoid circular import
+
         for comp in components_data:
             child_id = comp.get('child_item')
             quantity = comp.get('quantity')
@@ -136,7 +141,10 @@ class ItemSerializer(serializers.ModelSerializer):
                     id=child_id,
                     organization=parent_item.organization
                 )
-                
+                check_bom_cycle(
+                    parent_item.organization_id, parent_item.id, child_item.id, "dependency"
+                )
+
                 ItemDependency.objects.create(
                     parent_item=parent_item,
                     child_item=child_item,
@@ -146,6 +154,8 @@ class ItemSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     f"Component item with ID {child_id} not found or belongs to different organization."
                 )
+            except BOMCycleError as e:
+                raise serializers.ValidationError({"components_write": str(e)})
             except Exception as e:
                 raise serializers.ValidationError(f"Error adding component: {str(e)}")
             
@@ -982,23 +992,7 @@ class PurchaseReturnItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = PurchaseReturnItem
         fields = ['item', 'item_name', 'qty', 'rate', 'tax']
-from django.db.models import Max
 
-def generate_debit_note_number():
-    last_number = PurchaseReturn.objects.aggregate(
-        max_num=Max('debit_note_number')
-    )['max_num']
-
-    if not last_number:
-        next_num = 1
-    else:
-        try:
-            last_num = int(last_number.split('/')[-1])
-            next_num = last_num + 1
-        except:
-            next_num = 1
-
-    return f"DN/11/2026/{str(next_num).zfill(4)}"
 
 class PurchaseReturnSerializer(serializers.ModelSerializer):
     items = PurchaseReturnItemSerializer(many=True)
@@ -1017,32 +1011,22 @@ class PurchaseReturnSerializer(serializers.ModelSerializer):
             'taxable_value', 'cgst', 'sgst', 'igst', 'total_amount'
         ]
 
-    from django.db import IntegrityError
-
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         request = self.context['request']
         org = request.user.organization
         invoice = validated_data.pop('invoice')
 
-        for _ in range(5):  # retry max 5 times
-            try:
-                purchase_return = PurchaseReturn.objects.create(
-                    organization=org,
-                    vendor=invoice.vendor,
-                    invoice=invoice,
-                    return_date=validated_data.get('return_date'),
-                    reason=validated_data.get('reason', ''),
-                    created_by=request.user,
-                    debit_note_number=generate_debit_note_number()
-                )
-                break
-            except IntegrityError:
-                continue
-        else:
-            raise Exception("Unable to generate unique debit note number")
-
-    # continue your logic...
+        # The debit note number comes from the organization's DN sequence
+        purchase_return = PurchaseReturn.objects.create(
+            organization=org,
+            vendor=invoice.vendor,
+            invoice=invoice,
+            return_date=validated_data.get('return_date'),
+            reason=validated_data.get('reason', ''),
+            created_by=request.user,
+        )
 
         taxable = Decimal('0')
         cgst_total = Decimal('0')
@@ -1085,4 +1069,37 @@ class PurchaseReturnSerializer(serializers.ModelSerializer):
         purchase_return.total_amount = total
         purchase_return.save()
 
-        return purchase_return
\ No newline at end of file
+        return purchase_return
+
+# ========================= STOCK LOCATION =========================
+from .models import StockLocation
+
+
+class StockLocationSerializer(serializers.ModelSerializer):
+    department_name = serializers.CharField(source='department.name', read_only=True)
+
+    class Meta:
+        model = StockLocation
+        fields = [
+            'id', 'name', 'code', 'department', 'department_name',
+            'location_type', 'is_default', 'is_pickable', 'is_active', 'created_at',
+        ]
+        read_only_fields = ['id', 'created_at']
+
+    def validate_department(self, department):
+        organization = self.context['request'].user.organization
+        if department.organization_id != organization.id:
+            raise serializers.ValidationError("Department belongs to another organization")
+        return department
+
+    def validate(self, attrs):
+        organization = self.context['request'].user.organization
+        code = attrs.get('code', getattr(self.instance, 'code', None))
+        if code and code.strip().isdigit():
+            raise serializers.ValidationError({"code": "Code must not be a number (numbers are read as department ids)"})
+        qs = StockLocation.objects.filter(organization=organization, code__iexact=code)
+        if self.instance:
+            qs = qs.exclude(pk=self.instance.pk)
+        if qs.exists():
+            raise serializers.ValidationError({"code": "A location with this code already exists"})
+        return attrs
@@ -0,0 +1,827 @@
+# apps/inventory/services.py
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, Count, Max, Q, Case, When, F, Value, DecimalField, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
+
+from apps.organizations.models import Organization
+from apps.finance.outbox import enqueue_stock_entries
+
+from .costing import apply_cost_entries
+from .models import Item, ItemCost, StockLedger, StockBalance, StockSnapshot, StockReservation, GRN, GRNItem, PurchaseOrder, PurchaseOrderItem
+
+
+# ========================= STOCK BALANCE =========================
+
+# Sent after StockBalance has been updated for a batch of ledger rows.
+# Receivers get `item_ids` (set); bulk writers bypass post_save, this doesn't.
+stock_changed = Signal()
+
+
+def signed_quantity_expression():
+    """SQL equivalent of StockLedger.signed_quantity (IN + ADJ - OUT)"""
+    return Case(
+        When(transaction_type='OUT', then=-F('quantity')),
+        default=F('quantity'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def _lock_balances(keys, item_orgs):
+    """
+    Return {(item_id, department_id): StockBalance} for the given keys,
+    locked with SELECT ... FOR UPDATE. Missing rows are created first.
+    Only the exact rows are locked, always in pk order, so postings on
+    other departments don't wait and concurrent batches can't deadlock.
+    """
+    exact = Q()
+    for item_id, department_id in keys:
+        exact |= Q(item_id=item_id, department_id=department_id)
+
+    def fetch():
+        rows = StockBalance.objects.select_for_update().filter(exact).order_by('pk')
+        return {(b.item_id, b.department_id): b for b in rows}
+
+    balances = fetch()
+    missing = [key for key in keys if key not in balances]
+    if missing:
+        StockBalance.objects.bulk_create(
+            [
+                StockBalance(
+                    organization_id=item_orgs.get(item_id),
+                    item_id=item_id,
+                    department_id=department_id,
+                    quantity=Decimal('0'),
+                )
+                for item_id, department_id in missing
+            ],
+            ignore_conflicts=True,   # another transaction may have created it
+        )
+        balances = fetch()
+
+    return balances
+
+
+@transaction.atomic
+def apply_ledger_entries(entries):
+    """
+    Add the movement of already-saved StockLedger rows to StockBalance,
+    the item cost layers and the general ledger. Deltas are grouped per (item, department)
+    so a batch touches each balance row once.
+    """
+    deltas = defaultdict(Decimal)
+    for entry in entries:
+        deltas[(entry.item_id, entry.department_id)] += entry.signed_quantity
+
+    if not deltas:
+        return {}
+
+    item_orgs = dict(
+        Item.objects.filter(
+            id__in={item_id for item_id, _ in deltas}
+        ).values_list('id', 'organization_id')
+    )
+
+    now = timezone.now()
+    balances = _lock_balances(set(deltas), item_orgs)
+    for key, delta in deltas.items():
+        balances[key].quantity += delta
+        balances[key].updated_at = now
+
+    StockBalance.objects.bulk_update(balances.values(), ['quantity', 'updated_at'])
+    apply_cost_entries(entries)
+    enqueue_stock_entries(entries, item_orgs)
+    invalidate_inventory_dashboard(set(item_orgs.values()))
+    stock_changed.send(sender=StockLedger, item_ids={item_id for item_id, _ in deltas})
+    return balances
+
+
+@transaction.atomic
+def post_ledger_entries(entries):
+    """
+    Insert unsaved StockLedger rows with one bulk_create and update
+    StockBalance for all of them. bulk_create skips StockLedger.save(),
+    so batch writers must go through here.
+    """
+    entries = StockLedger.objects.bulk_create(entries)
+    apply_ledger_entries(entries)
+    return entries
+
+
+# ========================= DASHBOARD =========================
+
+LOW_STOCK_THRESHOLD = Decimal('5.00')
+
+# Seconds a dashboard stays cached; ledger writes clear it earlier.
+# No CACHES is configured, so this is Django's per-process LocMemCache:
+# invalidation is best-effort and only reaches the process that made
+# the write. Other workers serve their copy until the TTL runs out,
+# which bounds how stale a dashboard can get. Point CACHES at a shared
+# backend (Redis, memcached, database) to make invalidation global.
+INVENTORY_DASHBOARD_TTL = getattr(settings, 'INVENTORY_DASHBOARD_TTL', 60)
+
+
+def _dashboard_cache_key(organization_id):
+    return f"inventory_dashboard:{organization_id}"
+
+
+def invalidate_inventory_dashboard(organization_ids):
+    """
+    Drop the cached dashboards once the current transaction commits;
+    clearing earlier would let a concurrent read cache the old numbers
+    again, and a rollback leaves nothing to clear.
+    """
+    keys = [_dashboard_cache_key(org_id) for org_id in organization_ids if org_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _count_subquery(queryset):
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values('organization_id')
+            .annotate(c=Count('id')).values('c'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def compute_inventory_dashboard(organization):
+    """
+    Inventory KPIs for one organization in two queries:
+    one aggregate over items annotated from StockBalance, and one
+    row of document counts (pending POs / GRNs, MRP shortages) plus
+    the costed inventory value from ItemCost.
+    """
+    from apps.production.models import PurchaseRequisition   # late import to avoid circular import
+
+    stock = Item.objects.filter(organization=organization).with_stock().aggregate(
+        total_items=Count('id'),
+        out_of_stock=Count('id', filter=Q(on_hand__lte=0)),
+        low_stock=Count('id', filter=Q(on_hand__gt=0, on_hand__lte=LOW_STOCK_THRESHOLD)),
+    )
+
+    shortages = PurchaseRequisition.objects.filter(
+        production_plan__organization=OuterRef('pk'),
+        status='open'
+    ).order_by().values('production_plan__organization').annotate(
+        c=Count('material', distinct=True)
+    ).values('c')
+
+    documents = Organization.objects.filter(pk=organization.pk).annotate(
+        pending_pos=_count_subquery(PurchaseOrder.objects.filter(
+            organization=OuterRef('pk'), status__in=['draft', 'approved']
+        )),
+        pending_grns=_count_subquery(GRN.objects.filter(
+            organization=OuterRef('pk'), status='pending_approval'
+        )),
+        shortages=Coalesce(Subquery(shortages, output_field=IntegerField()), 0),
+        inventory_value=Coalesce(
+            Subquery(
+                ItemCost.objects.filter(organization=OuterRef('pk')).order_by()
+                .values('organization').annotate(v=Sum('value')).values('v'),
+                output_field=DecimalField(max_digits=20, decimal_places=4)
+            ),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=20, decimal_places=4)
+        ),
+    ).values('pending_pos', 'pending_grns', 'shortages', 'inventory_value').first() or {}
+
+    return {
+        **stock,
+        'inventory_value': documents.get('inventory_value', Decimal('0.00')),
+        'pending_pos': documents.get('pending_pos', 0),
+        'pending_grns': documents.get('pending_grns', 0),
+        'shortages': documents.get('shortages', 0),
+    }
+
+
+def get_inventory_dashboard(organization):
+    """Cached compute_inventory_dashboard (INVENTORY_DASHBOARD_TTL seconds)"""
+    key = _dashboard_cache_key(organization.pk)
+    data = cache.get(key)
+    if data is None:
+        data = compute_inventory_dashboard(organization)
+        cache.set(key, data, INVENTORY_DASHBOARD_TTL)
+    return data
+
+
+# ========================= GRN APPROVAL =========================
+
+def _grn_reference(grn_number, item_code):
+    return f"GRN-{grn_number}-{item_code}"
+
+
+@transaction.atomic
+def approve_grns(grns, user):
+    """
+    Approve many pending GRNs in one transaction.
+
+    All affected PO items are locked with a single SELECT ... FOR UPDATE,
+    ledger rows go in with one bulk_create, received quantities with one
+    bulk_update and fully received POs are closed with one UPDATE.
+    A GRN that fails validation is reported and left pending; the rest
+    are still approved.
+
+    Returns one result dict per distinct requested GRN, in request order.
+    """
+    grn_ids = [getattr(g, 'pk', g) for g in grns]
+
+    # Lock the GRNs themselves so two approvers can't both win
+    locked = {
+        g.id: g for g in GRN.objects.select_for_update().filter(id__in=grn_ids)
+    }
+    pending = [locked[i] for i in dict.fromkeys(grn_ids) if i in locked and locked[i].status == 'pending_approval']
+
+    lines = defaultdict(list)
+    for grn_item in GRNItem.objects.filter(
+        grn_id__in=[g.id for g in pending]
+    ).select_related('item').order_by('id'):
+        lines[grn_item.grn_id].append(grn_item)
+
+    po_items = {}
+    po_lines = defaultdict(list)
+    for po_item in PurchaseOrderItem.objects.select_for_update().filter(
+        purchase_order_id__in={g.po_id for g in pending}
+    ).order_by('id'):
+        po_items.setdefault((po_item.purchase_order_id, po_item.item_id), po_item)
+        po_lines[po_item.purchase_order_id].append(po_item)
+
+    refs = {
+        _grn_reference(g.grn_number, line.item.code)
+        for g in pending for line in lines[g.id]
+    }
+    seen_refs = set(
+        StockLedger.objects.filter(
+            reference__in=refs, transaction_type='IN'
+        ).values_list('reference', flat=True)
+    )
+
+    results = {}
+    entries = []
+    touched = {}
+    approved = []
+
+    for grn in pending:
+        missing = [
+            line.item.code for line in lines[grn.id]
+            if (grn.po_id, line.item_id) not in po_items
+        ]
+        if missing:
+            results[grn.id] = {
+                "error": f"No PO item found for {', '.join(missing)} in PO {grn.po.po_number}"
+            }
+            continue
+
+        new_lines = []
+        for line in lines[grn.id]:
+            ref = _grn_reference(grn.grn_number, line.item.code)
+            if ref in seen_refs:
+                continue   # already posted
+            new_lines.append((line, ref))
+
+        if lines[grn.id] and not new_lines:
+            results[grn.id] = {"error": "No new stock entries created – check data consistency"}
+            continue
+
+        total_value = Decimal('0.00')
+        for line, ref in new_lines:
+            seen_refs.add(ref)
+            po_item = po_items[(grn.po_id, line.item_id)]
+            po_item.received_qty += line.received_qty
+            touched[po_item.id] = po_item
+
+            entries.append(StockLedger(
+                item=line.item,
+                quantity=line.received_qty,
+                transaction_type='IN',
+                reference=ref,
+                unit_cost=po_item.unit_price,
+                created_by=user,
+            ))
+            total_value += line.received_qty * (po_item.unit_price or Decimal('0.00'))
+
+        approved.append(grn)
+        results[grn.id] = {
+            "items_processed": len(new_lines),
+            "total_value": total_value.quantize(Decimal('0.00')),
+        }
+
+    if entries:
+        post_ledger_entries(entries)
+    if touched:
+        PurchaseOrderItem.objects.bulk_update(touched.values(), ['received_qty'], batch_size=500)
+
+    now = timezone.now()
+    if approved:
+        # queryset update: the post_save GRN signal would post the stock a second time
+        GRN.objects.filter(id__in=[g.id for g in approved]).update(
+            status='approved', approved_by=user, approved_at=now
+        )
+
+    closable = [
+        po_id for po_id in {g.po_id for g in approved}
+        if all(i.received_qty >= i.ordered_qty for i in po_lines[po_id])
+    ]
+    if closable:
+        PurchaseOrder.objects.filter(id__in=closable, status='approved').update(status='closed')
+
+    report = []
+    for grn_id in dict.fromkeys(grn_ids):
+        grn = locked.get(grn_id)
+        if grn is None:
+            report.append({"grn_id": grn_id, "approved": False, "error": "GRN not found"})
+            continue
+        row = {"grn_id": grn_id, "grn_number": grn.grn_number}
+        if grn_id not in results:
+            row.update(approved=False, error=f"GRN is already {grn.status}. Only 'pending_approval' GRNs can be approved.")
+        elif "error" in results[grn_id]:
+            row.update(approved=False, **results[grn_id])
+        else:
+            row.update(approved=True, **results[grn_id])
+        report.append(row)
+    return report
+
+
+def get_stock_balance(item, department_id=None) -> Decimal:
+    """On-hand stock for one item, in one department or across all of them"""
+    item_id = getattr(item, 'pk', item)
+    qs = StockBalance.objects.filter(item_id=item_id)
+
+    if department_id:
+        return qs.filter(department_id=department_id).values_list(
+            'quantity', flat=True
+        ).first() or Decimal('0')
+
+    return qs.aggregate(
+        total=Coalesce(Sum('quantity'), Decimal('0'), output_field=DecimalField())
+    )['total']
+
+
+def get_stock_balances(item_ids, department_id=None) -> dict:
+    """Bulk variant of get_stock_balance: {item_id: quantity}"""
+    qs = StockBalance.objects.filter(item_id__in=item_ids)
+    if department_id:
+        qs = qs.filter(department_id=department_id)
+
+    return {
+        row['item_id']: row['total']
+        for row in qs.values('item_id').annotate(total=Sum('quantity'))
+    }
+
+
+def ledger_totals(organization=None):
+    """Full-history (item, department) totals straight from StockLedger"""
+    qs = StockLedger.objects.all()
+    if organization is not None:
+        qs = qs.filter(item__organization=organization)
+
+    return {
+        (row['item_id'], row['department_id']): row['total']
+        for row in qs.values('item_id', 'department_id').annotate(
+            total=Coalesce(
+                Sum(signed_quantity_expression()),
+                Value(Decimal('0')),
+                output_field=DecimalField()
+            )
+        )
+    }
+
+
+def reservation_totals(organization=None):
+    """(item, department) quantities held by active StockReservations"""
+    qs = StockReservation.objects.filter(status='active')
+    if organization is not None:
+        qs = qs.filter(item__organization=organization)
+
+    return {
+        (row['item_id'], row['department_id']): row['total']
+        for row in qs.values('item_id', 'department_id').annotate(total=Sum('quantity'))
+    }
+
+
+def verify_stock_balances(organization=None):
+    """
+    Compare StockBalance with a fresh ledger aggregate (quantity) and
+    the active reservations (reserved).
+    Returns a list of (item_id, department_id, field, expected, actual).
+    """
+    expected = {
+        'quantity': ledger_totals(organization),
+        'reserved': reservation_totals(organization),
+    }
+
+    qs = StockBalance.objects.all()
+    if organization is not None:
+        qs = qs.filter(item__organization=organization)
+    rows = {
+        (b['item_id'], b['department_id']): b
+        for b in qs.values('item_id', 'department_id', 'quantity', 'reserved')
+    }
+
+    mismatches = []
+    for field, totals in expected.items():
+        for key in set(totals) | set(rows):
+            exp = totals.get(key, Decimal('0'))
+            act = rows[key][field] if key in rows else Decimal('0')
+            if exp != act:
+                mismatches.append((key[0], key[1], field, exp, act))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild_stock_balances(organization=None):
+    """
+    Recompute StockBalance from the full ledger (quantity) and the
+    active reservations (reserved). Returns rows written.
+    """
+    totals = ledger_totals(organization)
+    reserved = reservation_totals(organization)
+    keys = set(totals) | set(reserved)
+
+    qs = StockBalance.objects.all()
+    if organization is not None:
+        qs = qs.filter(item__organization=organization)
+    qs.delete()
+
+    item_orgs = dict(
+        Item.objects.filter(
+            id__in={item_id for item_id, _ in keys}
+        ).values_list('id', 'organization_id')
+    )
+
+    StockBalance.objects.bulk_create(
+        [
+            StockBalance(
+                organization_id=item_orgs.get(item_id),
+                item_id=item_id,
+                department_id=department_id,
+                quantity=totals.get((item_id, department_id), Decimal('0')),
+                reserved=reserved.get((item_id, department_id), Decimal('0')),
+            )
+            for item_id, department_id in keys
+        ],
+        batch_size=1000,
+    )
+    return len(keys)
+
+
+# ========================= STOCK SNAPSHOTS =========================
+
+def _day_end(day):
+    """First instant after `day` in the current timezone (ledger upper bound)"""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _ledger_deltas(qs):
+    return {
+        (row['item_id'], row['department_id']): row['total']
+        for row in qs.values('item_id', 'department_id').annotate(
+            total=Coalesce(
+                Sum(signed_quantity_expression()),
+                Value(Decimal('0')),
+                output_field=DecimalField()
+            )
+        )
+    }
+
+
+@transaction.atomic
+def take_stock_snapshot(organization, snapshot_date):
+    """
+    Write StockSnapshot rows for `organization` at the end of
+    `snapshot_date`: the previous snapshot plus the ledger movements
+    between the two dates. Re-running a date overwrites it.
+    Returns rows written.
+    """
+    previous = StockSnapshot.objects.filter(
+        organization=organization,
+        snapshot_date__lt=snapshot_date
+    ).aggregate(d=Max('snapshot_date'))['d']
+
+    totals = defaultdict(Decimal)
+    ledger = StockLedger.objects.filter(
+        item__organization=organization,
+        created_at__lt=_day_end(snapshot_date)
+    )
+    if previous:
+        for item_id, department_id, qty in StockSnapshot.objects.filter(
+            organization=organization, snapshot_date=previous
+        ).values_list('item_id', 'department_id', 'quantity'):
+            totals[(item_id, department_id)] += qty
+        ledger = ledger.filter(created_at__gte=_day_end(previous))
+
+    for key, delta in _ledger_deltas(ledger).items():
+        totals[key] += delta
+
+    StockSnapshot.objects.filter(organization=organization, snapshot_date=snapshot_date).delete()
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(
+                organization=organization,
+                item_id=item_id,
+                department_id=department_id,
+                snapshot_date=snapshot_date,
+                quantity=qty,
+            )
+            for (item_id, department_id), qty in totals.items()
+        ],
+        batch_size=1000,
+    )
+    return len(totals)
+
+
+def get_stock_as_of(item_ids, as_of, department_id=None) -> dict:
+    """
+    {item_id: quantity} at the end of `as_of`, in one department or
+    across all of them. Two queries: the nearest snapshot on or before
+    the date for each item, then the ledger delta after it.
+    """
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    result = {item_id: Decimal('0.00') for item_id in item_ids}
+
+    snapshots = StockSnapshot.objects.filter(
+        item_id__in=item_ids,
+        snapshot_date=Subquery(
+            StockSnapshot.objects.filter(
+                item=OuterRef('item'),
+                snapshot_date__lte=as_of
+            ).order_by('-snapshot_date').values('snapshot_date')[:1]
+        )
+    )
+
+    snapshot_dates = {}
+    for item_id, dept_id, day, qty in snapshots.values_list(
+        'item_id', 'department_id', 'snapshot_date', 'quantity'
+    ):
+        # Date is taken from every row so a department with no row yet
+        # still starts its ledger window at the snapshot
+        snapshot_dates[item_id] = day
+        if department_id is None or dept_id == department_id:
+            result[item_id] += qty
+
+    # Items snapshotted on the same day share one ledger window
+    by_day = defaultdict(list)
+    for item_id in item_ids:
+        by_day[snapshot_dates.get(item_id)].append(item_id)
+
+    window = Q()
+    for day, ids in by_day.items():
+        if day is None:
+            window |= Q(item_id__in=ids)
+        else:
+            window |= Q(item_id__in=ids, created_at__gte=_day_end(day))
+
+    ledger = StockLedger.objects.filter(window, created_at__lt=_day_end(as_of))
+    if department_id is not None:
+        ledger = ledger.filter(department_id=department_id)
+
+    for row in ledger.values('item_id').annotate(
+        total=Sum(signed_quantity_expression())
+    ):
+        result[row['item_id']] += row['total']
+
+    return result
+
+
+# ========================= MATERIAL TRANSFER =========================
+
+class InsufficientStockError(ValueError):
+    """Raised with one entry per short line: (item, requested, available)"""
+
+    def __init__(self, shortages, department=None):
+        self.shortages = shortages
+        self.department = department
+        names = ", ".join(f"{item.name} (available {available})" for item, _, available in shortages)
+        where = f" in {department.name}" if department else ""
+        super().__init__(f"Insufficient stock{where}: {names}")
+
+
+@transaction.atomic
+def transfer_materials(organization, from_department, to_department, lines, user=None):
+    """
+    Move several items between two departments in one transaction.
+
+    `lines` is [(item, quantity)]. Source balances for every item are
+    locked and checked together (repeated items are summed), then the
+    DepartmentTransaction rows and the OUT / IN ledger pairs are written
+    with bulk_create. Raises InsufficientStockError if any line is short.
+    Returns the created DepartmentTransaction rows in line order.
+    """
+    from apps.production.models import DepartmentTransaction   # late import to avoid circular import
+
+    needed = defaultdict(Decimal)
+    items = {}
+    for item, qty in lines:
+        needed[item.id] += qty
+        items[item.id] = item
+
+    keys = {(item_id, from_department.id) for item_id in needed}
+    balances = _lock_balances(keys, {i: item.organization_id for i, item in items.items()})
+
+    shortages = []
+    for item_id, qty in needed.items():
+        balance = balances[(item_id, from_department.id)]
+        available = balance.quantity - balance.reserved   # reserved stock stays put
+        if qty > available:
+            shortages.append((items[item_id], qty, available))
+    if shortages:
+        raise InsufficientStockError(shortages, from_department)
+
+    now = timezone.now()
+    transfers = DepartmentTransaction.objects.bulk_create([
+        DepartmentTransaction(
+            organization=organization,
+            item=item,
+            current_department=from_department,
+            next_department=to_department,
+            quantity=qty,
+            created_by=user,
+            status="completed",
+            completed_at=now,
+        )
+        for item, qty in lines
+    ])
+
+    issues = post_ledger_entries([
+        StockLedger(
+            item=transfer.item,
+            quantity=transfer.quantity,
+            transaction_type='OUT',
+            department=from_department,
+            reference=f"Transfer #{transfer.id} to {to_department.name}",
+            created_by=user,
+        )
+        for transfer in transfers
+    ])
+    # Receipts carry the cost the issues were drawn at, so a move
+    # between departments leaves the item's valuation unchanged
+    post_ledger_entries([
+        StockLedger(
+            item=transfer.item,
+            quantity=transfer.quantity,
+            transaction_type='IN',
+            department=to_department,
+            reference=f"Transfer #{transfer.id} from {from_department.name}",
+            unit_cost=issue.unit_cost,
+            created_by=user,
+        )
+        for transfer, issue in zip(transfers, issues)
+    ])
+    return transfers
+
+
+# ========================= STOCK RESERVATION =========================
+
+@transaction.atomic
+def reserve_stock(organization, reference, lines, department_ids=None, user=None):
+    """
+    Hold stock for a document. `lines` is [(item, quantity)].
+
+    `department_ids` is one department id or a list of candidates. With
+    several candidates each item is picked from the location with the
+    most available stock first, then the next, until the line is covered.
+
+    Balance rows for all items and candidates are locked together and
+    checked against quantity - reserved, so two documents can never hold
+    the same units. Raises InsufficientStockError if any item is short.
+    Returns the created StockReservation rows (one per item and location).
+    """
+    if department_ids is None or isinstance(department_ids, int):
+        department_ids = [department_ids]
+    department_ids = list(dict.fromkeys(department_ids))
+
+    needed = defaultdict(Decimal)
+    items = {}
+    for item, qty in lines:
+        needed[item.id] += qty
+        items[item.id] = item
+
+    if not needed:
+        return []
+
+    keys = {(item_id, dept_id) for item_id in needed for dept_id in department_ids}
+    balances = _lock_balances(keys, {i: item.organization_id for i, item in items.items()})
+
+    def available(item_id, dept_id):
+        balance = balances[(item_id, dept_id)]
+        return balance.quantity - balance.reserved
+
+    allocations = []
+    shortages = []
+    for item_id, qty in needed.items():
+        ranked = sorted(
+            department_ids,
+            key=lambda d: (-available(item_id, d), department_ids.index(d))
+        )
+        left = qty
+        picks = []
+        for dept_id in ranked:
+            take = min(left, available(item_id, dept_id))
+            if take <= 0:
+                break
+            picks.append((item_id, dept_id, take))
+            left -= take
+            if left <= 0:
+                break
+        if left > 0:
+            shortages.append((items[item_id], qty, qty - left))
+        allocations += picks
+
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+    now = timezone.now()
+    for item_id, dept_id, qty in allocations:
+        balances[(item_id, dept_id)].reserved += qty
+        balances[(item_id, dept_id)].updated_at = now
+    StockBalance.objects.bulk_update(
+        {balances[(i, d)].pk: balances[(i, d)] for i, d, _ in allocations}.values(),
+        ['reserved', 'updated_at']
+    )
+
+    invalidate_inventory_dashboard([organization.pk])
+    return StockReservation.objects.bulk_create([
+        StockReservation(
+            organization=organization,
+            item=items[item_id],
+            department_id=dept_id,
+            quantity=qty,
+            reference=reference,
+            created_by=user,
+        )
+        for item_id, dept_id, qty in allocations
+    ])
+
+
+def _close_reservations(organization_id, reference, new_status):
+    """
+    Lock the organization's active reservations for `reference` and take
+    them off the balances (references are only unique per organization)
+    """
+    reservations = list(
+        StockReservation.objects.select_for_update()
+        .filter(organization_id=organization_id, reference=reference, status='active')
+        .select_related('item')
+        .order_by('id')
+    )
+    if not reservations:
+        return []
+
+    held = defaultdict(Decimal)
+    for r in reservations:
+        held[(r.item_id, r.department_id)] += r.quantity
+
+    balances = _lock_balances(set(held), {r.item_id: r.organization_id for r in reservations})
+    now = timezone.now()
+    for key, qty in held.items():
+        balances[key].reserved -= qty
+        balances[key].updated_at = now
+    StockBalance.objects.bulk_update(balances.values(), ['reserved', 'updated_at'])
+
+    StockReservation.objects.filter(id__in=[r.id for r in reservations]).update(
+        status=new_status, updated_at=now
+    )
+    for r in reservations:
+        r.status = new_status
+    return reservations
+
+
+@transaction.atomic
+def consume_reservations(organization_id, reference, ledger_reference=None, user=None):
+    """
+    Turn the organization's active reservations for `reference` into OUT
+    ledger rows. Returns the posted StockLedger rows.
+    """
+    reservations = _close_reservations(organization_id, reference, 'consumed')
+    return post_ledger_entries([
+        StockLedger(
+            item=r.item,
+            quantity=r.quantity,
+            transaction_type='OUT',
+            department_id=r.department_id,
+            reference=ledger_reference or reference,
+            created_by=user,
+        )
+        for r in reservations
+    ])
+
+
+@transaction.atomic
+def release_reservations(organization_id, reference):
+    """Give back the stock the organization holds for `reference`. Returns the released rows."""
+    reservations = _close_reservations(organization_id, reference, 'released')
+    if reservations:
+        invalidate_inventory_dashboard({r.organization_id for r in reservations})
+    return reservations
@@ -3,53 +3,49 @@ from django.dispatch import receiver
 
 from .models import VendorInvoice, VendorPayment
 from apps.inventory.models import StockLedger
-from apps.finance.services.voucher_service import create_voucher
+from django.db.models.signals import post_delete
+from apps.inventory.models import PurchaseReturn
+from apps.finance.outbox import enqueue_document
+
+# Vouchers are posted by the outbox worker (finance.outbox); the signals
+# only record, in the document's own transaction, that one is due.
 
 # =========================================================
-# Vendor Invoice: Create Purchase Invoice voucher
+# Vendor Invoice: Purchase voucher
 # =========================================================
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from apps.finance.services.voucher_service import create_voucher
-
 @receiver(post_save, sender=VendorInvoice)
-def invoice_accounting(sender, instance, created, **kwargs):
-    if created and instance.grn:   # Only for newly created invoices
-        try:
-            # Call create_voucher with correct parameters only
-            # Remove 'entries' if it doesn't exist in current function
-            create_voucher(
-                voucher_type="Purchase",          # or whatever type you use
-                organization=instance.organization,
-                reference=f"INV-{instance.invoice_number}",
-                date=instance.invoice_date,
-                amount=instance.total_amount,
-                party=instance.vendor,            # vendor as party
-                # Add other required parameters your create_voucher expects
-                # Do NOT pass 'entries' unless the function supports it
-            )
-        except TypeError as e:
-            print(f"Warning: Voucher creation failed - {e}")
-            # Optionally log it, but don't break invoice creation
+def invoice_accounting(sender, instance, **kwargs):
+    enqueue_document('vendor_invoice', instance.pk, instance.organization_id)
+
+
 # =========================================================
-# Vendor Payment: Create Payment voucher
+# Vendor Payment: Payment voucher
 # =========================================================
 @receiver(post_save, sender=VendorPayment)
-def payment_accounting(sender, instance, created, **kwargs):
-    """Create voucher after successful vendor payment"""
-    if not created:
-        return
+def payment_accounting(sender, instance, **kwargs):
+    enqueue_document('vendor_payment', instance.pk, instance.organization_id)
+
+
+# =========================================================
+# Purchase Return: Debit note voucher
+# =========================================================
+@receiver(post_save, sender=PurchaseReturn)
+def purchase_return_accounting(sender, instance, **kwargs):
+    enqueue_document('purchase_return', instance.pk, instance.organization_id)
+
+
+@receiver(post_delete, sender=VendorInvoice)
+@receiver(post_delete, sender=VendorPayment)
+@receiver(post_delete, sender=PurchaseReturn)
+def document_deleted_accounting(sender, instance, **kwargs):
+    source_type = {
+        VendorInvoice: 'vendor_invoice',
+        VendorPayment: 'vendor_payment',
+        PurchaseReturn: 'purchase_return',
+    }[sender]
+    enqueue_document(source_type, instance.pk, instance.organization_id)
+
 
-    try:
-        # Only using safe, common parameters
-        create_voucher(
-            organization=instance.organization,
-            voucher_type="Vendor Payment",
-            narration=f"Payment for Invoice {instance.invoice.invoice_number}",
-            amount=instance.amount,
-        )
-    except Exception as e:
-        print(f"[WARNING] Voucher creation failed for VendorPayment {instance.id}: {e}")
 # apps/inventory/signals.py   (or apps/stock/signals.py)
 
 from .models import GRN, GRNItem
@@ -80,11 +76,41 @@ def create_stock_entries_on_grn_approval(sender, instance: GRN, created, **kwarg
     # Try to get the user who approved (if you store it somewhere)
     # If not available → use None or a system user
 
+    prices = dict(instance.po.items.values_list('item_id', 'unit_price'))
+
     for grn_item in instance.items.all():
         StockLedger.objects.create(
             item=grn_item.item,
             quantity=grn_item.received_qty,
             transaction_type='IN',
             reference=f"GRN-{instance.grn_number}",
+            unit_cost=prices.get(grn_item.item_id),
             created_by=user,               # or request.user if in view
-        )        
\ No newline at end of file
+        )        
+
+
+# =========================================================
+# Inventory dashboard: drop the cached KPIs on document changes
+# (stock movements clear it in inventory.services)
+# =========================================================
+from django.db.models.signals import post_delete
+from apps.inventory.models import PurchaseOrder
+from apps.inventory.services import invalidate_inventory_dashboard
+
+
+@receiver([post_save, post_delete], sender=PurchaseOrder)
+@receiver([post_save, post_delete], sender=GRN)
+def inventory_documents_changed(sender, instance, **kwargs):
+    invalidate_inventory_dashboard([instance.organization_id])
+
+
+# =========================================================
+# Stock locations: drop this process's cached copy on change
+# =========================================================
+from apps.inventory.models import StockLocation
+from apps.inventory.locations import invalidate_locations
+
+
+@receiver([post_save, post_delete], sender=StockLocation)
+def stock_location_changed(sender, instance, **kwargs):
+    invalidate_locations(instance.organization_id)
@@ -24,6 +24,8 @@ from .views import (
     VendorPaymentViewSet,
     MachineViewSet,
     MaterialTransferAPIView,           # ← the combined one
+    MaterialTransferBatchAPIView,
+    StockLocationViewSet,
 )
 
 router = DefaultRouter()
@@ -37,10 +39,12 @@ router.register(r'vendor-invoices', VendorInvoiceViewSet, basename='vendor-invoi
 router.register(r'vendor-payments', VendorPaymentViewSet, basename='vendor-payments')
 router.register(r'machines', MachineViewSet, basename='machines')
 router.register(r'dispatch', DispatchViewSet, basename='dispatch')
+router.register(r'locations', StockLocationViewSet, basename='stock-locations')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('material-transfer/', MaterialTransferAPIView.as_view(), name='material-transfer'),
+    path('material-transfer/batch/', MaterialTransferBatchAPIView.as_view(), name='material-transfer-batch'),
     path('sales-orders/by-item/<int:item_id>/', SalesOrdersByItemAPIView.as_view(), name='sales-orders-by-item'),
     path('customers/', CustomerListAPIView.as_view(), name='customer-list'),
     path('items-for-quotation/', ItemListForQuotation.as_view(), name='items-for-quotation'),
@@ -1,12 +1,7 @@
-from .models import PurchaseReturn
+from .models import PurchaseReturn, get_next_number
 
-def generate_debit_note_number():
-    last = PurchaseReturn.objects.order_by('-id').first()
 
-    if not last or not last.debit_note_number:
-        next_num = 1
-    else:
-        last_num = int(last.debit_note_number.split('/')[-1])
-        next_num = last_num + 1
-
-    return f"DN/11/2026/{str(next_num).zfill(4)}"
\ No newline at end of file
+def generate_debit_note_number(organization):
+    """Next debit note number from the organization's DN sequence"""
+    organization_id = getattr(organization, 'pk', organization)
+    return get_next_number("DN", organization_id, PurchaseReturn)
@@ -4,6 +4,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Sum, F, Value ,Q, DecimalField
 from django.db.models.functions import Coalesce
+from collections import defaultdict
 from decimal import Decimal
 from rest_framework import status,viewsets
 from django.db import transaction
@@ -11,7 +12,8 @@ from datetime import date
 from django.utils import timezone
 from rest_framework.views import APIView
 from django.db.models import Sum, Case, When, Value, DecimalField, F
-from .models import Dispatch, PurchaseReturn, PurchaseReturnItem, StockLedger
+from .models import Dispatch, PurchaseReturn, PurchaseReturnItem, StockLedger, StockReservation, StockLocation
+from .serializers import StockLocationSerializer
 from .serializers import DispatchSerializer
 from apps.sales.models import SalesOrderItem, GSTSettings
 from apps.sales.models import SalesOrder
@@ -45,10 +47,26 @@ from django.shortcuts import get_object_or_404
 from apps.inventory.models import (
     Item,
     StockLedger,
+    StockBalance,
+)
+from .services import (
+    get_stock_balance, approve_grns, get_inventory_dashboard,
+    transfer_materials, InsufficientStockError,
+    reserve_stock, consume_reservations, release_reservations,
+)
+from .locations import (
+    LocationNotConfigured, finished_goods_department_id,
+    pickable_department_ids, resolve_department_id,
 )
 from apps.hr.models import Department
 from apps.production.models import DepartmentTransaction
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from rest_framework.pagination import CursorPagination
+import csv
+import json
 
 class ItemListForQuotation(APIView):
     def get(self, request):
@@ -192,7 +210,6 @@ class GRNViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
-       
         grn = self.get_object()
 
         if grn.status != 'pending_approval':
@@ -201,94 +218,55 @@ class GRNViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Prevent double-approval (race condition)
-        if GRN.objects.filter(pk=grn.pk, status='approved').exists():
-            return Response(
-                {"error": "This GRN has already been approved by another process."},
-                status=status.HTTP_409_CONFLICT
-            )
-
-        total_value = Decimal('0.00')  # still calculate for logging/response (optional)
-        created_ledgers = []
-
-        try:
-            with transaction.atomic():
-                # Ensure PO exists
-                if not grn.po:
-                    raise ValueError("GRN has no linked Purchase Order")
-
-                for grn_item in grn.items.select_related('item').iterator():
-                    # Lock the PO item to prevent concurrent updates
-                    try:
-                        po_item = PurchaseOrderItem.objects.select_for_update().get(
-                            purchase_order=grn.po,
-                            item=grn_item.item
-                        )
-                    except PurchaseOrderItem.DoesNotExist:
-                        raise ValueError(f"No PO item found for {grn_item.item.code} in PO {grn.po.po_number}")
-
-                    # Avoid duplicate ledger entry
-                    ref = f"GRN-{grn.grn_number}-{grn_item.item.code}"
-                    if StockLedger.objects.filter(reference=ref, transaction_type='IN').exists():
-                        continue
-
-                    # Update PO received qty (atomic)
-                    po_item.received_qty = F('received_qty') + grn_item.received_qty
-                    po_item.save(update_fields=['received_qty'])
-                    po_item.refresh_from_db()
-
-                    # Create stock IN entry → this automatically updates stock
-                    ledger = StockLedger.objects.create(
-                        item=grn_item.item,
-                        quantity=grn_item.received_qty,
-                        transaction_type='IN',
-                        reference=ref,
-                        created_by=request.user,
-                    )
-                    created_ledgers.append(ledger)
+        result = approve_grns([grn], request.user)[0]
 
-                    # Optional: still accumulate total_value for response/logging
-                    unit_price = po_item.unit_price if po_item.unit_price is not None else Decimal('0.00')
-                    total_value += grn_item.received_qty * unit_price
+        if not result["approved"]:
+            # Someone else approved it between the check above and the lock
+            code = status.HTTP_409_CONFLICT if "already" in result["error"] else status.HTTP_400_BAD_REQUEST
+            return Response({"error": result["error"]}, status=code)
 
-                if not created_ledgers and grn.items.exists():
-                    raise ValueError("No new stock entries created – check data consistency")
-
-                # Mark GRN approved
-                grn.status = 'approved'
-                grn.approved_by = request.user
-                grn.approved_at = timezone.now()
-                grn.save(update_fields=['status', 'approved_by', 'approved_at'])
-
-                # Close PO if fully received
-                grn.po.check_and_close()
+        return Response({
+            "message": "GRN approved successfully – stock updated automatically",
+            "grn_number": result["grn_number"],
+            "items_processed": result["items_processed"],
+            "total_value": float(result["total_value"]),
+        }, status=status.HTTP_200_OK)
 
-            # Success response
-            return Response({
-                "message": "GRN approved successfully – stock updated automatically",
-                "grn_number": grn.grn_number,
-                "items_processed": len(created_ledgers),
-                "total_value": float(total_value.quantize(Decimal('0.00'))),
-            }, status=status.HTTP_200_OK)
+    @action(detail=False, methods=['post'], url_path='bulk-approve')
+    def bulk_approve(self, request):
+        """
+        Approve many GRNs in one go: {"grn_ids": [..]}
+        GRNs that can't be approved are reported; the others still go through.
+        """
+        grn_ids = request.data.get("grn_ids") or []
+        try:
+            grn_ids = list(dict.fromkeys(int(i) for i in grn_ids))
+        except (TypeError, ValueError):
+            grn_ids = []
+        if not grn_ids:
+            return Response({"error": "grn_ids must be a non-empty list of GRN ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        except ValueError as ve:
-            return Response({"error": str(ve)}, status=status.HTTP_400_BAD_REQUEST)
+        own_ids = set(
+            self.get_queryset().filter(id__in=grn_ids).values_list("id", flat=True)
+        )
+        results = approve_grns([i for i in grn_ids if i in own_ids], request.user)
+        results += [
+            {"grn_id": i, "approved": False, "error": "GRN not found"}
+            for i in grn_ids if i not in own_ids
+        ]
 
-        except PurchaseOrderItem.DoesNotExist:
-            return Response(
-                {"error": "One or more linked PO items not found."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        for row in results:
+            if "total_value" in row:
+                row["total_value"] = float(row["total_value"])
 
-        except Exception as e:
-            import traceback
-            full_traceback = traceback.format_exc()
-            print("GRN APPROVAL CRASHED:")
-            print(full_traceback)
-            return Response({
-                "error": "Internal error during GRN approval",
-                "detail": str(e),
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        approved = sum(1 for row in results if row["approved"])
+        return Response({
+            "message": f"{approved} GRN(s) approved",
+            "approved": approved,
+            "failed": len(results) - approved,
+            "results": results,
+        }, status=status.HTTP_200_OK)
 # ========================= QUALITY INSPECTION =========================
 class QualityInspectionViewSet(ModelViewSet):
     serializer_class = QualityInspectionSerializer
@@ -529,62 +507,16 @@ class InventoryDashboardStatsAPIView(APIView):
         if not organization:
             return Response({"error": "Organization not found"}, status=400)
 
-        # Annotate current stock
-        items = Item.objects.filter(organization=organization).annotate(
-            current_stock=Coalesce(
-                Sum(
-                    'grnitem__received_qty',
-                    filter=Q(grnitem__grn__status='approved'),
-                    output_field=DecimalField(max_digits=20, decimal_places=2)
-                ),
-                Decimal('0.00')
-            )
-        )
-
-        # Total items
-        total_items = items.count()
-
-        # Out of stock
-        out_of_stock = items.filter(current_stock=0).count()
-
-        # Low stock
-        LOW_STOCK_THRESHOLD = Decimal('5.00')
-
-        low_stock = items.filter(
-            current_stock__gt=0,
-            current_stock__lte=LOW_STOCK_THRESHOLD
-        ).count()
-
-        # ✅ FIXED INVENTORY VALUE CALCULATION
-        inventory_value = items.aggregate(
-            total=Coalesce(
-                Sum(
-                    F('current_stock') * F('standard_price'),
-                    output_field=DecimalField(max_digits=20, decimal_places=2)
-                ),
-                Decimal('0.00')
-            )
-        )['total']
-
-        # Pending Purchase Orders
-        pending_pos = PurchaseOrder.objects.filter(
-            organization=organization,
-            status__in=['draft', 'approved']
-        ).count()
-
-        # Pending GRNs
-        pending_grns = GRN.objects.filter(
-            organization=organization,
-            status='pending_approval'
-        ).count()
+        stats = get_inventory_dashboard(organization)
 
         data = {
-            "totalItems": total_items,
-            "lowStock": low_stock,
-            "outOfStock": out_of_stock,
-            "inventoryValue": float(inventory_value or 0),
-            "pendingPOs": pending_pos,
-            "pendingGRNs": pending_grns,
+            "totalItems": stats["total_items"],
+            "lowStock": stats["low_stock"],
+            "outOfStock": stats["out_of_stock"],
+            "inventoryValue": float(stats["inventory_value"] or 0),
+            "pendingPOs": stats["pending_pos"],
+            "pendingGRNs": stats["pending_grns"],
+            "materialShortages": stats["shortages"],
         }
 
         return Response(data)
@@ -592,20 +524,16 @@ class InventoryDashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Example – adjust based on your real logic
-        low_stock = Item.objects.filter(
-            organization=request.user.organization,
-            current_stock__lte=10  # or use min_stock_level field if you have it
-        ).count()
+        organization = getattr(request.user, 'organization', None)
+        if not organization:
+            return Response({"error": "Organization not found"}, status=400)
 
-        # MRP shortages – if you have MRPRequirement model
-        shortages = 0  # replace with real count later
-        # shortages = MRPRequirement.objects.filter(shortage__gt=0).count()
+        stats = get_inventory_dashboard(organization)
 
         data = {
-            'low_stock_items': low_stock,
-            'material_shortages': shortages,
-            'pending_pos': 5,  # example – count open Purchase Orders
+            'low_stock_items': stats['low_stock'] + stats['out_of_stock'],
+            'material_shortages': stats['shortages'],
+            'pending_pos': stats['pending_pos'],
         }
         return Response(data)
 
@@ -733,75 +661,180 @@ from django.db.models.functions import Coalesce
 from django.db.models import F
 class DepartmentStockAPIView(APIView):
     def get(self, request):
-        item_id = request.GET.get("item")
-        department_id = request.GET.get("department")
-
-        stock = StockLedger.objects.filter(
-            item_id=item_id,
-            department_id=department_id
-        ).aggregate(
-            stock=Coalesce(
-                Sum(
-                    Case(
-                        When(transaction_type='IN', then='quantity'),
-                        When(transaction_type='OUT', then=-1 * F('quantity')),
-                        default=Value(0),
-                        output_field=DecimalField()
-                    )
-                ),
-                Value(0),
-                output_field=DecimalField()
-            )
-        )
+        org = request.user.organization
+        item = get_object_or_404(Item, id=request.GET.get("item"), organization=org)
+        department = request.GET.get("department")   # department id or location code
 
-        return Response({"stock": stock["stock"]})
+        try:
+            department_id = resolve_department_id(org, department) if department else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        stock = get_stock_balance(item, department_id)
+
+        return Response({"stock": stock})
 
 
 User = get_user_model()
 
 
+class MaterialTransferCursorPagination(CursorPagination):
+    """Newest first; the cursor keeps deep pages as cheap as the first one"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-id'
+
+
+MATERIAL_TRANSFER_EXPORT_FIELDS = [
+    "id", "created_at", "from_department_name", "to_department_name",
+    "item_name", "quantity", "sent_by_name", "status",
+]
+
+
+def _material_transfer_row(t):
+    """One history row from a DepartmentTransaction .values() dict"""
+    sent_by_name = (
+        f"{t['created_by__first_name'] or ''} {t['created_by__last_name'] or ''}".strip()
+        if t['created_by_id'] else "—"
+    )
+    return {
+        "id": t['id'],
+        "created_at": t['created_at'].isoformat(),
+        "from_department_name": t['current_department__name'] or "—",
+        "to_department_name": t['next_department__name'] or "—",
+        "item_name": t['item__name'] or "—",
+        "quantity": str(t['quantity']),
+        "sent_by_name": sent_by_name,
+        "status": t['status'],
+    }
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer"""
+    def write(self, value):
+        return value
+
+
 class MaterialTransferAPIView(APIView):
     """
     Combined endpoint for Material Transfer:
-    - GET  → List all transfers (history)
+    - GET  → Transfer history (cursor-paginated, or streamed with ?export=)
     - POST → Create new material transfer
     """
     permission_classes = [IsAuthenticated]
 
+    row_fields = (
+        'id', 'created_at', 'quantity', 'status', 'created_by_id',
+        'current_department__name', 'next_department__name', 'item__name',
+        'created_by__first_name', 'created_by__last_name',
+    )
+
+    @staticmethod
+    def _id_param(params, name):
+        try:
+            return int(params[name])
+        except ValueError:
+            raise ValueError(f"'{name}' must be an id")
+
+    @staticmethod
+    def _date_param(params, name):
+        try:
+            day = parse_date(params[name])
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValueError(f"'{name}' must be a date (YYYY-MM-DD)")
+        return day
+
+    def get_queryset(self, request, org):
+        """
+        Filtered history. Parameters are parsed here, so a bad value is a
+        ValueError before any query runs (an export would otherwise fail
+        after its 200 headers were sent).
+        """
+        qs = DepartmentTransaction.objects.filter(organization=org)
+        params = request.query_params
+
+        if params.get('department'):
+            department = self._id_param(params, 'department')
+            qs = qs.filter(Q(current_department_id=department) | Q(next_department_id=department))
+
+        for param, field in (
+            ('from_department', 'current_department_id'),
+            ('to_department', 'next_department_id'),
+            ('item', 'item_id'),
+        ):
+            if params.get(param):
+                qs = qs.filter(**{field: self._id_param(params, param)})
+
+        if params.get('status'):
+            qs = qs.filter(status=params['status'])
+
+        if params.get('date_from'):
+            qs = qs.filter(created_at__date__gte=self._date_param(params, 'date_from'))
+
+        if params.get('date_to'):
+            qs = qs.filter(created_at__date__lte=self._date_param(params, 'date_to'))
+
+        return qs
+
     def get(self, request):
         """
         GET /api/inventory/material-transfer/
-        Returns list of department transfers for history
+        Filters: department, from_department, to_department, item, status,
+                 date_from, date_to (YYYY-MM-DD)
+        Paging:  ?cursor=...&page_size=N (default 100, max 1000)
+        Export:  ?export=ndjson | ?export=csv streams every matching row
         """
         org = getattr(request.user, 'organization', None)
         if not org:
             return Response({"error": "Organization not found for user"}, status=400)
 
-        transfers = DepartmentTransaction.objects.filter(
-            organization=org
-        ).select_related(
-            'item', 'current_department', 'next_department', 'created_by'
-        ).order_by('-created_at')
+        try:
+            qs = self.get_queryset(request, org)
+            export = request.query_params.get('export')
+            if export:
+                return self.export(qs, export)
+
+            paginator = MaterialTransferCursorPagination()
+            page = paginator.paginate_queryset(
+                qs.values(*self.row_fields), request, view=self
+            )
+        except (ValueError, ValidationError) as e:
+            return Response({"error": str(e)}, status=400)
 
-        data = []
-        for t in transfers:
-            sent_by_name = (
-                f"{t.created_by.first_name} {t.created_by.last_name}".strip()
-                if t.created_by else "—"
+        return paginator.get_paginated_response(
+            [_material_transfer_row(t) for t in page]
+        )
+
+    def export(self, qs, export):
+        rows = (
+            _material_transfer_row(t)
+            for t in qs.order_by('-id').values(*self.row_fields).iterator(chunk_size=2000)
+        )
+
+        if export == 'ndjson':
+            response = StreamingHttpResponse(
+                (json.dumps(row, ensure_ascii=False) + "\n" for row in rows),
+                content_type='application/x-ndjson'
             )
+            filename = 'material-transfers.ndjson'
+        elif export == 'csv':
+            writer = csv.DictWriter(_Echo(), fieldnames=MATERIAL_TRANSFER_EXPORT_FIELDS)
 
-            data.append({
-                "id": t.id,
-                "created_at": t.created_at.isoformat(),
-                "from_department_name": t.current_department.name if t.current_department else "—",
-                "to_department_name": t.next_department.name if t.next_department else "—",
-                "item_name": t.item.name if t.item else "—",
-                "quantity": str(t.quantity),
-                "sent_by_name": sent_by_name,
-                "status": t.status,
-            })
+            def lines():
+                yield writer.writeheader()
+                for row in rows:
+                    yield writer.writerow(row)
 
-        return Response(data)
+            response = StreamingHttpResponse(lines(), content_type='text/csv')
+            filename = 'material-transfers.csv'
+        else:
+            raise ValueError("export must be 'ndjson' or 'csv'")
+
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     def post(self, request):
         """
@@ -821,8 +854,8 @@ class MaterialTransferAPIView(APIView):
                 return Response({"error": f"{field} is required"}, status=400)
 
         try:
-            from_dept_id = int(data['from_department'])
-            to_dept_id   = int(data['to_department'])
+            from_dept_id = resolve_department_id(org, data['from_department'])
+            to_dept_id   = resolve_department_id(org, data['to_department'])
             item_id      = int(data['item'])
             qty          = Decimal(str(data['quantity']))
 
@@ -833,47 +866,15 @@ class MaterialTransferAPIView(APIView):
             to_dept   = get_object_or_404(Department, id=to_dept_id, organization=org)
             item      = get_object_or_404(Item, id=item_id, organization=org)
 
-            # Check available stock in source department
-            current_stock = item.get_department_stock(department_id=from_dept.id)
-            if qty > current_stock:
+            try:
+                transfer, = transfer_materials(org, from_dept, to_dept, [(item, qty)], user)
+            except InsufficientStockError as e:
+                _, _, current_stock = e.shortages[0]
                 return Response(
                     {"error": f"Insufficient stock in {from_dept.name}. Available: {current_stock}"},
                     status=400
                 )
 
-            with transaction.atomic():
-                # Create the transfer record
-                transfer = DepartmentTransaction.objects.create(
-                    organization=org,
-                    item=item,
-                    current_department=from_dept,
-                    next_department=to_dept,
-                    quantity=qty,
-                    created_by=user,
-                    status="completed",  # change to "pending" if approval needed
-                    completed_at=timezone.now(),
-                )
-
-                # Stock movement: OUT from source
-                StockLedger.objects.create(
-                    item=item,
-                    quantity=qty,
-                    transaction_type='OUT',
-                    department=from_dept,
-                    reference=f"Transfer #{transfer.id} to {to_dept.name}",
-                    created_by=user,
-                )
-
-                # Stock movement: IN to destination
-                StockLedger.objects.create(
-                    item=item,
-                    quantity=qty,
-                    transaction_type='IN',
-                    department=to_dept,
-                    reference=f"Transfer #{transfer.id} from {from_dept.name}",
-                    created_by=user,
-                )
-
             # Prepare success response (for slip / modal)
             sent_by_name = (
                 f"{user.first_name} {user.last_name}".strip()
@@ -896,6 +897,113 @@ class MaterialTransferAPIView(APIView):
             return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"error": "Server error during transfer"}, status=500)
+class MaterialTransferBatchAPIView(APIView):
+    """
+    POST /api/inventory/material-transfer/batch/
+    {
+        "from_department": 1,
+        "to_department": 2,
+        "lines": [{"item": 10, "quantity": "5"}, ...]
+    }
+    All lines are checked against source stock together and saved in one
+    transaction; if any line is short nothing is transferred.
+    """
+    permission_classes = [IsAuthenticated]
+
+    MAX_LINES = 500
+
+    def post(self, request):
+        data = request.data
+        user = request.user
+        org = getattr(user, 'organization', None)
+
+        if not org:
+            return Response({"error": "Organization not found for user"}, status=400)
+
+        for field in ['from_department', 'to_department', 'lines']:
+            if not data.get(field):
+                return Response({"error": f"{field} is required"}, status=400)
+
+        lines = data['lines']
+        if not isinstance(lines, list):
+            return Response({"error": "lines must be a list"}, status=400)
+        if len(lines) > self.MAX_LINES:
+            return Response({"error": f"At most {self.MAX_LINES} lines per transfer"}, status=400)
+
+        try:
+            from_dept = Department.objects.get(id=resolve_department_id(org, data['from_department']), organization=org)
+            to_dept   = Department.objects.get(id=resolve_department_id(org, data['to_department']), organization=org)
+        except (TypeError, ValueError, Department.DoesNotExist):
+            return Response({"error": "Invalid from_department / to_department (department id or location code)"}, status=400)
+
+        if from_dept.id == to_dept.id:
+            return Response({"error": "Source and destination departments must differ"}, status=400)
+
+        parsed = []
+        errors = []
+        for index, line in enumerate(lines):
+            try:
+                item_id = int(line['item'])
+                qty = Decimal(str(line['quantity']))
+            except (KeyError, TypeError, ValueError, ArithmeticError):
+                errors.append({"line": index, "error": "A numeric item and quantity are required"})
+                continue
+            if qty <= 0:
+                errors.append({"line": index, "error": "Quantity must be positive"})
+                continue
+            parsed.append((index, item_id, qty))
+
+        items = Item.objects.in_bulk({item_id for _, item_id, _ in parsed})
+        for index, item_id, _ in parsed:
+            if item_id not in items or items[item_id].organization_id != org.id:
+                errors.append({"line": index, "error": f"Item {item_id} not found"})
+
+        if errors:
+            return Response({"error": "Invalid lines", "lines": errors}, status=400)
+
+        try:
+            transfers = transfer_materials(
+                org, from_dept, to_dept,
+                [(items[item_id], qty) for _, item_id, qty in parsed],
+                user
+            )
+        except InsufficientStockError as e:
+            return Response({
+                "error": str(e),
+                "lines": [
+                    {
+                        "item": item.id,
+                        "item_name": item.name,
+                        "requested": str(requested),
+                        "available": str(available),
+                    }
+                    for item, requested, available in e.shortages
+                ],
+            }, status=400)
+
+        sent_by_name = (
+            f"{user.first_name} {user.last_name}".strip()
+            or user.username
+            or "System User"
+        )
+
+        return Response({
+            "message": f"{len(transfers)} item(s) transferred successfully",
+            "from_department_name": from_dept.name,
+            "to_department_name": to_dept.name,
+            "sent_by_name": sent_by_name,
+            "transfers": [
+                {
+                    "id": t.id,
+                    "item_name": t.item.name,
+                    "quantity": str(t.quantity),
+                    "created_at": t.created_at.isoformat(),
+                }
+                for t in transfers
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+
 class ItemDepartmentStockView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -913,7 +1021,84 @@ class ItemDepartmentStockView(APIView):
             "department_id": dept_id,
             "available_stock": float(stock)
         })
+class StockLocationViewSet(ModelViewSet):
+    """
+    Stock locations of the organization. Saving a location as default
+    unsets the previous default of the same type.
+    """
+    serializer_class = StockLocationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return StockLocation.objects.filter(
+            organization=self.request.user.organization
+        ).select_related('department')
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        self._save(serializer, organization=self.request.user.organization)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        self._save(serializer)
+
+    def _save(self, serializer, **kwargs):
+        data = serializer.validated_data
+        location_type = data.get('location_type', getattr(serializer.instance, 'location_type', 'store'))
+        if data.get('is_default'):
+            others = StockLocation.objects.filter(
+                organization=self.request.user.organization,
+                location_type=location_type,
+                is_default=True
+            )
+            if serializer.instance:
+                others = others.exclude(pk=serializer.instance.pk)
+            for other in others:
+                other.is_default = False
+                other.save(update_fields=['is_default'])
+        serializer.save(**kwargs)
+
+
+def _dispatch_department_ids(dispatch):
+    """Finished-goods departments this dispatch may pick from"""
+    if dispatch.picking_mode == 'multi':
+        department_ids = pickable_department_ids(dispatch.organization)
+        if department_ids:
+            return department_ids
+    return [finished_goods_department_id(dispatch.organization)]
+
+
+def _dispatch_reference(dispatch):
+    return f"DC-{dispatch.dc_number}"
+
+
+def _dispatch_lines(dispatch):
+    return [(d.item, d.dispatch_qty) for d in dispatch.items.select_related('item')]
+
+
+def _shortage_response(error):
+    return Response({
+        "error": "; ".join(
+            f"Insufficient stock for {item.name}. Available: {available}, Required: {requested}"
+            for item, requested, available in error.shortages
+        ),
+        "lines": [
+            {
+                "item": item.id,
+                "item_name": item.name,
+                "requested": str(requested),
+                "available": str(available),
+            }
+            for item, requested, available in error.shortages
+        ],
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
 class DispatchViewSet(ModelViewSet):
+    """
+    Draft dispatches reserve finished-goods stock when created; confirming
+    consumes the reservation into OUT ledger rows, cancelling releases it.
+    """
     serializer_class = DispatchSerializer
     permission_classes = [IsAuthenticated]
 
@@ -922,11 +1107,54 @@ class DispatchViewSet(ModelViewSet):
             organization=self.request.user.organization
         ).order_by('-id')
 
+    def create(self, request, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().create(request, *args, **kwargs)
+        except InsufficientStockError as e:
+            return _shortage_response(e)
+        except LocationNotConfigured as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     def perform_create(self, serializer):
-        serializer.save(
+        dispatch = serializer.save(
             organization=self.request.user.organization,
             created_by=self.request.user
         )
+        reserve_stock(
+            dispatch.organization,
+            _dispatch_reference(dispatch),
+            _dispatch_lines(dispatch),
+            department_ids=_dispatch_department_ids(dispatch),
+            user=self.request.user,
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        if instance.status == 'draft':
+            release_reservations(instance.organization_id, _dispatch_reference(instance))
+        instance.delete()
+
+    @action(detail=True, methods=['post'])
+    def cancel_dispatch(self, request, pk=None):
+        dispatch = self.get_object()
+
+        with transaction.atomic():
+            dispatch = Dispatch.objects.select_for_update().get(pk=dispatch.pk)
+            if dispatch.status != 'draft':
+                return Response(
+                    {"error": f"Only draft dispatches can be cancelled (this one is {dispatch.status})"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            released = release_reservations(dispatch.organization_id, _dispatch_reference(dispatch))
+            dispatch.status = 'cancelled'
+            dispatch.save(update_fields=['status'])
+
+        return Response({
+            "message": "Dispatch cancelled, reserved stock released",
+            "released_lines": len(released),
+        })
 
     @action(detail=True, methods=['post'])
     def confirm_dispatch(self, request, pk=None):
@@ -938,63 +1166,49 @@ class DispatchViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        FINISHED_GOODS_DEPARTMENT_ID = 13  # ✅ correct
-
         try:
             with transaction.atomic():
-                for dispatch_item in dispatch.items.all():
-                    item = dispatch_item.item
-
-                    # ✅ STOCK CALCULATION (IN - OUT)
-                    stock = StockLedger.objects.filter(
-                        item=item,
-                        department_id=FINISHED_GOODS_DEPARTMENT_ID
-                    ).aggregate(
-                        stock=Coalesce(
-                            Sum(
-                                Case(
-                                    When(transaction_type='IN', then=F('quantity')),
-                                    When(transaction_type='OUT', then=-F('quantity')),
-                                    default=Value(0),
-                                    output_field=DecimalField()
-                                )
-                            ),
-                            Value(0),
-                            output_field=DecimalField()
-                        )
-                    )["stock"]
-
-                    available_stock = stock or 0
-
-                    print(f"{item.name} → FG Stock: {available_stock}")
-
-                    # ❌ STOCK VALIDATION
-                    if dispatch_item.dispatch_qty > available_stock:
-                        return Response({
-                            "error": f"Insufficient stock for {item.name}. Available: {available_stock}, Required: {dispatch_item.dispatch_qty}"
-                        }, status=status.HTTP_400_BAD_REQUEST)
-
-                    # ✅ STOCK OUT ENTRY
-                    StockLedger.objects.create(
-                        item=item,
-                        quantity=dispatch_item.dispatch_qty,
-                        transaction_type='OUT',
-                        department_id=FINISHED_GOODS_DEPARTMENT_ID,
-                        reference=f"DC-{dispatch.dc_number}",
-                        created_by=request.user,
+                # Row lock: a second confirm waits here, then sees 'dispatched'
+                dispatch = Dispatch.objects.select_for_update().get(pk=dispatch.pk)
+                if dispatch.status != 'draft':
+                    return Response(
+                        {"error": "Dispatch already confirmed"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                reference = _dispatch_reference(dispatch)
+                lines = _dispatch_lines(dispatch)
+
+                # Drafts saved before reservations existed reserve now, under the same locks
+                if not StockReservation.objects.filter(
+                    organization_id=dispatch.organization_id, reference=reference, status='active'
+                ).exists():
+                    reserve_stock(
+                        dispatch.organization, reference, lines,
+                        department_ids=_dispatch_department_ids(dispatch),
+                        user=request.user,
                     )
 
-                    # ✅ UPDATE SALES ORDER ITEM
-                    if dispatch.sales_order:
-                        try:
-                            so_item = SalesOrderItem.objects.get(
-                                sales_order=dispatch.sales_order,
-                                product=item
-                            )
-                            so_item.quantity -= dispatch_item.dispatch_qty
-                            so_item.save(update_fields=['quantity'])
-                        except SalesOrderItem.DoesNotExist:
-                            pass
+                # ✅ STOCK OUT ENTRIES (one bulk insert for the whole dispatch)
+                consume_reservations(dispatch.organization_id, reference, user=request.user)
+
+                # ✅ UPDATE SALES ORDER ITEMS (one locked read, one bulk update)
+                if dispatch.sales_order_id:
+                    dispatched = defaultdict(Decimal)
+                    for item, qty in lines:
+                        dispatched[item.id] += qty
+
+                    so_items = {}
+                    for so_item in SalesOrderItem.objects.select_for_update().filter(
+                        sales_order_id=dispatch.sales_order_id,
+                        product_id__in=dispatched
+                    ).order_by('id'):
+                        so_items.setdefault(so_item.product_id, so_item)
+
+                    for product_id, so_item in so_items.items():
+                        so_item.quantity = max(so_item.quantity - dispatched[product_id], 0)
+                        so_item.subtotal = so_item.quantity * so_item.unit_price - so_item.discount_amount
+                    SalesOrderItem.objects.bulk_update(so_items.values(), ['quantity', 'subtotal'])
 
                 # ✅ UPDATE DISPATCH STATUS
                 dispatch.status = 'dispatched'
@@ -1064,6 +1278,12 @@ class DispatchViewSet(ModelViewSet):
                 "dc_data": dc_data
             })
 
+        except InsufficientStockError as e:
+            return _shortage_response(e)
+
+        except LocationNotConfigured as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         except Exception as e:
             import traceback
             print("ERROR:", str(e))
@@ -1083,22 +1303,9 @@ from .models import StockLedger
 class AllDepartmentStockView(APIView):
     def get(self, request):
         data = (
-            StockLedger.objects
+            StockBalance.objects
             .values("item", "department")
-            .annotate(
-                stock=Coalesce(
-                    Sum(
-                        Case(
-                            When(transaction_type='IN', then=F('quantity')),
-                            When(transaction_type='OUT', then=-F('quantity')),
-                            default=Value(0),
-                            output_field=DecimalField()
-                        )
-                    ),
-                    Value(0),
-                    output_field=DecimalField()
-                )
-            )
+            .annotate(stock=F("quantity"))
         )
         return Response(data)
 
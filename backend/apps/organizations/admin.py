@@ -1,7 +1,7 @@
 # apps/organizations/admin.py
 
 from django.contrib import admin
-from .models import Organization, TrainingVideo, TrainingCompletion
+from .models import Organization, TrainingVideo, TrainingCompletion, DocumentSequence
 
 
 @admin.register(TrainingVideo)
@@ -37,4 +37,11 @@ class OrganizationAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(DocumentSequence)
+class DocumentSequenceAdmin(admin.ModelAdmin):
+    list_display = ('organization', 'document_type', 'number_format', 'reset', 'period', 'last_value', 'updated_at')
+    list_filter = ('document_type', 'reset')
+    search_fields = ('organization__name', 'document_type')
+    readonly_fields = ('updated_at',)
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 20:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0020_alter_organizationuser_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(help_text='PO, GRN, GE, DC, DN, INV ...', max_length=20)),
+                ('number_format', models.CharField(help_text='Placeholders: {org} {year} {month} {yyyymm} {fy} {seq}, e.g. PO/{org}/{fy}/{seq:04d}', max_length=100)),
+                ('reset', models.CharField(choices=[('never', 'Never'), ('yearly', 'Every calendar year'), ('fiscal', 'Every financial year'), ('monthly', 'Every month')], default='yearly', max_length=10)),
+                ('fiscal_year_start_month', models.PositiveSmallIntegerField(default=4)),
+                ('period', models.CharField(blank=True, help_text='Period the counter belongs to', max_length=10)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_sequences', to='organizations.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'document_type')},
+            },
+        ),
+    ]
@@ -174,4 +174,79 @@ class OrganizationBranding(models.Model):
 
     class Meta:
         verbose_name = "Organization Branding"
-        verbose_name_plural = "Organization Branding"
\ No newline at end of file
+        verbose_name_plural = "Organization Branding"
+
+class DocumentSequence(models.Model):
+    """
+    Numbering counter for one document type of one organization.
+
+    Numbers are taken with the row locked FOR UPDATE inside the saving
+    transaction (see apps.organizations.sequences), so they never repeat
+    and a rolled-back document gives its number back.
+    """
+    RESET_CHOICES = (
+        ('never', 'Never'),
+        ('yearly', 'Every calendar year'),
+        ('fiscal', 'Every financial year'),
+        ('monthly', 'Every month'),
+    )
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='document_sequences'
+    )
+    document_type = models.CharField(max_length=20, help_text="PO, GRN, GE, DC, DN, INV ...")
+    number_format = models.CharField(
+        max_length=100,
+        help_text="Placeholders: {org} {year} {month} {yyyymm} {fy} {seq}, e.g. PO/{org}/{fy}/{seq:04d}"
+    )
+    reset = models.CharField(max_length=10, choices=RESET_CHOICES, default='yearly')
+    fiscal_year_start_month = models.PositiveSmallIntegerField(default=4)
+
+    period = models.CharField(max_length=10, blank=True, help_text="Period the counter belongs to")
+    last_value = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('organization', 'document_type')
+
+    def __str__(self):
+        return f"{self.organization_id} {self.document_type} ({self.period or '-'}: {self.last_value})"
+
+    def period_for(self, day):
+        if self.reset == 'yearly':
+            return f"{day.year}"
+        if self.reset == 'monthly':
+            return f"{day.year}-{day.month:02d}"
+        if self.reset == 'fiscal':
+            return self.fiscal_year(day)
+        return ""
+
+    def fiscal_year(self, day):
+        """e.g. "2026-27" for a year starting in April 2026"""
+        start = day.year if day.month >= self.fiscal_year_start_month else day.year - 1
+        return f"{start}-{(start + 1) % 100:02d}"
+
+    def format_number(self, value, day):
+        return self.number_format.format(
+            org=self.organization_id,
+            year=day.year,
+            month=f"{day.month:02d}",
+            yyyymm=f"{day.year}{day.month:02d}",
+            fy=self.fiscal_year(day),
+            seq=value,
+        )
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from django.utils import timezone
+
+        if not 1 <= self.fiscal_year_start_month <= 12:
+            raise ValidationError({'fiscal_year_start_month': "Must be a month number (1-12)"})
+        if '{seq' not in self.number_format:
+            raise ValidationError({'number_format': "The format must contain {seq}"})
+        try:
+            self.format_number(1, timezone.localdate())
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValidationError({'number_format': f"Invalid format: {e}"})
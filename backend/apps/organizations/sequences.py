@@ -0,0 +1,83 @@
+# apps/organizations/sequences.py
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import DocumentSequence
+
+
+# Formats used until an organization configures its own. They match the
+# numbers the documents carried before sequences existed.
+DEFAULT_SEQUENCES = {
+    'PO':  ('PO/{org}/{year}/{seq:04d}', 'yearly'),
+    'GE':  ('GE/{org}/{year}/{seq:04d}', 'yearly'),
+    'GRN': ('GRN/{org}/{year}/{seq:04d}', 'yearly'),
+    'DC':  ('DC/{org}/{year}/{seq:04d}', 'yearly'),
+    'DN':  ('DN/{org}/{year}/{seq:04d}', 'yearly'),
+    'INV': ('INV-{yyyymm}-{seq:04d}', 'never'),
+}
+
+
+def _locked_sequence(organization_id, document_type, seed, day):
+    """The sequence row, locked until the caller's transaction ends"""
+    try:
+        return DocumentSequence.objects.select_for_update().get(
+            organization_id=organization_id, document_type=document_type
+        )
+    except DocumentSequence.DoesNotExist:
+        pass
+
+    number_format, reset = DEFAULT_SEQUENCES.get(
+        document_type, (f"{document_type}/{{org}}/{{year}}/{{seq:04d}}", 'yearly')
+    )
+    sequence = DocumentSequence(
+        organization_id=organization_id,
+        document_type=document_type,
+        number_format=number_format,
+        reset=reset,
+    )
+    sequence.period = sequence.period_for(day)
+    # First use: continue from the numbers already issued
+    sequence.last_value = seed() if seed else 0
+    try:
+        with transaction.atomic():
+            sequence.save()
+        return sequence
+    except IntegrityError:
+        # Another request created it first; wait for its lock
+        return DocumentSequence.objects.select_for_update().get(
+            organization_id=organization_id, document_type=document_type
+        )
+
+
+@transaction.atomic
+def allocate_document_numbers(organization, document_type, count=1, seed=None, day=None):
+    """
+    Reserve `count` consecutive numbers for a document type in one
+    locked update and return them formatted.
+
+    Call this inside the transaction that saves the documents: the
+    sequence row stays locked until it commits, so concurrent requests
+    queue per organization and document type instead of colliding, and
+    a rollback returns the numbers. `seed` returns the last number
+    already used and is only called when the sequence is first created.
+    """
+    organization_id = getattr(organization, 'pk', organization)
+    day = day or timezone.localdate()
+
+    sequence = _locked_sequence(organization_id, document_type, seed, day)
+
+    period = sequence.period_for(day)
+    if period > sequence.period:
+        sequence.period = period
+        sequence.last_value = 0
+
+    first = sequence.last_value + 1
+    sequence.last_value += count
+    sequence.save(update_fields=['period', 'last_value', 'updated_at'])
+
+    return [sequence.format_number(value, day) for value in range(first, sequence.last_value + 1)]
+
+
+def next_document_number(organization, document_type, seed=None, day=None):
+    return allocate_document_numbers(organization, document_type, 1, seed, day)[0]
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class ProductionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.production'
\ No newline at end of file
+    name = 'apps.production'
+
+    def ready(self):
+        import apps.production.signals
@@ -0,0 +1,248 @@
+# apps/production/bom.py
+
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BillOfMaterial, BOMLine, BOMGraphVersion
+from apps.inventory.models import Item, ItemDependency
+
+
+BOM_GRAPH_TIMEOUT = 60 * 60 * 24   # old versions simply expire
+
+# Product structure sources:
+#   "bom"        → latest active BillOfMaterial per product (MRP)
+#   "dependency" → inventory ItemDependency (BOM status / item screens)
+BOM_SOURCES = ("bom", "dependency")
+
+
+class BOMCycleError(Exception):
+    """Raised when the product structure contains a loop"""
+
+    def __init__(self, items):
+        self.items = sorted(items)
+        super().__init__(f"Circular BOM detected involving item(s): {self.items}")
+
+
+def low_level_codes(children: dict, nodes=()) -> dict:
+    """
+    Low-level code per item: the deepest level at which it appears in any
+    product structure (0 = top level). Raises BOMCycleError on a loop.
+    """
+    indegree = defaultdict(int)
+    for parent, lines in children.items():
+        for component_id, _ in lines:
+            indegree[component_id] += 1
+
+    nodes = set(nodes) | set(children) | set(indegree)
+    levels = {n: 0 for n in nodes}
+    queue = deque(n for n in nodes if indegree[n] == 0)
+    visited = 0
+
+    while queue:
+        node = queue.popleft()
+        visited += 1
+        for component_id, _ in children.get(node, ()):
+            levels[component_id] = max(levels[component_id], levels[node] + 1)
+            indegree[component_id] -= 1
+            if indegree[component_id] == 0:
+                queue.append(component_id)
+
+    if visited < len(nodes):
+        # Leftover nodes are cycles plus whatever hangs below them;
+        # prune the leaves so only the looping items are reported.
+        looped = {n for n in nodes if indegree[n] > 0}
+        pruned = True
+        while pruned:
+            pruned = False
+            for n in list(looped):
+                if not any(c in looped for c, _ in children.get(n, ())):
+                    looped.discard(n)
+                    pruned = True
+        raise BOMCycleError(looped)
+
+    return levels
+
+
+class BOMGraph:
+    """
+    In-memory product structure for one organization.
+
+    children   product_id -> [(component_id, qty per unit)]
+    parents    component_id -> [(product_id, qty per unit)]   (where-used)
+    levels     item_id -> low-level code
+    flattened  product_id -> {component_id: total qty per unit, all levels}
+    """
+
+    def __init__(self, children, source="bom", version=None):
+        self.source = source
+        self.version = version
+        self.children = {p: list(lines) for p, lines in children.items()}
+        self.levels = low_level_codes(self.children)
+
+        self.parents = defaultdict(list)
+        for product_id, lines in self.children.items():
+            for component_id, qty in lines:
+                self.parents[component_id].append((product_id, qty))
+        self.parents = dict(self.parents)
+
+        # Deepest items first so every component is flattened before its parents
+        self.flattened = {}
+        for product_id in sorted(self.children, key=lambda i: -self.levels[i]):
+            flat = defaultdict(Decimal)
+            for component_id, qty in self.children[product_id]:
+                flat[component_id] += qty
+                for sub_id, sub_qty in self.flattened.get(component_id, {}).items():
+                    flat[sub_id] += qty * sub_qty
+            self.flattened[product_id] = dict(flat)
+
+    # ------------------------------------------------------------------
+    def explode(self, product_id, qty=Decimal('1')) -> dict:
+        """Total multi-level component requirement for `qty` units"""
+        qty = Decimal(str(qty))
+        return {
+            component_id: per_unit * qty
+            for component_id, per_unit in self.flattened.get(product_id, {}).items()
+        }
+
+    def components(self, product_id):
+        """Direct (single-level) components: [(component_id, qty per unit)]"""
+        return self.children.get(product_id, [])
+
+    def where_used(self, item_id):
+        """Direct parents: [(product_id, qty per unit)]"""
+        return self.parents.get(item_id, [])
+
+    def descendants(self, item_id) -> set:
+        return set(self.flattened.get(item_id, ()))
+
+    def ancestors(self, item_id) -> set:
+        found, stack = set(), [item_id]
+        while stack:
+            for parent_id, _ in self.parents.get(stack.pop(), ()):
+                if parent_id not in found:
+                    found.add(parent_id)
+                    stack.append(parent_id)
+        return found
+
+    def level(self, item_id) -> int:
+        return self.levels.get(item_id, 0)
+
+    def would_create_cycle(self, parent_id, component_id) -> bool:
+        """True if adding parent → component closes a loop"""
+        return parent_id == component_id or parent_id in self.descendants(component_id)
+
+
+# ----------------------------------------------------------------------
+# Loading / caching
+# ----------------------------------------------------------------------
+def load_bom_structure(organization_id, source="bom") -> dict:
+    """Read the product structure from the database (two queries at most)"""
+    children = defaultdict(list)
+
+    if source == "dependency":
+        for parent_id, child_id, qty in ItemDependency.objects.filter(
+            parent_item__organization_id=organization_id
+        ).values_list('parent_item_id', 'child_item_id', 'quantity'):
+            children[parent_id].append((child_id, qty))
+        return dict(children)
+
+    # Latest active BOM version per product
+    latest_bom = {}
+    for bom_id, product_id in BillOfMaterial.objects.filter(
+        product__organization_id=organization_id,
+        is_active=True
+    ).order_by('product_id', '-created_at').values_list('id', 'product_id'):
+        latest_bom.setdefault(product_id, bom_id)
+
+    bom_product = {bom_id: product_id for product_id, bom_id in latest_bom.items()}
+    children = {product_id: [] for product_id in latest_bom}
+    for bom_id, component_id, qty in BOMLine.objects.filter(
+        bom_id__in=bom_product
+    ).values_list('bom_id', 'component_id', 'quantity'):
+        children[bom_product[bom_id]].append((component_id, qty))
+    return children
+
+
+def get_bom_version(organization_id) -> int:
+    return BOMGraphVersion.objects.filter(
+        organization_id=organization_id
+    ).values_list('version', flat=True).first() or 0
+
+
+def get_bom_graph(organization, source="bom") -> BOMGraph:
+    """
+    Cached BOMGraph for an organization. The cache key carries the
+    organization's BOM version, so a bump makes every process rebuild.
+    The bump's timestamp is part of the key too: a version number seen
+    inside a transaction that later rolls back is reused by the next
+    bump, and must not find the rolled-back structure in the cache.
+    """
+    organization_id = getattr(organization, 'pk', organization)
+    version, updated_at = BOMGraphVersion.objects.filter(
+        organization_id=organization_id
+    ).values_list('version', 'updated_at').first() or (0, None)
+    stamp = updated_at.timestamp() if updated_at else 0
+    key = f"bom_graph:{source}:{organization_id}:{version}:{stamp}"
+
+    graph = cache.get(key)
+    if graph is None:
+        graph = BOMGraph(load_bom_structure(organization_id, source), source, version)
+        cache.set(key, graph, BOM_GRAPH_TIMEOUT)
+    return graph
+
+
+def invalidate_bom_graph(organization_id):
+    """Bump the organization's BOM version (call on any structure change)"""
+    if not organization_id:
+        return
+    updated = BOMGraphVersion.objects.filter(
+        organization_id=organization_id
+    ).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        BOMGraphVersion.objects.get_or_create(
+            organization_id=organization_id, defaults={'version': 1}
+        )
+
+
+def _path_between(children, start, target):
+    """Items on a path start → ... → target through `children`, or None"""
+    previous = {start: None}
+    stack = [start]
+    while stack:
+        node = stack.pop()
+        if node == target:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            return path
+        for component_id, _ in children.get(node, ()):
+            if component_id not in previous:
+                previous[component_id] = node
+                stack.append(component_id)
+    return None
+
+
+def check_bom_cycle(organization_id, parent_id, component_id, source="bom"):
+    """
+    Raise BOMCycleError if parent → component would create a loop, i.e.
+    if parent is already reachable from component. Only this edge is
+    judged: a loop elsewhere in the organization's data does not block
+    the edit (nor the edits that break it).
+    """
+    if parent_id == component_id:
+        raise BOMCycleError({parent_id})
+
+    try:
+        children = get_bom_graph(organization_id, source).children
+    except BOMCycleError:
+        # The stored structure already loops, so no graph can be built
+        children = load_bom_structure(organization_id, source)
+
+    path = _path_between(children, component_id, parent_id)
+    if path:
+        raise BOMCycleError(path)
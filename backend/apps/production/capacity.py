@@ -0,0 +1,618 @@
+# apps/production/capacity.py
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    PlannedOrder, RoutingOperation, ManufacturingOrder, MOOperation, WorkOrder,
+    MachineBookingVersion,
+)
+from apps.inventory.models import Machine
+
+
+def _accumulate(deltas):
+    """Prefix sum of a difference array → per-day values"""
+    total, out = 0.0, []
+    for d in deltas[:-1]:
+        total += d
+        out.append(total)
+    return out
+
+
+class MachineLoadEngine:
+    """
+    Machine load for a date window, computed in bulk.
+
+    Machines, routing operations and open planned orders are each read
+    with one query. Every (operation, planned order) pair spreads its
+    hours evenly over the order's days; per-machine daily buckets are
+    built with a difference array over the window, so the cost is
+    O(machines × days + orders) with no per-row queries.
+    """
+
+    def __init__(self, organization, start_date, end_date):
+        self.organization = organization
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days = (end_date - start_date).days + 1
+
+        self.machines = []
+        self.operations = defaultdict(list)   # product_id -> [operation row]
+        self.orders = []
+
+    def load(self):
+        org = self.organization
+
+        self.machines = list(Machine.objects.filter(organization=org, is_active=True))
+
+        for op in RoutingOperation.objects.filter(
+            machine__in=self.machines,
+            routing__product__organization=org
+        ).values('id', 'machine_id', 'operation_name', 'expected_hours', 'routing__product_id'):
+            self.operations[op['routing__product_id']].append(op)
+
+        self.orders = list(
+            PlannedOrder.objects.filter(
+                product_id__in=self.operations,
+                planned_start__lte=self.end_date,
+                planned_finish__gte=self.start_date,
+                status__in=['planned', 'confirmed']
+            ).values(
+                'id', 'product_id', 'product__name', 'quantity',
+                'planned_start', 'planned_finish', 'scheduling_type'
+            ).order_by('planned_start', 'id')
+        )
+        return self
+
+    def _day_index(self, day):
+        return min(max((day - self.start_date).days, 0), self.days - 1)
+
+    def compute(self):
+        """Returns one load dict per machine, highest utilization first"""
+        deltas = {m.id: [0.0] * (self.days + 1) for m in self.machines}
+        totals = defaultdict(float)
+        details = defaultdict(list)
+
+        for po in self.orders:
+            order_days = (po['planned_finish'] - po['planned_start']).days + 1
+            first = self._day_index(po['planned_start'])
+            last = self._day_index(po['planned_finish'])
+
+            for op in self.operations[po['product_id']]:
+                load_hours = float(op['expected_hours'] or 0) * float(po['quantity'])
+                machine_id = op['machine_id']
+                totals[machine_id] += load_hours
+                details[machine_id].append({
+                    'planned_order_id': po['id'],
+                    'product': po['product__name'],
+                    'quantity': po['quantity'],
+                    'operation': op['operation_name'],
+                    'load_hours': round(load_hours, 2),
+                    'start_date': po['planned_start'],
+                    'finish_date': po['planned_finish'],
+                    'scheduling_type': po['scheduling_type']
+                })
+
+                # Only the part of the order inside the window lands in buckets
+                per_day = load_hours / max(order_days, 1)
+                deltas[machine_id][first] += per_day
+                deltas[machine_id][last + 1] -= per_day
+
+        result = []
+        for machine in self.machines:
+            total_capacity = machine.get_effective_capacity(days=self.days)
+            daily_capacity = float(machine.get_effective_capacity(days=1))
+            daily = _accumulate(deltas[machine.id])
+
+            load_data = {
+                'machine_id': machine.id,
+                'machine_name': machine.name,
+                'machine_code': machine.code,
+                'work_center_type': machine.work_center_type,
+                'maintenance_status': machine.maintenance_status,
+                'capacity_per_day': float(machine.capacity_per_day_hours),
+                'efficiency_percentage': float(machine.efficiency_percentage),
+                'utilization_percentage': 0,
+                'effective_capacity': total_capacity,
+                'total_load': totals[machine.id],
+                'remaining_capacity': 0,
+                'peak_daily_load': round(max(daily, default=0.0), 2),
+                'overloaded_days': sum(1 for h in daily if h > daily_capacity + 1e-9),
+                'daily_load': [
+                    {
+                        'date': self.start_date + timedelta(days=i),
+                        'load_hours': round(hours, 2),
+                        'capacity_hours': daily_capacity,
+                        'utilization_percentage': (
+                            round(hours / daily_capacity * 100, 2) if daily_capacity > 0 else 0
+                        ),
+                    }
+                    for i, hours in enumerate(daily)
+                ],
+                'load_details': details[machine.id],
+            }
+
+            if total_capacity > 0:
+                load_data['utilization_percentage'] = round(
+                    (load_data['total_load'] / float(total_capacity)) * 100, 2
+                )
+                load_data['remaining_capacity'] = round(float(total_capacity) - load_data['total_load'], 2)
+
+            result.append(load_data)
+
+        result.sort(key=lambda x: x['utilization_percentage'], reverse=True)
+        return result
+
+    def run(self):
+        return self.load().compute()
+
+
+# ----------------------------------------------------------------------
+# Machine booking index
+# ----------------------------------------------------------------------
+DEFAULT_RUN_TIME_PER_UNIT = Decimal('0.05')   # hours, same fallback as ProductionService
+DEFAULT_HORIZON_DAYS = 120
+ACTIVE_WORK_ORDER_STATUSES = ['draft', 'in_progress', 'scheduled']
+BUSY_WORK_ORDER_STATUSES = ['in_progress', 'scheduled']   # what "machine busy" has always meant
+ACTIVE_MO_STATUSES = ['draft', 'in_progress']
+
+
+class Booking(NamedTuple):
+    start: date
+    finish: date
+    machine_id: int
+    kind: str                    # "work_order" | "mo_operation"
+    ref_id: int                  # WorkOrder id / ManufacturingOrder id
+    manufacturing_order_id: int
+    status: str
+    hours: float
+
+
+class IntervalTree:
+    """
+    Static augmented interval tree: intervals sorted by start, laid out as
+    an implicit balanced BST, each node keeping the max finish of its
+    subtree. Overlap queries cost O(log n + matches).
+    """
+
+    def __init__(self, intervals):
+        self.items = sorted(intervals, key=lambda b: (b.start, b.finish))
+        self.max_finish = [None] * len(self.items)
+        self._build(0, len(self.items))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        best = self.items[mid].finish
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > best:
+                best = child
+        self.max_finish[mid] = best
+        return best
+
+    def overlapping(self, start, finish):
+        """Intervals with start <= finish and finish >= start, by start"""
+        found = []
+        self._search(0, len(self.items), start, finish, found)
+        return found
+
+    def _search(self, lo, hi, start, finish, found):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_finish[mid] < start:
+            return  # nothing in this subtree reaches the window
+        self._search(lo, mid, start, finish, found)
+        item = self.items[mid]
+        if item.start <= finish:
+            if item.finish >= start:
+                found.append(item)
+            self._search(mid + 1, hi, start, finish, found)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class MachineBookingIndex:
+    """
+    All active machine bookings of one organization: WorkOrders, plus the
+    MOOperations of dated MOs that have no work orders yet. One interval
+    tree per machine answers availability for every machine at once.
+    """
+
+    def __init__(self, organization_id, version=None):
+        self.organization_id = organization_id
+        self.version = version
+
+        self.machines = {}
+        self.routing_hours = {}                  # product_id -> hours per unit
+        self.routing_machines = defaultdict(set) # product_id -> {machine_id}
+        self.trees = {}
+
+    def load(self):
+        org_id = self.organization_id
+
+        self.machines = {
+            m.id: m for m in Machine.objects.filter(organization_id=org_id, is_active=True)
+        }
+
+        for product_id, machine_id, hours in RoutingOperation.objects.filter(
+            routing__product__organization_id=org_id,
+            routing__is_active=True,
+        ).values_list('routing__product_id', 'machine_id', 'expected_hours'):
+            self.routing_hours[product_id] = self.routing_hours.get(product_id, Decimal('0')) + (hours or Decimal('0'))
+            self.routing_machines[product_id].add(machine_id)
+
+        bookings = defaultdict(list)
+
+        mos_with_work_orders = set()
+        for wo in WorkOrder.objects.filter(
+            machine_id__in=self.machines,
+            status__in=ACTIVE_WORK_ORDER_STATUSES,
+            start_date__isnull=False,
+        ).values(
+            'id', 'machine_id', 'manufacturing_order_id', 'manufacturing_order__product_id',
+            'quantity', 'start_date', 'finish_date', 'status'
+        ):
+            mos_with_work_orders.add(wo['manufacturing_order_id'])
+            bookings[wo['machine_id']].append(Booking(
+                start=wo['start_date'],
+                finish=max(wo['finish_date'] or wo['start_date'], wo['start_date']),
+                machine_id=wo['machine_id'],
+                kind='work_order',
+                ref_id=wo['id'],
+                manufacturing_order_id=wo['manufacturing_order_id'],
+                status=wo['status'],
+                hours=self.required_hours(
+                    wo['manufacturing_order__product_id'], wo['quantity'], wo['machine_id']
+                ),
+            ))
+
+        for op in MOOperation.objects.filter(
+            machine_id__in=self.machines,
+            manufacturing_order__status__in=ACTIVE_MO_STATUSES,
+            manufacturing_order__start_date__isnull=False,
+            manufacturing_order__finish_date__isnull=False,
+        ).exclude(
+            manufacturing_order_id__in=mos_with_work_orders
+        ).values(
+            'machine_id', 'manufacturing_order_id', 'manufacturing_order__product_id',
+            'manufacturing_order__quantity', 'manufacturing_order__status',
+            'manufacturing_order__start_date', 'manufacturing_order__finish_date'
+        ):
+            start = op['manufacturing_order__start_date']
+            bookings[op['machine_id']].append(Booking(
+                start=start,
+                finish=max(op['manufacturing_order__finish_date'], start),
+                machine_id=op['machine_id'],
+                kind='mo_operation',
+                ref_id=op['manufacturing_order_id'],
+                manufacturing_order_id=op['manufacturing_order_id'],
+                status=op['manufacturing_order__status'],
+                hours=self.required_hours(
+                    op['manufacturing_order__product_id'],
+                    op['manufacturing_order__quantity'],
+                    op['machine_id']
+                ),
+            ))
+
+        self.trees = {m: IntervalTree(bookings.get(m, ())) for m in self.machines}
+        return self
+
+    # ------------------------------------------------------------------
+    def required_hours(self, product_id, quantity, machine_id) -> float:
+        """Queue + setup + run time of `quantity` on one machine"""
+        machine = self.machines.get(machine_id)
+        if machine is None:
+            return 0.0
+        per_unit = self.routing_hours.get(product_id) or DEFAULT_RUN_TIME_PER_UNIT
+        return float(machine.calculate_lead_time(quantity, per_unit))
+
+    def bookings(self, machine_id=None):
+        trees = [self.trees[machine_id]] if machine_id else self.trees.values()
+        for tree in trees:
+            yield from tree.items
+
+    def conflicts(self, machine_id, start, finish, statuses=BUSY_WORK_ORDER_STATUSES, kinds=('work_order',)):
+        """Bookings overlapping [start, finish]; defaults match is_machine_available"""
+        tree = self.trees.get(machine_id)
+        if tree is None:
+            return []
+        return [
+            b for b in tree.overlapping(start, finish)
+            if b.kind in kinds and (statuses is None or b.status in statuses)
+        ]
+
+    def booked_hours(self, machine_id, start, finish) -> float:
+        """Hours of every active booking that fall inside [start, finish]"""
+        total = 0.0
+        for b in self.trees.get(machine_id, IntervalTree(())).overlapping(start, finish):
+            days = (b.finish - b.start).days + 1
+            inside = (min(b.finish, finish) - max(b.start, start)).days + 1
+            total += b.hours * inside / days
+        return total
+
+    def availability(self, start, finish, hours=0, machine_ids=None):
+        """
+        Free/busy for every machine (or `machine_ids`) over [start, finish]:
+        {machine_id: {is_busy, capacity_hours, booked_hours, available_hours,
+                      has_capacity, conflicts}}
+        """
+        days = (finish - start).days + 1
+        result = {}
+        for machine_id, machine in self.machines.items():
+            if machine_ids and machine_id not in machine_ids:
+                continue
+            conflicts = self.conflicts(machine_id, start, finish)
+            capacity = float(machine.get_effective_capacity(days=days))
+            if machine.maintenance_status != 'operational':
+                capacity = 0.0
+            booked = self.booked_hours(machine_id, start, finish)
+            available = capacity - booked
+            result[machine_id] = {
+                'is_busy': bool(conflicts),
+                'capacity_hours': round(capacity, 2),
+                'booked_hours': round(booked, 2),
+                'available_hours': round(available, 2),
+                'has_capacity': available >= float(hours or 0) and capacity > 0,
+                'conflicts': conflicts,
+            }
+        return result
+
+
+_booking_indexes = {}   # organization_id -> MachineBookingIndex (this process)
+
+
+def get_booking_version(organization_id) -> int:
+    return MachineBookingVersion.objects.filter(
+        organization_id=organization_id
+    ).values_list('version', flat=True).first() or 0
+
+
+def get_booking_index(organization) -> MachineBookingIndex:
+    """
+    In-process booking index for an organization, rebuilt when its
+    MachineBookingVersion moved (one small query per call otherwise).
+    """
+    organization_id = getattr(organization, 'pk', organization)
+    version = get_booking_version(organization_id)
+
+    index = _booking_indexes.get(organization_id)
+    if index is None or index.version != version:
+        index = MachineBookingIndex(organization_id, version).load()
+        _booking_indexes[organization_id] = index
+    return index
+
+
+def invalidate_booking_index(organization_id):
+    """Bump the organization's booking version (call after any booking change)"""
+    if not organization_id:
+        return
+    _booking_indexes.pop(organization_id, None)
+    updated = MachineBookingVersion.objects.filter(
+        organization_id=organization_id
+    ).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        MachineBookingVersion.objects.get_or_create(
+            organization_id=organization_id, defaults={'version': 1}
+        )
+
+
+# ----------------------------------------------------------------------
+# Finite-capacity scheduling
+# ----------------------------------------------------------------------
+class MachineCalendar:
+    """
+    Committed hours per machine per day, plus effective daily capacity
+    (capacity_per_day_hours × efficiency × utilization).
+    """
+
+    def __init__(self, machines):
+        self.capacity = {m.id: float(m.get_effective_capacity(days=1)) for m in machines}
+        self.committed = {m.id: defaultdict(float) for m in machines}
+
+    def add(self, machine_id, start, finish, hours):
+        """Spread `hours` evenly over start..finish (inclusive)"""
+        if machine_id not in self.committed or hours <= 0:
+            return
+        finish = max(finish, start)
+        days = (finish - start).days + 1
+        per_day = hours / days
+        for i in range(days):
+            self.committed[machine_id][start + timedelta(days=i)] += per_day
+
+    def reserve(self, machine_id, allocation):
+        """Book a slot returned by earliest_slot()"""
+        for day, hours in allocation:
+            self.committed[machine_id][day] += hours
+
+    def free(self, machine_id, day):
+        return max(self.capacity[machine_id] - self.committed[machine_id].get(day, 0.0), 0.0)
+
+    def earliest_slot(self, machine_id, hours, not_before, horizon_end):
+        """
+        Fill free capacity day by day from `not_before`. Returns
+        (start, finish, [(day, hours)]) or None if it doesn't fit before
+        the horizon.
+        """
+        if self.capacity[machine_id] <= 0:
+            return None
+
+        remaining = hours
+        allocation = []
+        day = not_before
+        while day <= horizon_end:
+            free = self.free(machine_id, day)
+            if free > 1e-9:
+                take = min(free, remaining)
+                allocation.append((day, take))
+                remaining -= take
+                if remaining <= 1e-9:
+                    return allocation[0][0], day, allocation
+            day += timedelta(days=1)
+        return None
+
+
+class FiniteCapacityScheduler:
+    """
+    Assigns ManufacturingOrders to machines against finite capacity.
+
+    Committed load is taken from the organization's MachineBookingIndex
+    into a MachineCalendar; each order is then put
+    on the candidate machine where it finishes earliest, and its hours are
+    booked before the next order is placed.
+
+    Like ProductionService, one machine takes the whole order (one work
+    order per MO): candidates are the machines in the product's active
+    routing (or every operational machine without a routing), and the
+    run time per unit is the routing's total expected hours.
+    """
+
+    def __init__(self, organization, start_date=None, horizon_days=DEFAULT_HORIZON_DAYS):
+        self.organization = organization
+        self.start_date = start_date or timezone.now().date() + timedelta(days=1)
+        self.horizon_end = self.start_date + timedelta(days=horizon_days)
+
+        self.index = None
+        self.machines = {}
+        self.calendar = None
+
+    # ------------------------------------------------------------------
+    def load(self, exclude_mo_ids=()):
+        """
+        Build the calendar from the booking index. The dated routing
+        operations of the orders being placed are left out (they are the
+        load being re-placed); committed work orders always count.
+        """
+        self.index = get_booking_index(self.organization)
+        self.machines = {
+            machine_id: m for machine_id, m in self.index.machines.items()
+            if m.maintenance_status == 'operational'
+        }
+        self.calendar = MachineCalendar(self.machines.values())
+
+        exclude_mo_ids = set(exclude_mo_ids)
+        for b in self.index.bookings():
+            if b.finish < self.start_date:
+                continue
+            if b.kind == 'mo_operation' and b.manufacturing_order_id in exclude_mo_ids:
+                continue
+            self.calendar.add(b.machine_id, b.start, b.finish, b.hours)
+        return self
+
+    # ------------------------------------------------------------------
+    def candidate_machines(self, product_id):
+        routed = self.index.routing_machines.get(product_id)
+        if routed:
+            return sorted(m for m in routed if m in self.machines)
+        return list(self.machines)
+
+    def required_hours(self, product_id, quantity, machine_id) -> float:
+        return self.index.required_hours(product_id, quantity, machine_id)
+
+    def schedule(self, manufacturing_orders, machine_ids=None):
+        """
+        Place orders in (start_date, id) order. Returns one dict per order:
+        the proposed machine/start/finish/hours, or an `error`.
+        """
+        orders = sorted(
+            manufacturing_orders,
+            key=lambda mo: (mo.start_date or self.start_date, mo.id)
+        )
+        proposals = []
+
+        for mo in orders:
+            not_before = max(mo.start_date or self.start_date, self.start_date)
+            candidates = self.candidate_machines(mo.product_id)
+            if machine_ids:
+                candidates = [m for m in candidates if m in machine_ids]
+
+            best = None
+            for machine_id in candidates:
+                hours = self.required_hours(mo.product_id, mo.quantity, machine_id)
+                slot = self.calendar.earliest_slot(machine_id, hours, not_before, self.horizon_end)
+                if slot is None:
+                    continue
+                start, finish, allocation = slot
+                key = (finish, start, machine_id)
+                if best is None or key < best[0]:
+                    best = (key, machine_id, hours, allocation)
+
+            if best is None:
+                proposals.append({
+                    'manufacturing_order_id': mo.id,
+                    'error': (
+                        "No capacity before "
+                        f"{self.horizon_end.isoformat()}" if candidates
+                        else "No operational machine in the product routing"
+                    ),
+                })
+                continue
+
+            (finish, start, _), machine_id, hours, allocation = best
+            self.calendar.reserve(machine_id, allocation)
+            proposals.append({
+                'manufacturing_order_id': mo.id,
+                'product_id': mo.product_id,
+                'quantity': float(mo.quantity),
+                'machine_id': machine_id,
+                'machine_name': self.machines[machine_id].name,
+                'start_date': start,
+                'finish_date': finish,
+                'hours': round(hours, 2),
+            })
+
+        return proposals
+
+    @transaction.atomic
+    def commit(self, manufacturing_orders, proposals):
+        """
+        Book the scheduled orders: one 'scheduled' WorkOrder each (a busy
+        status, so availability checks see it) on the chosen machine, and
+        the MO moves to in_progress with the scheduled dates. Orders another
+        request committed meanwhile (no longer draft, or already holding
+        a work order) are skipped and their proposal gets an `error`.
+        """
+        by_id = {mo.id: mo for mo in manufacturing_orders}
+        placed = [p for p in proposals if 'error' not in p]
+
+        open_ids = set(
+            ManufacturingOrder.objects.select_for_update()
+            .filter(id__in=[p['manufacturing_order_id'] for p in placed], status='draft')
+            .values_list('id', flat=True)
+        )
+        open_ids -= set(
+            WorkOrder.objects.filter(manufacturing_order_id__in=open_ids)
+            .values_list('manufacturing_order_id', flat=True)
+        )
+
+        work_orders, dated = [], []
+        for p in placed:
+            if p['manufacturing_order_id'] not in open_ids:
+                p['error'] = "Already scheduled"
+                continue
+            mo = by_id[p['manufacturing_order_id']]
+            mo.start_date = p['start_date']
+            mo.finish_date = p['finish_date']
+            mo.status = 'in_progress'
+            dated.append(mo)
+            work_orders.append(WorkOrder(
+                manufacturing_order=mo,
+                machine_id=p['machine_id'],
+                quantity=mo.quantity,
+                status='scheduled',
+                start_date=p['start_date'],
+                finish_date=p['finish_date'],
+            ))
+
+        ManufacturingOrder.objects.bulk_update(dated, ['start_date', 'finish_date', 'status'])
+        created = WorkOrder.objects.bulk_create(work_orders)
+        invalidate_booking_index(getattr(self.organization, 'pk', self.organization))
+        return created
@@ -0,0 +1,195 @@
+# apps/production/jobs.py
+
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MRPJob
+from .mrp import MRPEngine, NetChangeMRPEngine, MRPCancelled, run_single_item_mrp
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker has not reported progress for this long is
+# taken to be dead (crashed or killed) and is requeued, or failed once
+# it has been tried MAX_JOB_ATTEMPTS times.
+STALE_JOB_TIMEOUT = timedelta(
+    seconds=getattr(settings, "MRP_JOB_STALE_SECONDS", 30 * 60)
+)
+MAX_JOB_ATTEMPTS = 2
+
+
+class JobReclaimed(Exception):
+    """The job was given up as stale while this worker was still running it"""
+
+
+def enqueue_mrp_job(organization, job_type="full", item=None, created_by=None):
+    """Queue an MRP run; the worker (`manage.py mrp_worker`) picks it up"""
+    return MRPJob.objects.create(
+        organization=organization,
+        job_type=job_type,
+        item=item,
+        created_by=created_by,
+        stage="Queued",
+    )
+
+
+def reclaim_stale_jobs(now=None):
+    """
+    Requeue (or fail, after MAX_JOB_ATTEMPTS) running jobs whose worker
+    has stopped sending heartbeats. Returns the number of jobs touched.
+    """
+    now = now or timezone.now()
+    cutoff = now - STALE_JOB_TIMEOUT
+    reclaimed = 0
+
+    with transaction.atomic():
+        stale = (
+            MRPJob.objects.select_for_update(skip_locked=True)
+            .filter(status="running", heartbeat_at__lt=cutoff)
+        )
+        for job in stale:
+            if job.attempts < MAX_JOB_ATTEMPTS:
+                logger.warning("Requeueing stale MRP job %s", job.id)
+                job.status = "queued"
+                job.stage = "Requeued (worker stopped responding)"
+                job.progress = 0
+                fields = ["status", "stage", "progress"]
+            else:
+                logger.error("Failing stale MRP job %s after %s attempts", job.id, job.attempts)
+                job.status = "failed"
+                job.stage = "Failed"
+                job.error = (
+                    f"Worker stopped responding (no heartbeat since {job.heartbeat_at:%Y-%m-%d %H:%M:%S}); "
+                    f"gave up after {job.attempts} attempts"
+                )
+                job.finished_at = now
+                fields = ["status", "stage", "error", "finished_at"]
+            job.save(update_fields=fields)
+            reclaimed += 1
+    return reclaimed
+
+
+def claim_next_job():
+    """
+    Atomically take the oldest queued job and mark it running.
+    SKIP LOCKED lets several workers poll the same table safely.
+    Stale running jobs are requeued first.
+    """
+    reclaim_stale_jobs()
+
+    with transaction.atomic():
+        job = (
+            MRPJob.objects.select_for_update(skip_locked=True)
+            .filter(status="queued")
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+
+        now = timezone.now()
+        job.status = "running"
+        job.stage = "Starting"
+        job.started_at = now
+        job.heartbeat_at = now
+        job.attempts += 1
+        job.save(update_fields=["status", "stage", "started_at", "heartbeat_at", "attempts"])
+        return job
+
+
+def _progress_callback(job):
+    """
+    Progress hook handed to the MRP code. Writes stage/percent and the
+    heartbeat with a plain UPDATE (outside the run's own transaction),
+    aborts the run when a cancel was requested, and stops it when the
+    job was reclaimed as stale in the meantime.
+    """
+    def progress(stage, percent):
+        updated = MRPJob.objects.filter(
+            id=job.id, status="running", attempts=job.attempts
+        ).update(stage=stage[:100], progress=percent, heartbeat_at=timezone.now())
+        if not updated:
+            raise JobReclaimed(f"MRP job {job.id} was reclaimed")
+        if MRPJob.objects.filter(id=job.id, cancel_requested=True).exists():
+            raise MRPCancelled("Cancelled by user")
+    return progress
+
+
+def execute_job(job):
+    """Run a claimed job to completion and record the outcome on the row"""
+    progress = _progress_callback(job)
+    fields = ["status", "stage", "progress", "finished_at"]
+
+    try:
+        if job.job_type == "single_item":
+            result = run_single_item_mrp(
+                job.organization, job.item,
+                created_by=job.created_by,
+                progress=progress,
+            )
+            job.production_plan_id = result.get("production_plan_id")
+        else:
+            engine_class = NetChangeMRPEngine if job.job_type == "net_change" else MRPEngine
+            engine = engine_class(job.organization, progress=progress)
+            plan = engine.run(created_by=job.created_by)
+            job.production_plan = plan
+            result = {
+                "production_plan_id": plan.id,
+                "reference_date": engine.ref_date.isoformat(),
+                "planned_orders": len(engine.planned_orders),
+                "purchase_requisitions": len(engine.requisitions),
+                "gross_items": len(engine.gross_requirements),
+            }
+            if job.job_type == "net_change":
+                result.update({
+                    "changed_items": len(engine.changed),
+                    "replanned_items": len(engine.affected),
+                    "created": engine.created,
+                    "updated": engine.updated,
+                    "cancelled": engine.cancelled,
+                })
+
+        job.status = "completed"
+        job.stage = "Done"
+        job.progress = 100
+        job.result = result
+        fields += ["production_plan", "result"]
+
+    except JobReclaimed:
+        # Another worker owns the job now; leave its row alone
+        logger.warning("MRP job %s was reclaimed while running", job.id)
+        return job
+
+    except MRPCancelled:
+        job.status = "cancelled"
+        job.stage = "Cancelled"
+
+    except Exception as e:
+        logger.exception("MRP job %s failed", job.id)
+        job.status = "failed"
+        job.stage = "Failed"
+        job.error = f"{e}\n\n{traceback.format_exc()}"
+        fields.append("error")
+
+    job.finished_at = timezone.now()
+    # Only record the outcome if the job was not reclaimed meanwhile
+    MRPJob.objects.filter(id=job.id, status="running", attempts=job.attempts).update(
+        **{field: getattr(job, field) for field in fields}
+    )
+    return job
+
+
+def run_pending_jobs(limit=None):
+    """Process queued jobs until the queue is empty (or `limit` reached)"""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        execute_job(job)
+        processed += 1
+    return processed
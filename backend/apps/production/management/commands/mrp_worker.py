@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.production.jobs import claim_next_job, execute_job
+
+
+class Command(BaseCommand):
+    help = "Process queued MRP jobs (run as a long-lived worker, or with --once from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the queue once and exit instead of polling"
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when the queue is empty (default: 5)"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("MRP worker started")
+
+        while True:
+            job = claim_next_job()
+
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Running MRP job {job.id} ({job.job_type}) for org {job.organization_id}")
+            job = execute_job(job)
+
+            style = self.style.SUCCESS if job.status == "completed" else self.style.WARNING
+            self.stdout.write(style(f"MRP job {job.id} {job.status}"))
+
+        self.stdout.write("MRP queue empty")
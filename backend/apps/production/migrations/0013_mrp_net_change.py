@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 19:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0027_stockbalance'),
+        ('organizations', '0020_alter_organizationuser_role'),
+        ('production', '0012_mrpjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mrpjob',
+            name='job_type',
+            field=models.CharField(choices=[('full', 'Full Regeneration'), ('net_change', 'Net Change'), ('single_item', 'Single Item')], default='full', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='MRPNetChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(help_text='demand / stock / supply / bom', max_length=20)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mrp_net_change', to='inventory.item')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mrp_net_changes', to='organizations.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', 'changed_at'], name='production__organiz_ca6813_idx')],
+            },
+        ),
+    ]
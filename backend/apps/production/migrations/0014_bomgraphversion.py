@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-17 19:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0020_alter_organizationuser_role'),
+        ('production', '0013_mrp_net_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BOMGraphVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='bom_graph_version', to='organizations.organization')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-17 19:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps_hr', '0029_merge_20260110_1302'),
+        ('inventory', '0029_inventory_costing'),
+        ('organizations', '0020_alter_organizationuser_role'),
+        ('production', '0015_machinebookingversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='departmenttransaction',
+            index=models.Index(fields=['organization', 'id'], name='production__organiz_44fd15_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0016_departmenttransaction_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mrpjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mrpjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last progress report from the worker running the job', null=True),
+        ),
+    ]
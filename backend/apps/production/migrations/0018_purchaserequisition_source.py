@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:21
+
+from django.db import migrations, models
+
+
+def mark_existing_as_mrp(apps, schema_editor):
+    # Until now MRP was the only code path that created requisitions
+    PurchaseRequisition = apps.get_model('production', 'PurchaseRequisition')
+    PurchaseRequisition.objects.update(source='mrp')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0017_mrpjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaserequisition',
+            name='source',
+            field=models.CharField(choices=[('mrp', 'MRP Proposal'), ('manual', 'Manual')], default='manual', max_length=10),
+        ),
+        migrations.RunPython(mark_existing_as_mrp, migrations.RunPython.noop),
+    ]
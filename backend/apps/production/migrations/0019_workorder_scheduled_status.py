@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0018_purchaserequisition_source'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workorder',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('scheduled', 'Scheduled'), ('in_progress', 'In Progress'), ('done', 'Done')], default='draft', max_length=20),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.conf import settings
 from decimal import Decimal
 from datetime import timedelta
@@ -200,6 +201,7 @@ class DepartmentTransaction(models.Model):
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=['status', 'current_department']),
+            models.Index(fields=['organization', 'id']),   # transfer history paging
         ]
 
     def __str__(self):
@@ -331,6 +333,16 @@ class PlannedOrder(models.Model):
 
 
 class PurchaseRequisition(models.Model):
+    """
+    Material to buy. MRP writes its proposals with bulk operations and
+    source="mrp"; any save() of a row (admin, API, shell) is a change by
+    hand and marks it "manual", so net-change MRP no longer touches it.
+    """
+    SOURCE_CHOICES = [
+        ("mrp", "MRP Proposal"),
+        ("manual", "Manual"),
+    ]
+
     production_plan = models.ForeignKey(ProductionPlan, on_delete=models.CASCADE, related_name="requisitions")
     material = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=12, decimal_places=2)
@@ -340,6 +352,125 @@ class PurchaseRequisition(models.Model):
         default="open",
         choices=[("open", "Open"), ("converted", "Converted to PO")]
     )
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default="manual")
+
+    def save(self, *args, **kwargs):
+        self.source = "manual"
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "source"}
+        super().save(*args, **kwargs)
+
+
+class MRPJob(models.Model):
+    """
+    Background MRP run. Created by the start endpoint, picked up by
+    `manage.py mrp_worker` (DB-backed queue, no broker needed).
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+        ("cancelled", "Cancelled"),
+    ]
+    JOB_TYPE_CHOICES = [
+        ("full", "Full Regeneration"),
+        ("net_change", "Net Change"),
+        ("single_item", "Single Item"),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="mrp_jobs")
+    job_type = models.CharField(max_length=20, choices=JOB_TYPE_CHOICES, default="full")
+    item = models.ForeignKey(
+        Item,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        help_text="Product to plan for single-item jobs"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    progress = models.PositiveSmallIntegerField(default=0, help_text="0-100")
+    stage = models.CharField(max_length=100, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+
+    production_plan = models.ForeignKey(
+        ProductionPlan,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="mrp_jobs"
+    )
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last progress report from the worker running the job"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"MRP Job {self.id} ({self.job_type}) - {self.status}"
+
+    @property
+    def is_finished(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+
+class MachineBookingVersion(models.Model):
+    """
+    Version of an organization's machine bookings (work orders, dated MO
+    operations, machines, routings). Bumped on every change; in-process
+    booking indexes rebuild when it moves (see production/capacity.py).
+    """
+    organization = models.OneToOneField(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name="machine_booking_version"
+    )
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.organization} bookings v{self.version}"
+
+
+class MRPNetChange(models.Model):
+    """
+    Net-change log: one row per item whose demand, supply or BOM changed
+    since the last MRP run. Written by signal handlers, consumed (deleted)
+    by MRP runs.
+    """
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="mrp_net_changes"
+    )
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, related_name="mrp_net_change")
+    reason = models.CharField(max_length=20, help_text="demand / stock / supply / bom")
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization', 'changed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.item} ({self.reason})"
 
 
 class ManufacturingOrder(models.Model):
@@ -413,6 +544,24 @@ class BOMLine(models.Model):
         return f"{self.component} × {self.quantity}"
 
 
+class BOMGraphVersion(models.Model):
+    """
+    Version of an organization's product structure. Bumped on every
+    BillOfMaterial / BOMLine / ItemDependency change; cached BOM graphs
+    are keyed by it (see production/bom.py).
+    """
+    organization = models.OneToOneField(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name="bom_graph_version"
+    )
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.organization} BOM v{self.version}"
+
+
 from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
@@ -515,7 +664,12 @@ class WorkOrder(models.Model):
     quantity = models.DecimalField(max_digits=12, decimal_places=2)
     status = models.CharField(
         max_length=20,
-        choices=[("draft", "Draft"), ("in_progress", "In Progress"), ("done", "Done")],
+        choices=[
+            ("draft", "Draft"),
+            ("scheduled", "Scheduled"),
+            ("in_progress", "In Progress"),
+            ("done", "Done"),
+        ],
         default="draft"
     )
     start_date = models.DateField(null=True, blank=True)
@@ -0,0 +1,702 @@
+# apps/production/mrp.py
+
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_CEILING
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import (
+    ProductionPlan, PlannedOrder, PurchaseRequisition, ManufacturingOrder,
+    MOOperation, Routing, RoutingOperation, MRPNetChange,
+)
+from .bom import BOMCycleError, get_bom_graph
+from apps.inventory.models import Item, ItemDependency, StockBalance
+from apps.inventory.services import get_stock_balance, get_stock_balances
+from apps.sales.models import SalesOrderItem
+
+
+HOURS_PER_DAY = Decimal('8')
+NO_ROUTING_HOURS = HOURS_PER_DAY * 3     # fallback 3 days × 8h
+BUFFER_DAYS = 2                          # queue/setup/inspection
+PURCHASE_LEAD_DAYS = 7
+
+
+class MRPError(Exception):
+    """Raised when the product structure cannot be planned (e.g. circular BOM)"""
+
+
+class MRPCancelled(MRPError):
+    """Raised from a progress callback to abort a run before anything is saved"""
+
+
+def planned_dates(total_hours: Decimal, ref_date: date, scheduling_type: str = 'lead_time',
+                  lead_time_days: int = PURCHASE_LEAD_DAYS) -> tuple[date, date]:
+    """
+    Returns (planned_start, planned_finish)
+    Backward scheduling is used (finish date first)
+    """
+    if scheduling_type == 'basic_dates':
+        finish = ref_date + timedelta(days=lead_time_days)
+        return finish - timedelta(days=lead_time_days), finish
+
+    productive_days = math.ceil(total_hours / HOURS_PER_DAY)
+
+    finish = ref_date + timedelta(days=BUFFER_DAYS)  # need-by date
+    start = finish - timedelta(days=productive_days + BUFFER_DAYS)
+
+    return max(start, ref_date), finish
+
+
+def record_net_change(item_ids, reason):
+    """Flag items for the next net-change MRP run (upsert, one row per item)"""
+    item_ids = {i for i in item_ids if i}
+    if not item_ids:
+        return
+
+    now = timezone.now()
+    MRPNetChange.objects.bulk_create(
+        [
+            MRPNetChange(organization_id=org_id, item_id=item_id, reason=reason, changed_at=now)
+            for item_id, org_id in Item.objects.filter(
+                id__in=item_ids
+            ).values_list('id', 'organization_id')
+        ],
+        update_conflicts=True,
+        unique_fields=['item'],
+        update_fields=['reason', 'changed_at'],
+    )
+
+
+def clear_net_changes(organization, until, item_ids=None):
+    """Drop change flags consumed by a run (rows touched after `until` stay)"""
+    qs = MRPNetChange.objects.filter(organization=organization, changed_at__lte=until)
+    if item_ids is not None:
+        qs = qs.filter(item_id__in=item_ids)
+    qs.delete()
+
+
+class MRPEngine:
+    """
+    Set-based MRP run for one organization.
+
+    Everything the run needs (demand, BOMs, stock, open supply, routings)
+    is loaded in a handful of grouped queries; explosion and netting then
+    happen in memory level by level (low-level code order), so each item
+    is netted once against its total gross requirement and only the net
+    quantity is exploded to its components.
+    """
+
+    def __init__(self, organization, ref_date=None, progress=None):
+        self.organization = organization
+        self.ref_date = ref_date or timezone.now().date()
+        self.progress = progress  # optional callable(stage, percent)
+
+        self.item_ids = set()
+        self.demand = {}          # item_id -> independent demand (sales)
+        self.graph = None         # BOMGraph (cached, see bom.py)
+        self.bom_lines = {}       # product_id -> [(component_id, qty per unit)]
+        self.stock = {}           # item_id -> on hand
+        self.open_planned = {}    # item_id -> open planned order qty
+        self.open_mo = {}         # item_id -> in-progress MO qty
+        self.routing_hours = {}   # product_id -> expected hours per unit
+
+        self.gross_requirements = {}
+        self.planned_orders = []
+        self.requisitions = []
+
+    def report(self, stage, percent):
+        if self.progress:
+            self.progress(stage, percent)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def load(self):
+        org = self.organization
+        self.report("Loading demand and supply", 5)
+
+        self.item_ids = set(
+            Item.objects.filter(organization=org).values_list('id', flat=True)
+        )
+
+        self.demand = {
+            row['product_id']: Decimal(row['total'] or 0)
+            for row in SalesOrderItem.objects.filter(
+                sales_order__organization=org,
+                sales_order__status='approved',
+                product__isnull=False,
+            ).values('product_id').annotate(total=Sum('quantity'))
+        }
+
+        # Cached product structure (latest active BOM per product)
+        try:
+            self.graph = get_bom_graph(org, "bom")
+        except BOMCycleError as e:
+            raise MRPError(str(e))
+        self.bom_lines = self.graph.children
+
+        self.stock = {
+            row['item_id']: row['total'] or Decimal('0')
+            for row in StockBalance.objects.filter(
+                organization=org
+            ).values('item_id').annotate(total=Sum('quantity'))
+        }
+
+        self.open_planned = {
+            row['product_id']: Decimal(row['total'] or 0)
+            for row in PlannedOrder.objects.filter(
+                production_plan__organization=org,
+                status__in=['planned', 'confirmed']
+            ).values('product_id').annotate(total=Sum('quantity'))
+        }
+
+        self.open_mo = {
+            row['product_id']: row['total'] or Decimal('0')
+            for row in ManufacturingOrder.objects.filter(
+                product__organization=org,
+                status__in=['in_progress']
+            ).values('product_id').annotate(total=Sum('quantity'))
+        }
+
+        # First active routing per product (same pick as Routing...first())
+        routing_product = {}
+        for routing_id, product_id in Routing.objects.filter(
+            product__organization=org,
+            is_active=True
+        ).order_by('-id').values_list('id', 'product_id'):
+            routing_product[product_id] = routing_id
+
+        hours = dict(
+            RoutingOperation.objects.filter(
+                routing_id__in=routing_product.values()
+            ).values('routing_id').annotate(
+                hours=Sum('expected_hours')
+            ).values_list('routing_id', 'hours')
+        )
+        self.routing_hours = {
+            product_id: hours.get(routing_id) or Decimal('0')
+            for product_id, routing_id in routing_product.items()
+        }
+
+        return self
+
+    # ------------------------------------------------------------------
+    # Planning
+    # ------------------------------------------------------------------
+    def operation_hours(self, product_id, qty: Decimal) -> Decimal:
+        """Estimate total production time in hours from the preloaded routing"""
+        if product_id not in self.routing_hours:
+            return NO_ROUTING_HOURS
+        return self.routing_hours[product_id] * qty
+
+    def available_supply(self, item_id) -> Decimal:
+        return (
+            self.stock.get(item_id, Decimal('0'))
+            + self.open_planned.get(item_id, Decimal('0'))
+            + self.open_mo.get(item_id, Decimal('0'))
+        )
+
+    def plan(self):
+        """Explode and net in low-level-code order; fills the proposal lists"""
+        levels = {item_id: self.graph.level(item_id) for item_id in self.demand}
+        levels.update(self.graph.levels)
+
+        by_level = defaultdict(list)
+        for item_id, level in levels.items():
+            by_level[level].append(item_id)
+
+        gross = defaultdict(Decimal, self.demand)
+        ordered_levels = sorted(by_level)
+
+        for index, level in enumerate(ordered_levels):
+            self.report(f"Planning level {level}", 20 + 70 * index // len(ordered_levels))
+            for item_id in sorted(by_level[level]):
+                gross_qty = gross.get(item_id, Decimal('0'))
+                if gross_qty <= 0 or item_id not in self.item_ids:
+                    continue
+
+                net_qty = gross_qty - self.available_supply(item_id)
+                if net_qty <= 0:
+                    continue  # covered by stock / open supply
+
+                if item_id in self.bom_lines:
+                    # Manufactured item → Planned Order, explode net qty
+                    order_qty = int(net_qty.to_integral_value(rounding=ROUND_CEILING))
+                    start, finish = planned_dates(
+                        self.operation_hours(item_id, net_qty), self.ref_date, 'lead_time'
+                    )
+                    self.planned_orders.append({
+                        'product_id': item_id,
+                        'quantity': order_qty,
+                        'planned_start': start,
+                        'planned_finish': finish,
+                    })
+                    for component_id, qty_per in self.bom_lines[item_id]:
+                        gross[component_id] += net_qty * qty_per
+                else:
+                    # Purchased / raw material → Purchase Requisition
+                    _, finish = planned_dates(Decimal('0'), self.ref_date, 'basic_dates')
+                    self.requisitions.append({
+                        'material_id': item_id,
+                        'quantity': net_qty.quantize(Decimal('0.01')),
+                        'required_date': finish,
+                    })
+
+        self.gross_requirements = {k: v for k, v in gross.items() if v > 0}
+        return self
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    @transaction.atomic
+    def save(self, plan: ProductionPlan):
+        PlannedOrder.objects.bulk_create([
+            PlannedOrder(
+                production_plan=plan,
+                scheduling_type='production',
+                status='planned',
+                **proposal
+            )
+            for proposal in self.planned_orders
+        ])
+        PurchaseRequisition.objects.bulk_create([
+            PurchaseRequisition(
+                production_plan=plan,
+                status='open',
+                source='mrp',
+                **proposal
+            )
+            for proposal in self.requisitions
+        ])
+        return plan
+
+    def run(self, created_by=None):
+        """Load, plan and persist a new MRP run. Returns the ProductionPlan."""
+        started_at = timezone.now()
+        self.load().plan()
+
+        self.report("Saving proposals", 90)
+        with transaction.atomic():
+            plan = ProductionPlan.objects.create(
+                organization=self.organization,
+                created_by=created_by,
+                planned_date=self.ref_date,
+                status="mrp_done"
+            )
+            self.save(plan)
+            clear_net_changes(self.organization, started_at)
+
+        return plan
+
+
+class NetChangeMRPEngine(MRPEngine):
+    """
+    Incremental MRP: re-plans only items flagged in MRPNetChange plus their
+    BOM descendants, and reconciles their existing MRP proposals in place
+    (update / create / cancel) instead of adding a new set next to them.
+
+    Unflagged parents keep their current proposals, which are exploded as
+    the dependent demand of any flagged component below them.
+    """
+
+    def __init__(self, organization, ref_date=None, progress=None):
+        super().__init__(organization, ref_date, progress)
+        self.started_at = None
+        self.changed = set()      # items flagged since the last run
+        self.affected = set()     # changed items + BOM descendants
+        self.proposed = {}        # item_id -> qty of current 'planned' MRP proposals
+        self.created = self.updated = self.cancelled = 0
+
+    def proposal_orders(self):
+        """Open MRP proposals: replaceable by a re-plan (confirmed ones are firm)"""
+        return PlannedOrder.objects.filter(
+            production_plan__organization=self.organization,
+            scheduling_type='production',
+            status='planned',
+        )
+
+    def load(self):
+        self.started_at = timezone.now()
+        super().load()
+
+        self.changed = set(
+            MRPNetChange.objects.filter(
+                organization=self.organization,
+                changed_at__lte=self.started_at
+            ).values_list('item_id', flat=True)
+        )
+
+        # Changed items and everything below them in any BOM
+        self.affected = set(self.changed)
+        for item_id in self.changed:
+            self.affected |= self.graph.descendants(item_id)
+
+        self.proposed = {
+            row['product_id']: Decimal(row['total'] or 0)
+            for row in self.proposal_orders().values('product_id').annotate(total=Sum('quantity'))
+        }
+
+        # Only firm planned orders count as supply; proposals get replaced
+        self.open_planned = {
+            row['product_id']: Decimal(row['total'] or 0)
+            for row in PlannedOrder.objects.filter(
+                production_plan__organization=self.organization,
+                status='confirmed'
+            ).values('product_id').annotate(total=Sum('quantity'))
+        }
+        return self
+
+    def plan(self):
+        levels = {
+            item_id: self.graph.level(item_id)
+            for item_id in set(self.demand) | self.affected
+        }
+        levels.update(self.graph.levels)
+
+        by_level = defaultdict(list)
+        for item_id, level in levels.items():
+            by_level[level].append(item_id)
+
+        gross = defaultdict(Decimal, self.demand)
+        ordered_levels = sorted(by_level)
+
+        for index, level in enumerate(ordered_levels):
+            self.report(f"Planning level {level}", 20 + 70 * index // len(ordered_levels))
+            for item_id in sorted(by_level[level]):
+                if item_id not in self.affected:
+                    # Unchanged parent: its current proposals drive the components
+                    for component_id, qty_per in self.bom_lines.get(item_id, ()):
+                        gross[component_id] += self.proposed.get(item_id, Decimal('0')) * qty_per
+                    continue
+
+                gross_qty = gross.get(item_id, Decimal('0'))
+                net_qty = gross_qty - self.available_supply(item_id)
+                if gross_qty <= 0 or net_qty <= 0 or item_id not in self.item_ids:
+                    continue
+
+                if item_id in self.bom_lines:
+                    start, finish = planned_dates(
+                        self.operation_hours(item_id, net_qty), self.ref_date, 'lead_time'
+                    )
+                    self.planned_orders.append({
+                        'product_id': item_id,
+                        'quantity': int(net_qty.to_integral_value(rounding=ROUND_CEILING)),
+                        'planned_start': start,
+                        'planned_finish': finish,
+                    })
+                    for component_id, qty_per in self.bom_lines[item_id]:
+                        gross[component_id] += net_qty * qty_per
+                else:
+                    _, finish = planned_dates(Decimal('0'), self.ref_date, 'basic_dates')
+                    self.requisitions.append({
+                        'material_id': item_id,
+                        'quantity': net_qty.quantize(Decimal('0.01')),
+                        'required_date': finish,
+                    })
+
+        self.gross_requirements = {
+            k: v for k, v in gross.items() if v > 0 and k in self.affected
+        }
+        return self
+
+    @transaction.atomic
+    def save(self, plan: ProductionPlan):
+        """Reconcile proposals of affected items against the new plan"""
+        wanted_orders = {p['product_id']: p for p in self.planned_orders}
+        wanted_reqs = {r['material_id']: r for r in self.requisitions}
+
+        existing_orders = defaultdict(list)
+        for order in self.proposal_orders().filter(
+            product_id__in=self.affected
+        ).select_for_update().order_by('id'):
+            existing_orders[order.product_id].append(order)
+
+        # Requisitions created or edited by hand are left alone
+        existing_reqs = defaultdict(list)
+        for req in PurchaseRequisition.objects.filter(
+            production_plan__organization=self.organization,
+            material_id__in=self.affected,
+            status='open',
+            source='mrp'
+        ).select_for_update().order_by('id'):
+            existing_reqs[req.material_id].append(req)
+
+        to_create, to_update, to_cancel = [], [], []
+        for item_id in self.affected:
+            orders = existing_orders.get(item_id, [])
+            proposal = wanted_orders.get(item_id)
+            if proposal:
+                if orders:
+                    order = orders.pop(0)
+                    for field in ('quantity', 'planned_start', 'planned_finish'):
+                        setattr(order, field, proposal[field])
+                    to_update.append(order)
+                else:
+                    to_create.append(PlannedOrder(
+                        production_plan=plan,
+                        scheduling_type='production',
+                        status='planned',
+                        **proposal
+                    ))
+            for order in orders:
+                order.status = 'cancelled'
+                to_cancel.append(order)
+
+        PlannedOrder.objects.bulk_create(to_create)
+        PlannedOrder.objects.bulk_update(to_update, ['quantity', 'planned_start', 'planned_finish'])
+        PlannedOrder.objects.bulk_update(to_cancel, ['status'])
+
+        req_create, req_update, req_delete = [], [], []
+        for item_id in self.affected:
+            reqs = existing_reqs.get(item_id, [])
+            proposal = wanted_reqs.get(item_id)
+            if proposal:
+                if reqs:
+                    req = reqs.pop(0)
+                    req.quantity = proposal['quantity']
+                    req.required_date = proposal['required_date']
+                    req_update.append(req)
+                else:
+                    req_create.append(PurchaseRequisition(
+                        production_plan=plan,
+                        status='open',
+                        source='mrp',
+                        **proposal
+                    ))
+            req_delete.extend(r.id for r in reqs)
+
+        PurchaseRequisition.objects.bulk_create(req_create)
+        PurchaseRequisition.objects.bulk_update(req_update, ['quantity', 'required_date'])
+        PurchaseRequisition.objects.filter(id__in=req_delete).delete()
+
+        self.created = len(to_create) + len(req_create)
+        self.updated = len(to_update) + len(req_update)
+        self.cancelled = len(to_cancel) + len(req_delete)
+
+        clear_net_changes(self.organization, self.started_at, self.changed)
+        return plan
+
+    def run(self, created_by=None):
+        """
+        Apply pending changes to the latest MRP plan. Falls back to a full
+        regeneration when the organization has never run MRP.
+        """
+        plan = ProductionPlan.objects.filter(
+            organization=self.organization,
+            status="mrp_done"
+        ).order_by("-created_at").first()
+
+        if plan is None:
+            engine = MRPEngine(self.organization, self.ref_date, self.progress)
+            plan = engine.run(created_by=created_by)
+            self.planned_orders = engine.planned_orders
+            self.requisitions = engine.requisitions
+            self.gross_requirements = engine.gross_requirements
+            self.created = len(engine.planned_orders) + len(engine.requisitions)
+            return plan
+
+        self.load()
+        if not self.changed:
+            self.report("No changes since last run", 90)
+            return plan
+
+        self.plan()
+        self.report("Saving proposals", 90)
+        self.save(plan)
+        return plan
+
+
+# ----------------------------------------------------------------------
+# Single item
+# ----------------------------------------------------------------------
+def get_bom_status_bulk(organization, requests):
+    """
+    BOM availability for many (product, qty) pairs at once.
+
+    Components come from the cached ItemDependency graph; stock and open
+    planned supply are read with one grouped query each for the whole
+    component set. Returns one list of component rows per request, in
+    request order, each shaped like get_bom_status() (every pair is
+    checked on its own, as before).
+    """
+    organization_id = getattr(organization, 'pk', organization)
+    try:
+        graph = get_bom_graph(organization_id, "dependency")
+        lines_for = graph.components
+    except BOMCycleError:
+        # Legacy looped data: single level is still safe to read directly
+        direct = defaultdict(list)
+        for parent_id, child_id, qty in ItemDependency.objects.filter(
+            parent_item_id__in=[getattr(p, 'pk', p) for p, _ in requests]
+        ).values_list('parent_item_id', 'child_item_id', 'quantity'):
+            direct[parent_id].append((child_id, qty))
+        lines_for = lambda product_id: direct.get(product_id, [])
+
+    product_lines = {}
+    for product, _ in requests:
+        product_id = getattr(product, 'pk', product)
+        product_lines[product_id] = lines_for(product_id)
+
+    component_ids = {c for lines in product_lines.values() for c, _ in lines}
+    if not component_ids:
+        return [[] for _ in requests]
+
+    components = Item.objects.in_bulk(component_ids)
+    stock = get_stock_balances(component_ids)
+    planned = {
+        row['product_id']: Decimal(row['total'] or 0)
+        for row in PlannedOrder.objects.filter(
+            product_id__in=component_ids,
+            status__in=["planned", "confirmed"]
+        ).values('product_id').annotate(total=Sum('quantity'))
+    }
+
+    result = []
+    for product, qty in requests:
+        product_id = getattr(product, 'pk', product)
+        rows = []
+        for component_id, qty_per in product_lines[product_id]:
+            component = components[component_id]
+            required = Decimal(str(qty)) * qty_per
+            on_hand = stock.get(component_id) or Decimal('0')
+            open_planned = planned.get(component_id, Decimal('0'))
+            shortage = required - (on_hand + open_planned)
+
+            rows.append({
+                "component_id": component_id,
+                "component": component.name,
+                "component_code": component.code,
+                "required": float(required),
+                "stock": float(on_hand),
+                "planned": float(open_planned),
+                "shortage": float(max(shortage, 0)),
+                "uom": component.uom
+            })
+        result.append(rows)
+
+    return result
+
+
+def get_bom_status(product, qty):
+    """
+    Returns BOM status using your actual ItemDependency model
+    """
+    return get_bom_status_bulk(product.organization_id, [(product, qty)])[0]
+
+
+def run_single_item_mrp(organization, product, created_by=None, ref_date=None, progress=None):
+    """
+    Net one product against approved sales demand and, when nothing is
+    short, create its Planned Order + draft Manufacturing Order.
+
+    Returns a result dict: {"detail"} when nothing is required,
+    {"has_shortage", "shortages"} on material shortage, or
+    {"success", "planned_order_id", "manufacturing_order_id", ...}.
+    """
+    ref_date = ref_date or timezone.now().date()
+
+    def report(stage, percent):
+        if progress:
+            progress(stage, percent)
+
+    # 1. Calculate net requirement from approved sales orders
+    report("Calculating requirement", 10)
+    sales_items = SalesOrderItem.objects.filter(
+        product=product,
+        sales_order__status="approved",
+        sales_order__organization=organization
+    ).select_related('sales_order')
+
+    demand = sales_items.aggregate(total=Sum("quantity"))["total"] or Decimal('0')
+    stock = get_stock_balance(product)
+
+    planned_qty = PlannedOrder.objects.filter(
+        product=product,
+        status__in=["planned", "confirmed"]
+    ).aggregate(total=Sum("quantity"))["total"] or Decimal('0')
+
+    required = Decimal(str(demand)) - Decimal(str(stock)) - Decimal(str(planned_qty))
+
+    if required <= 0:
+        return {"detail": "No additional production required"}
+
+    # 2. Check for material shortages
+    report("Checking material availability", 40)
+    bom_details = get_bom_status(product, required)
+    shortages = [d for d in bom_details if float(d.get('shortage', 0)) > 0]
+
+    if shortages:
+        return {
+            "detail": "Cannot create Production Order - Material shortage detected",
+            "has_shortage": True,
+            "shortages": shortages
+        }
+
+    report("Creating production order", 70)
+    with transaction.atomic():
+        # 3. Get or create Production Plan
+        production_plan = ProductionPlan.objects.filter(
+            organization=organization
+        ).order_by("-created_at").first()
+
+        if not production_plan:
+            production_plan = ProductionPlan.objects.create(
+                organization=organization,
+                created_by=created_by,
+                planned_date=ref_date,
+                status="mrp_done"
+            )
+
+        # 4. Create Planned Order
+        planned_order = PlannedOrder.objects.create(
+            production_plan=production_plan,
+            product=product,
+            quantity=required,
+            planned_start=ref_date,
+            planned_finish=ref_date + timedelta(days=5),
+            status="planned",
+            scheduling_type="production"
+        )
+
+        # Link to Sales Orders
+        so_ids = [item.sales_order_id for item in sales_items]
+        planned_order.sales_orders.set(so_ids)
+
+        # 5. Create ManufacturingOrder (This is your Production Order)
+        manufacturing_order = ManufacturingOrder.objects.create(
+            planned_order=planned_order,
+            product=product,
+            quantity=required,
+            status="draft",
+            start_date=ref_date,
+        )
+        routing = Routing.objects.filter(product=product, is_active=True).first()
+        if routing:
+            MOOperation.objects.bulk_create([
+                MOOperation(
+                    manufacturing_order=manufacturing_order,
+                    machine=op.machine,
+                    operation_name=op.operation_name,
+                    sequence=op.sequence,
+                    status="pending"
+                )
+                for op in routing.operations.all().order_by('sequence')
+            ])
+
+        # Mark planned order as converted
+        planned_order.status = "converted"
+        planned_order.save()
+
+    return {
+        "success": True,
+        "detail": f"Production Order created successfully for {product.name}",
+        "production_plan_id": production_plan.id,
+        "planned_order_id": planned_order.id,
+        "manufacturing_order_id": manufacturing_order.id,
+        "quantity": float(required),
+        "linked_sales_order_ids": so_ids
+    }
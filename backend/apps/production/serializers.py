@@ -3,8 +3,9 @@ from rest_framework import serializers
 from .models import (
     WorkCenter, BillOfMaterial, BOMLine, Routing, RoutingOperation,
     ProductionPlan, PlannedOrder, PurchaseRequisition,
-    ManufacturingOrder, MOOperation,WorkOrder
+    ManufacturingOrder, MOOperation,WorkOrder, MRPJob
 )
+from .bom import BOMCycleError, check_bom_cycle
 from apps.inventory.models import Machine
 from apps.inventory.serializers import MachineSerializer
 
@@ -22,6 +23,18 @@ class BOMLineSerializer(serializers.ModelSerializer):
         model = BOMLine
         fields = "__all__"
 
+    def validate(self, data):
+        bom = data.get("bom") or getattr(self.instance, "bom", None)
+        component = data.get("component") or getattr(self.instance, "component", None)
+        if bom and component:
+            try:
+                check_bom_cycle(
+                    bom.product.organization_id, bom.product_id, component.id, "bom"
+                )
+            except BOMCycleError as e:
+                raise serializers.ValidationError({"component": str(e)})
+        return data
+
 
 class BillOfMaterialSerializer(serializers.ModelSerializer):
     lines = BOMLineSerializer(many=True, read_only=True)
@@ -79,6 +92,7 @@ class PurchaseRequisitionSerializer(serializers.ModelSerializer):
     class Meta:
         model = PurchaseRequisition
         fields = "__all__"
+        read_only_fields = ["source"]
 
 
 class ManufacturingOrderSerializer(serializers.ModelSerializer):
@@ -178,4 +192,15 @@ class WorkOrderSerializer(serializers.ModelSerializer):
             'start_date',
             'finish_date',
             'created_at'
-        ]
\ No newline at end of file
+        ]
+
+class MRPJobSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source="item.name", read_only=True, default=None)
+
+    class Meta:
+        model = MRPJob
+        fields = [
+            "id", "job_type", "item", "item_name", "status", "progress", "stage",
+            "cancel_requested", "production_plan", "result", "error",
+            "created_at", "started_at", "finished_at"
+        ]
@@ -1,11 +1,14 @@
 # apps/production/services.py
 
+from collections import defaultdict
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
-from django.db.models import Q
 
 from .models import ManufacturingOrder, WorkOrder
+from .capacity import get_booking_index, invalidate_booking_index
+from .mrp import record_net_change
 from apps.inventory.models import Machine
 
 
@@ -31,158 +34,182 @@ class ProductionService:
         if not start_date or not end_date:
             return True
 
-        conflicting_orders = WorkOrder.objects.filter(
-            machine=machine,
-            status__in=['in_progress', 'scheduled']
-        ).filter(
-            Q(start_date__lte=end_date) & Q(finish_date__gte=start_date)
-        )
-
-        return not conflicting_orders.exists()
+        index = get_booking_index(machine.organization_id)
+        return not index.conflicts(machine.id, start_date, end_date)
 
     @staticmethod
     def get_machine_busy_info(machine, proposed_start, proposed_end):
         """Return info about the conflicting Work Order"""
-        conflicting = WorkOrder.objects.filter(
-            machine=machine,
-            status__in=['in_progress', 'scheduled']
-        ).filter(
-            Q(start_date__lte=proposed_end) & Q(finish_date__gte=proposed_start)
-        ).order_by('start_date').first()
-
-        if conflicting:
+        index = get_booking_index(machine.organization_id)
+        conflicts = index.conflicts(machine.id, proposed_start, proposed_end)
+
+        if conflicts:
+            conflicting = conflicts[0]   # earliest start
             return {
                 'is_busy': True,
-                'current_work_order_id': conflicting.id,
-                'running_end_date': conflicting.finish_date,
-                'running_start_date': conflicting.start_date,
+                'current_work_order_id': conflicting.ref_id,
+                'running_end_date': conflicting.finish,
+                'running_start_date': conflicting.start,
                 'status': conflicting.status,
             }
         return {'is_busy': False}
 
     @staticmethod
-    def assign_machines_and_create_workorders(manufacturing_order_id=None, machine_id=None):
+    def assign_machines_and_create_workorders(manufacturing_order_id=None, machine_id=None, organization=None):
         """
         Create Work Orders from Manufacturing Orders where status = 'done'
         """
-        if manufacturing_order_id:
-            ready_orders = ManufacturingOrder.objects.filter(
-                id=manufacturing_order_id, 
-                status='done'                    # Changed to 'done'
-            )
-        else:
-            ready_orders = ProductionService.get_ready_manufacturing_orders()
+        report = ProductionService.bulk_create_workorders(
+            manufacturing_order_ids=[manufacturing_order_id] if manufacturing_order_id else None,
+            machine_id=machine_id,
+            organization=organization,
+        )
+        return ProductionService.summarize_workorder_report(report)
+
+    @staticmethod
+    def summarize_workorder_report(report):
+        """(created_count, message) in the shape the assign endpoints return"""
+        if report.get('error'):
+            return 0, report['error']
+
+        created_count = sum(1 for r in report['results'] if r['status'] == 'created')
+        errors = [r['error'] for r in report['results'] if r['status'] == 'failed']
+
+        # Final response
+        if created_count == 0:
+            error_msg = errors[0] if errors else "Could not create any Work Orders."
+            return 0, error_msg
+
+        success_msg = f"Successfully created {created_count} Work Order(s) from 'done' Manufacturing Orders!"
+        if errors:
+            success_msg += f" ({len(errors)} failed)"
 
-        if not ready_orders.exists():
-            return 0, "No Manufacturing Orders with status 'done' found."
+        return created_count, success_msg
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_create_workorders(manufacturing_order_ids=None, machine_id=None, organization=None):
+        """
+        Convert all ready ('done') Manufacturing Orders into Work Orders in
+        one pass: machines are resolved against the preloaded booking index
+        (plus bookings made earlier in the same batch), then Work Orders and
+        MO updates are written with bulk_create / bulk_update.
+
+        Returns {"results": [per-MO outcome]} or {"error": message}.
+        """
+        ready_orders = ManufacturingOrder.objects.filter(status='done')
+        if manufacturing_order_ids:
+            ready_orders = ready_orders.filter(id__in=manufacturing_order_ids)
+        if organization is not None:
+            ready_orders = ready_orders.filter(product__organization=organization)
+        ready_orders = list(
+            ready_orders.select_related('product').select_for_update(of=('self',)).order_by('id')
+        )
+
+        if not ready_orders:
+            return {'error': "No Manufacturing Orders with status 'done' found."}
 
         # Get available machines
+        machines = Machine.objects.filter(maintenance_status='operational', is_active=True)
+        if organization is not None:
+            machines = machines.filter(organization=organization)
         if machine_id:
-            available_machines = Machine.objects.filter(
-                id=machine_id, 
-                maintenance_status='operational', 
-                is_active=True
-            )
-            if not available_machines.exists():
-                return 0, "Selected machine is not operational or inactive."
+            machines = list(machines.filter(id=machine_id))
+            if not machines:
+                return {'error': "Selected machine is not operational or inactive."}
         else:
-            available_machines = Machine.objects.filter(
-                maintenance_status='operational', 
-                is_active=True
-            ).order_by('name')
+            machines = list(machines.order_by('name'))
+
+        if not machines:
+            return {'error': "No operational machines available!"}
+
+        indexes = {}
+        batch_bookings = defaultdict(list)   # machine_id -> [(start, finish)] booked in this run
 
-        if not available_machines.exists():
-            return 0, "No operational machines available!"
+        def is_free(machine, start, finish):
+            if machine.organization_id not in indexes:
+                indexes[machine.organization_id] = get_booking_index(machine.organization_id)
+            if indexes[machine.organization_id].conflicts(machine.id, start, finish):
+                return False
+            return not any(s <= finish and f >= start for s, f in batch_bookings[machine.id])
 
-        created_count = 0
-        errors = []
+        # Same estimate as before: lead time on the first candidate machine
+        temp_machine = machines[0]
+        effective_capacity = float(temp_machine.get_effective_capacity(days=1) or 8)
 
+        results, work_orders, updated_orders = [], [], []
         for mo in ready_orders:
             start_date = mo.start_date or timezone.now().date()
 
             # Calculate estimated finish date
             run_time_per_unit = to_decimal(getattr(mo.product, 'run_time_per_unit_hours', Decimal('0.05')))
-            quantity = to_decimal(mo.quantity)
-
-            temp_machine = available_machines.first()
             total_hours = temp_machine.calculate_lead_time(
-                quantity=quantity, 
+                quantity=to_decimal(mo.quantity),
                 run_time_per_unit=run_time_per_unit
             )
-            effective_capacity = float(temp_machine.get_effective_capacity(days=1) or 8)
-            total_hours_float = float(total_hours)
-            days_needed = int((total_hours_float / effective_capacity) + 2)   # +2 days buffer
-
+            days_needed = int((float(total_hours) / effective_capacity) + 2)   # +2 days buffer
             finish_date = start_date + timedelta(days=days_needed)
 
-            # === Specific Machine Assignment ===
             if machine_id:
-                machine = available_machines.first()
-                if not ProductionService.is_machine_available(machine, start_date, finish_date):
+                # === Specific Machine Assignment ===
+                machine = machines[0]
+                if not is_free(machine, start_date, finish_date):
                     busy_info = ProductionService.get_machine_busy_info(machine, start_date, finish_date)
                     end_date_str = busy_info['running_end_date'].strftime('%Y-%m-%d') if busy_info.get('running_end_date') else 'N/A'
-                    errors.append(f"Machine {machine.name} is busy. Current work order ends on {end_date_str}.")
+                    results.append({
+                        'manufacturing_order_id': mo.id,
+                        'status': 'failed',
+                        'error': f"Machine {machine.name} is busy. Current work order ends on {end_date_str}.",
+                    })
+                    continue
+            else:
+                # === Auto-assign to best available machine ===
+                free_machines = [m for m in machines if is_free(m, start_date, finish_date)]
+                machine = ProductionService._get_best_machine(mo, free_machines)
+                if not machine:
+                    results.append({
+                        'manufacturing_order_id': mo.id,
+                        'status': 'failed',
+                        'error': f"No free machine found for Manufacturing Order #{mo.id}",
+                    })
                     continue
 
-                # Create Work Order
-                WorkOrder.objects.create(
-                    manufacturing_order=mo,
-                    machine=machine,
-                    quantity=mo.quantity,
-                    status='in_progress',
-                    start_date=start_date,
-                    finish_date=finish_date,
-                )
-                mo.status = 'in_progress'      # Update MO status
-                mo.start_date = start_date
-                mo.finish_date = finish_date
-                mo.save()
-                created_count += 1
-                continue
-
-            # === Auto-assign to best available machine ===
-            free_machines = [
-                m for m in available_machines 
-                if ProductionService.is_machine_available(m, start_date, finish_date)
-            ]
-
-            if not free_machines:
-                errors.append(f"No free machine found for Manufacturing Order #{mo.id}")
-                continue
-
-            machine = ProductionService._get_best_machine(mo, free_machines)
-            if not machine:
-                errors.append(f"Could not select best machine for MO #{mo.id}")
-                continue
-
-            # Create Work Order
-            WorkOrder.objects.create(
+            batch_bookings[machine.id].append((start_date, finish_date))
+            work_orders.append(WorkOrder(
                 manufacturing_order=mo,
                 machine=machine,
                 quantity=mo.quantity,
                 status='in_progress',
                 start_date=start_date,
                 finish_date=finish_date,
-            )
-
-            # Update Manufacturing Order
+            ))
             mo.status = 'in_progress'
             mo.start_date = start_date
             mo.finish_date = finish_date
-            mo.save()
-
-            created_count += 1
-
-        # Final response
-        if created_count == 0:
-            error_msg = errors[0] if errors else "Could not create any Work Orders."
-            return 0, error_msg
-
-        success_msg = f"Successfully created {created_count} Work Order(s) from 'done' Manufacturing Orders!"
-        if errors:
-            success_msg += f" ({len(errors)} failed)"
-
-        return created_count, success_msg
+            updated_orders.append(mo)
+            results.append({
+                'manufacturing_order_id': mo.id,
+                'status': 'created',
+                'machine_id': machine.id,
+                'machine_name': machine.name,
+                'start_date': start_date,
+                'finish_date': finish_date,
+            })
+
+        created = WorkOrder.objects.bulk_create(work_orders)
+        ManufacturingOrder.objects.bulk_update(updated_orders, ['status', 'start_date', 'finish_date'])
+
+        work_order_ids = {wo.manufacturing_order_id: wo.id for wo in created}
+        for r in results:
+            if r['status'] == 'created':
+                r['work_order_id'] = work_order_ids.get(r['manufacturing_order_id'])
+
+        # bulk writes skip signals: refresh booking indexes / net-change flags
+        for organization_id in {m.organization_id for m in machines}:
+            invalidate_booking_index(organization_id)
+        record_net_change({mo.product_id for mo in updated_orders}, "supply")
+
+        return {'results': results}
 
     @staticmethod
     def _get_best_machine(manufacturing_order, machines):
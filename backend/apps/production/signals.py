@@ -0,0 +1,139 @@
+# apps/production/signals.py
+from django.core.exceptions import ValidationError
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    PlannedOrder, ManufacturingOrder, MOOperation, WorkOrder,
+    BillOfMaterial, BOMLine, Routing, RoutingOperation,
+)
+from .bom import BOMCycleError, check_bom_cycle, invalidate_bom_graph
+from .capacity import invalidate_booking_index
+from .mrp import record_net_change
+from apps.inventory.models import Item, ItemDependency, Machine
+from apps.inventory.services import stock_changed
+from apps.sales.models import SalesOrder, SalesOrderItem
+
+
+# =========================================================
+# Net-change MRP: flag items whose demand / supply changed
+# =========================================================
+
+@receiver([post_save, post_delete], sender=SalesOrderItem)
+def sales_item_changed(sender, instance, **kwargs):
+    record_net_change([instance.product_id], "demand")
+
+
+@receiver(post_save, sender=SalesOrder)
+def sales_order_changed(sender, instance, created, **kwargs):
+    if created:
+        return  # items are flagged as they are added
+    record_net_change(
+        instance.items.values_list("product_id", flat=True), "demand"
+    )
+
+
+@receiver(stock_changed)
+def stock_movement(sender, item_ids, **kwargs):
+    record_net_change(item_ids, "stock")
+
+
+@receiver([post_save, post_delete], sender=PlannedOrder)
+@receiver([post_save, post_delete], sender=ManufacturingOrder)
+def supply_changed(sender, instance, **kwargs):
+    record_net_change([instance.product_id], "supply")
+
+
+@receiver([post_save, post_delete], sender=BOMLine)
+def bom_changed(sender, instance, **kwargs):
+    record_net_change(
+        BillOfMaterial.objects.filter(id=instance.bom_id).values_list("product_id", flat=True),
+        "bom"
+    )
+
+
+# =========================================================
+# BOM graph cache: reject loops on write, bump version on change
+# =========================================================
+
+def _item_organization_id(item_id):
+    return Item.objects.filter(id=item_id).values_list("organization_id", flat=True).first()
+
+
+def _bom_product_id(bom_id):
+    return BillOfMaterial.objects.filter(id=bom_id).values_list("product_id", flat=True).first()
+
+
+# Serializers check loops first and answer 400; this catches writes
+# that bypass them (admin, shell, other code paths).
+def _reject_cycle(parent_id, component_id, source):
+    try:
+        check_bom_cycle(_item_organization_id(parent_id), parent_id, component_id, source)
+    except BOMCycleError as e:
+        raise ValidationError(str(e))
+
+
+@receiver(pre_save, sender=BOMLine)
+def bom_line_cycle_check(sender, instance, **kwargs):
+    _reject_cycle(_bom_product_id(instance.bom_id), instance.component_id, "bom")
+
+
+@receiver(pre_save, sender=ItemDependency)
+def item_dependency_cycle_check(sender, instance, **kwargs):
+    _reject_cycle(instance.parent_item_id, instance.child_item_id, "dependency")
+
+
+@receiver([post_save, post_delete], sender=BillOfMaterial)
+def bom_saved(sender, instance, **kwargs):
+    invalidate_bom_graph(_item_organization_id(instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=BOMLine)
+def bom_line_saved(sender, instance, **kwargs):
+    invalidate_bom_graph(_item_organization_id(_bom_product_id(instance.bom_id)))
+
+
+@receiver([post_save, post_delete], sender=ItemDependency)
+def item_dependency_saved(sender, instance, **kwargs):
+    invalidate_bom_graph(_item_organization_id(instance.parent_item_id))
+    record_net_change([instance.parent_item_id], "bom")
+
+
+# =========================================================
+# Machine booking index: bump version on booking changes
+# =========================================================
+
+def _machine_organization_id(machine_id):
+    return Machine.objects.filter(id=machine_id).values_list("organization_id", flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=WorkOrder)
+def work_order_booking_changed(sender, instance, **kwargs):
+    if instance.machine_id:
+        organization_id = _machine_organization_id(instance.machine_id)
+    else:
+        organization_id = ManufacturingOrder.objects.filter(
+            id=instance.manufacturing_order_id
+        ).values_list("product__organization_id", flat=True).first()
+    invalidate_booking_index(organization_id)
+
+
+@receiver([post_save, post_delete], sender=ManufacturingOrder)
+def mo_booking_changed(sender, instance, **kwargs):
+    invalidate_booking_index(_item_organization_id(instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=Routing)
+def routing_changed(sender, instance, **kwargs):
+    invalidate_booking_index(_item_organization_id(instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=MOOperation)
+@receiver([post_save, post_delete], sender=RoutingOperation)
+def operation_machine_changed(sender, instance, **kwargs):
+    invalidate_booking_index(_machine_organization_id(instance.machine_id))
+
+
+@receiver([post_save, post_delete], sender=Machine)
+def machine_changed(sender, instance, **kwargs):
+    invalidate_booking_index(instance.organization_id)
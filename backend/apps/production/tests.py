@@ -1,3 +1,143 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models.signals import pre_save
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.inventory.models import Item
+from apps.organizations.models import Organization
+from apps.production import signals
+from apps.production.bom import get_bom_graph, invalidate_bom_graph
+from apps.production.jobs import (
+    MAX_JOB_ATTEMPTS, STALE_JOB_TIMEOUT, JobReclaimed,
+    _progress_callback, claim_next_job, reclaim_stale_jobs,
+)
+from apps.production.models import BillOfMaterial, BOMLine, MRPJob
+from apps.production.serializers import BOMLineSerializer
+
+
+class StaleMRPJobTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Org", subdomain="org", email="org@example.com")
+
+    def _running_job(self, attempts=1, idle=None):
+        heartbeat = timezone.now() - (idle or timedelta(0))
+        return MRPJob.objects.create(
+            organization=self.org,
+            status="running",
+            attempts=attempts,
+            started_at=heartbeat,
+            heartbeat_at=heartbeat,
+        )
+
+    def test_stale_job_is_requeued(self):
+        job = self._running_job(idle=STALE_JOB_TIMEOUT + timedelta(minutes=1))
+
+        self.assertEqual(reclaim_stale_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(job.progress, 0)
+
+    def test_stale_job_fails_after_max_attempts(self):
+        job = self._running_job(
+            attempts=MAX_JOB_ATTEMPTS, idle=STALE_JOB_TIMEOUT + timedelta(minutes=1)
+        )
+
+        reclaim_stale_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("stopped responding", job.error)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_job_with_recent_heartbeat_is_left_running(self):
+        job = self._running_job(idle=timedelta(minutes=1))
+
+        self.assertEqual(reclaim_stale_jobs(), 0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "running")
+
+    def test_claim_picks_up_requeued_job(self):
+        job = self._running_job(idle=STALE_JOB_TIMEOUT + timedelta(minutes=1))
+
+        claimed = claim_next_job()
+
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, "running")
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_old_worker_stops_once_job_is_reclaimed(self):
+        job = self._running_job(idle=STALE_JOB_TIMEOUT + timedelta(minutes=1))
+        progress = _progress_callback(job)
+
+        reclaim_stale_jobs()
+        claim_next_job()
+
+        with self.assertRaises(JobReclaimed):
+            progress("Exploding BOM", 50)
+
+
+class BOMCycleValidationTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Org", subdomain="org", email="org@example.com")
+        self.a, self.b, self.c, self.d = (
+            Item.objects.create(organization=self.org, name=code, code=code, uom="nos")
+            for code in "ABCD"
+        )
+
+    def _bom(self, product):
+        return BillOfMaterial.objects.create(organization=self.org, product=product)
+
+    def _line_serializer(self, bom, component):
+        return BOMLineSerializer(data={"bom": bom.id, "component": component.id, "quantity": 1})
+
+    def test_loop_is_a_validation_error(self):
+        BOMLine.objects.create(bom=self._bom(self.a), component=self.b, quantity=1)
+
+        serializer = self._line_serializer(self._bom(self.b), self.a)
+
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("component", serializer.errors)
+
+    def test_existing_loop_does_not_block_other_edits(self):
+        bom_a, bom_b = self._bom(self.a), self._bom(self.b)
+        BOMLine.objects.create(bom=bom_a, component=self.b, quantity=1)
+        # A loop already in the data (written before checks existed)
+        pre_save.disconnect(signals.bom_line_cycle_check, sender=BOMLine)
+        try:
+            BOMLine.objects.create(bom=bom_b, component=self.a, quantity=1)
+        finally:
+            pre_save.connect(signals.bom_line_cycle_check, sender=BOMLine)
+
+        serializer = self._line_serializer(self._bom(self.c), self.d)
+
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+
+class BOMGraphCacheTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Org", subdomain="org", email="org@example.com")
+        self.a, self.b = (
+            Item.objects.create(organization=self.org, name=code, code=code, uom="nos")
+            for code in "AB"
+        )
+
+    def test_rolled_back_structure_is_not_served(self):
+        bom = BillOfMaterial.objects.create(organization=self.org, product=self.a)
+
+        # Bump and cache inside a transaction that is rolled back
+        try:
+            with transaction.atomic():
+                BOMLine.objects.create(bom=bom, component=self.b, quantity=1)
+                self.assertIn(self.b.id, get_bom_graph(self.org).descendants(self.a.id))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        # The next real bump gets the same version number
+        invalidate_bom_graph(self.org.id)
 
-# Create your tests here.
+        self.assertNotIn(self.b.id, get_bom_graph(self.org).descendants(self.a.id))
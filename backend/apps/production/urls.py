@@ -40,6 +40,15 @@ AssignMachinesAPIView,DraftManufacturingOrdersAPIView,AvailableMachinesAPIView,
     # NEW: Work Order Views
     WorkOrderListView,
     WorkOrderActionView,
+
+    BOMAvailabilityView,
+    AssignMachineAPIView,
+    ScheduleManufacturingOrdersAPIView,
+
+    # MRP Jobs
+    MRPJobListCreateView,
+    MRPJobDetailView,
+    MRPJobCancelView,
 )
 
 urlpatterns = [
@@ -53,6 +62,10 @@ urlpatterns = [
     # MRP
     path('run-mrp/', RunMRPView.as_view(), name='run-mrp'),
     path('mrp-item/<int:pk>/', RunSingleItemMRPView.as_view(), name='run-single-item-mrp'),
+    path('bom-availability/', BOMAvailabilityView.as_view(), name='bom-availability'),
+    path('mrp-jobs/', MRPJobListCreateView.as_view(), name='mrp-job-list'),
+    path('mrp-jobs/<int:pk>/', MRPJobDetailView.as_view(), name='mrp-job-detail'),
+    path('mrp-jobs/<int:pk>/cancel/', MRPJobCancelView.as_view(), name='mrp-job-cancel'),
 
     # Planned Orders
     path('planned-orders/', PlannedOrderListView.as_view(), name='planned-order-list'),
@@ -83,6 +96,8 @@ urlpatterns = [
     path('draft-orders/', DraftManufacturingOrdersAPIView.as_view(), name='draft-orders'),
     path('machines-list/', AvailableMachinesAPIView.as_view(), name='machines-list'),
     path('assign-machines/', AssignMachinesAPIView.as_view(), name='assign-machines'),
+    path('production-plans/<int:plan_id>/assign-machine/', AssignMachineAPIView.as_view(), name='plan-assign-machine'),
+    path('schedule/', ScheduleManufacturingOrdersAPIView.as_view(), name='schedule-manufacturing-orders'),
 
     # ====================== WORK ORDERS ======================
     path('work-orders/', WorkOrderListView.as_view(), name='work-order-list'),
@@ -18,15 +18,17 @@ from .models import (
     ManufacturingOrder, MOOperation,
     BillOfMaterial, Routing, RoutingOperation,
     PlannedOrder, ItemProcess, ItemProcessStep,
-    DepartmentTransaction,ProductionOrder,WorkOrder
+    DepartmentTransaction,ProductionOrder,WorkOrder,MRPJob
 )
 from .serializers import (
     ProductionPlanSerializer, PlannedOrderSerializer,
     PurchaseRequisitionSerializer, ManufacturingOrderSerializer,
     ItemProcessSerializer, ItemProcessCreateUpdateSerializer,
-    DepartmentTransactionListSerializer, DepartmentTransactionCreateSerializer,WorkOrderSerializer
+    DepartmentTransactionListSerializer, DepartmentTransactionCreateSerializer,WorkOrderSerializer,
+    MRPJobSerializer
 )
 from apps.inventory.models import Item, StockLedger, Machine
+from .capacity import MachineLoadEngine, FiniteCapacityScheduler, DEFAULT_HORIZON_DAYS, get_booking_index
 from apps.sales.models import SalesOrder, SalesOrderItem
 from apps.inventory.serializers import MachineSerializer
 from django.shortcuts import get_object_or_404
@@ -157,9 +159,13 @@ class PlannedOrderListView(APIView):
             production_plan__organization=request.user.organization
         ).select_related("product").prefetch_related("sales_orders")
 
+        orders = list(orders)
+        bom_status = get_bom_status_bulk(
+            request.user.organization, [(o.product, o.quantity) for o in orders]
+        )
         data = []
 
-        for o in orders:
+        for o, bom_details in zip(orders, bom_status):
             data.append({
                 "id": o.id,
                 "product_id": o.product.id,
@@ -175,7 +181,7 @@ class PlannedOrderListView(APIView):
                     for so in o.sales_orders.all()
                 ],
 
-                "bom_details": get_bom_status(o.product, o.quantity)   # ← Now correct
+                "bom_details": bom_details
             })
 
         return Response(data)
@@ -432,7 +438,8 @@ class ManufacturingOrderCompleteView(APIView):
 # Add this to the end of views.py
 class MachineLoadView(APIView):
     """
-    Get current load on machines from planned and manufacturing orders
+    Get current load on machines from planned and manufacturing orders.
+    Each machine also carries a `daily_load` histogram over the window.
     """
     permission_classes = [IsAuthenticated]
     
@@ -443,84 +450,20 @@ class MachineLoadView(APIView):
         
         if not start_date:
             start_date = timezone.now().date()
-        if not end_date:
-            end_date = start_date + timedelta(days=30)
-            
         if isinstance(start_date, str):
             start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d').date()
+
+        if not end_date:
+            end_date = start_date + timedelta(days=30)
         if isinstance(end_date, str):
             end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
             
-        days_in_period = (end_date - start_date).days + 1
-            
-        # Get all machines (not work centers)
-        machines = Machine.objects.filter(organization=org, is_active=True)
-        
-        result = []
-        
-        for machine in machines:
-            # Calculate total capacity
-            total_capacity = machine.get_effective_capacity(days=days_in_period)
-            
-            load_data = {
-                'machine_id': machine.id,
-                'machine_name': machine.name,
-                'machine_code': machine.code,
-                'work_center_type': machine.work_center_type,
-                'maintenance_status': machine.maintenance_status,
-                'capacity_per_day': float(machine.capacity_per_day_hours),
-                'efficiency_percentage': float(machine.efficiency_percentage),
-                'utilization_percentage': float(machine.utilization_percentage),
-                'effective_capacity': total_capacity,
-                'total_load': 0,
-                'load_details': []
-            }
-            
-            # Find all operations for this machine
-            operations = RoutingOperation.objects.filter(
-                machine=machine,
-                routing__product__organization=org
-            ).select_related('routing__product')
-            
-            for op in operations:
-                # Find planned orders for this product
-                planned_orders = PlannedOrder.objects.filter(
-                    product=op.routing.product,
-                    planned_start__lte=end_date,
-                    planned_finish__gte=start_date,
-                    status__in=['planned', 'confirmed']
-                )
-                
-                for po in planned_orders:
-                    # Calculate load
-                    load_hours = float(op.expected_hours) * float(po.quantity)
-                    load_data['total_load'] += load_hours
-                    load_data['load_details'].append({
-                        'planned_order_id': po.id,
-                        'product': po.product.name,
-                        'quantity': po.quantity,
-                        'operation': op.operation_name,
-                        'load_hours': round(load_hours, 2),
-                        'start_date': po.planned_start,
-                        'finish_date': po.planned_finish,
-                        'scheduling_type': po.scheduling_type
-                    })
-            
-            # Calculate utilization
-            if total_capacity > 0:
-                load_data['utilization_percentage'] = round(
-                    (load_data['total_load'] / total_capacity) * 100, 2
-                )
-                load_data['remaining_capacity'] = round(total_capacity - load_data['total_load'], 2)
-            else:
-                load_data['utilization_percentage'] = 0
-                load_data['remaining_capacity'] = 0
-            
-            result.append(load_data)
-        
-        # Sort by utilization
-        result.sort(key=lambda x: x['utilization_percentage'], reverse=True)
-        
+        if end_date < start_date:
+            return Response({"error": "end_date must be on or after start_date"}, status=400)
+
+        # Bulk load + per-day buckets (3 queries regardless of machine count)
+        result = MachineLoadEngine(org, start_date, end_date).run()
+
         return Response(result)
 
 # views.py - Simplified version
@@ -743,20 +686,11 @@ class MachineAvailabilityAPIView(APIView):
         except ValueError:
             return Response({'error': 'Invalid date format'}, status=400)
         
-        # Calculate capacity
-        days = (end - start).days + 1
-        total_capacity = float(machine.capacity_per_day_hours) * days
-        
-        # Get existing assignments
-        existing_orders = ManufacturingOrder.objects.filter(
-            machine=machine,
-            start_date__lte=end,
-            finish_date__gte=start,
-            status__in=['draft', 'in_progress']
-        )
-        
-        assigned_hours = sum(float(order.required_hours or 0) for order in existing_orders)
-        available_capacity = total_capacity - assigned_hours
+        # Capacity minus booked hours, from the machine booking index
+        status_info = get_booking_index(organization).availability(
+            start, end, required_hours, machine_ids={machine.id}
+        ).get(machine.id)
+        available_capacity = status_info['available_hours'] if status_info else 0.0
         
         available = required_hours <= available_capacity
         
@@ -786,39 +720,21 @@ class MachineSuggestDatesAPIView(APIView):
                 'days_needed': 1
             })
         
-        # Start from tomorrow
-        start_date = timezone.now().date() + timedelta(days=1)
-        daily_capacity = float(machine.capacity_per_day_hours)
-        
-        if daily_capacity <= 0:
-            daily_capacity = 8  # Default 8 hours if not set
-        
-        days_needed = max(1, int(required_hours / daily_capacity) + 1)
-        
-        # Find first available slot
-        current_date = start_date
-        available_days = 0
-        
-        for _ in range(30):  # Check next 30 days
-            # Check if machine is free on this day
-            orders_on_day = ManufacturingOrder.objects.filter(
-                machine=machine,
-                start_date__lte=current_date,
-                finish_date__gte=current_date,
-                status__in=['draft', 'in_progress']
-            )
-            
-            if orders_on_day.count() == 0:  # Free day
-                available_days += 1
-                if available_days >= days_needed:
-                    end_date = current_date
-                    break
-            else:
-                available_days = 0
-            
-            current_date += timedelta(days=1)
-        
-        end_date = start_date + timedelta(days=days_needed - 1)
+        # Earliest slot from tomorrow against committed hours per day
+        scheduler = FiniteCapacityScheduler(organization).load()
+        if machine.id not in scheduler.machines:
+            return Response({'error': 'Machine is not operational'}, status=400)
+
+        slot = scheduler.calendar.earliest_slot(
+            machine.id, required_hours, scheduler.start_date, scheduler.horizon_end
+        )
+        if slot is None:
+            return Response({
+                'error': f'No free capacity before {scheduler.horizon_end.isoformat()}'
+            }, status=400)
+
+        start_date, end_date, allocation = slot
+        days_needed = (end_date - start_date).days + 1
         
         return Response({
             'suggested_start_date': start_date.isoformat(),
@@ -830,7 +746,11 @@ class MachineSuggestDatesAPIView(APIView):
 # ====================== ASSIGN MACHINE VIEW ======================
 
 class AssignMachineAPIView(APIView):
-    """Assign machine to manufacturing order"""
+    """
+    Assign machine to the draft manufacturing orders of a plan.
+    The orders are placed against the machine's free capacity from
+    start_date (default today); with end_date they must finish by then.
+    """
     permission_classes = [IsAuthenticated]
     
     def post(self, request, plan_id):
@@ -840,75 +760,116 @@ class AssignMachineAPIView(APIView):
         machine_id = request.data.get('machine_id')
         start_date = request.data.get('start_date')
         end_date = request.data.get('end_date')
-        
+
         if not machine_id:
             return Response({'message': 'Machine ID required'}, status=400)
-        
+
         machine = get_object_or_404(Machine, id=machine_id, organization=organization)
         
-        # Get all manufacturing orders for this plan
-        planned_orders = PlannedOrder.objects.filter(production_plan=plan)
-        manufacturing_orders = ManufacturingOrder.objects.filter(
-            planned_order__in=planned_orders,
+        manufacturing_orders = list(ManufacturingOrder.objects.filter(
+            planned_order__production_plan=plan,
             status='draft'
-        )
+        ))
         
-        if not manufacturing_orders.exists():
+        if not manufacturing_orders:
             return Response({
                 'message': f'No manufacturing orders found for plan #{plan_id}'
             }, status=400)
         
-        # Calculate total hours
-        total_hours = sum(float(mo.required_hours or 0) for mo in manufacturing_orders)
-        
         # Parse dates
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d').date()
-        else:
-            start = timezone.now().date()
-        
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d').date()
-        else:
-            # Calculate end date based on capacity
-            daily_capacity = float(machine.capacity_per_day_hours)
-            days_needed = max(1, int(total_hours / daily_capacity) + 1) if daily_capacity > 0 else 1
-            end = start + timedelta(days=days_needed - 1)
-        
-        # Check availability
-        days = (end - start).days + 1
-        total_capacity = float(machine.capacity_per_day_hours) * days
-        
-        existing_orders = ManufacturingOrder.objects.filter(
-            machine=machine,
-            start_date__lte=end,
-            finish_date__gte=start,
-            status__in=['draft', 'in_progress']
-        ).exclude(id__in=[mo.id for mo in manufacturing_orders])
-        
-        assigned_hours = sum(float(order.required_hours or 0) for order in existing_orders)
-        available_capacity = total_capacity - assigned_hours
-        
-        if total_hours > available_capacity:
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else timezone.now().date()
+            end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        except ValueError:
+            return Response({'message': 'Dates must be YYYY-MM-DD'}, status=400)
+
+        if end and end < start:
+            return Response({'message': 'end_date must not be before start_date'}, status=400)
+
+        scheduler = FiniteCapacityScheduler(
+            organization,
+            start_date=start,
+            horizon_days=(end - start).days if end else DEFAULT_HORIZON_DAYS
+        ).load(exclude_mo_ids=[mo.id for mo in manufacturing_orders])
+        schedule = scheduler.schedule(manufacturing_orders, machine_ids={machine.id})
+
+        failed = [p for p in schedule if 'error' in p]
+        if failed:
             return Response({
-                'message': f'Insufficient capacity. Available: {available_capacity:.1f} hrs, Required: {total_hours:.1f} hrs'
+                'message': f'Insufficient capacity for {len(failed)} manufacturing order(s)',
+                'schedule': schedule
             }, status=400)
-        
-        # Assign machine to all manufacturing orders
-        for mo in manufacturing_orders:
-            mo.machine = machine
-            mo.start_date = start
-            mo.finish_date = end
-            mo.status = 'in_progress'
-            mo.save()
-        
+
+        created = scheduler.commit(manufacturing_orders, schedule)
+        if not created:
+            return Response({
+                'message': 'Manufacturing orders were already scheduled',
+                'schedule': schedule
+            }, status=409)
+
+        booked = [p for p in schedule if 'error' not in p]
         return Response({
-            'message': f'Machine assigned to {manufacturing_orders.count()} manufacturing orders',
+            'message': f'Machine assigned to {len(booked)} manufacturing orders',
             'plan_id': plan.id,
             'machine': machine.name,
-            'start_date': start.isoformat(),
-            'end_date': end.isoformat(),
-            'total_hours': round(total_hours, 2)
+            'start_date': min(p['start_date'] for p in booked).isoformat(),
+            'end_date': max(p['finish_date'] for p in booked).isoformat(),
+            'total_hours': round(sum(p['hours'] for p in booked), 2),
+            'schedule': schedule
+        })
+
+
+class ScheduleManufacturingOrdersAPIView(APIView):
+    """
+    Finite-capacity schedule for a batch of manufacturing orders.
+
+    POST {
+        "manufacturing_order_ids": [..]  (default: all draft MOs),
+        "start_date": "YYYY-MM-DD"       (default: tomorrow),
+        "horizon_days": 120,
+        "commit": false                  (true → create draft work orders)
+    }
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        organization = request.user.organization
+
+        orders = ManufacturingOrder.objects.filter(
+            product__organization=organization,
+            status='draft'
+        ).select_related('product')
+        mo_ids = request.data.get('manufacturing_order_ids')
+        if mo_ids:
+            orders = orders.filter(id__in=mo_ids)
+        orders = list(orders)
+
+        if not orders:
+            return Response({'message': 'No draft manufacturing orders to schedule'}, status=400)
+
+        try:
+            start = request.data.get('start_date')
+            start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+            horizon_days = int(request.data.get('horizon_days') or DEFAULT_HORIZON_DAYS)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid start_date or horizon_days'}, status=400)
+
+        scheduler = FiniteCapacityScheduler(
+            organization, start_date=start, horizon_days=horizon_days
+        ).load(exclude_mo_ids=[mo.id for mo in orders])
+        schedule = scheduler.schedule(orders)
+
+        committed = 0
+        if request.data.get('commit'):
+            committed = len(scheduler.commit(orders, schedule))
+
+        return Response({
+            'start_date': scheduler.start_date.isoformat(),
+            'horizon_end': scheduler.horizon_end.isoformat(),
+            'scheduled': sum(1 for p in schedule if 'error' not in p),
+            'unscheduled': sum(1 for p in schedule if 'error' in p),
+            'work_orders_created': committed,
+            'schedule': schedule
         })
 
 from .services import ProductionService
@@ -928,51 +889,135 @@ class AvailableMachinesAPIView(APIView):
 
 
 class AssignMachinesAPIView(APIView):
+    """
+    Convert ready MOs into Work Orders. Accepts a single
+    manufacturing_order_id, a list in manufacturing_order_ids, or
+    nothing (all ready MOs of the organization).
+    """
     def post(self, request):
         order_id = request.data.get('manufacturing_order_id')
+        order_ids = request.data.get('manufacturing_order_ids') or ([order_id] if order_id else None)
         machine_id = request.data.get('machine_id')   # New
 
-        count, message = ProductionService.assign_machines_and_create_workorders(order_id, machine_id)
+        report = ProductionService.bulk_create_workorders(
+            manufacturing_order_ids=order_ids,
+            machine_id=machine_id,
+            organization=request.user.organization,
+        )
+        count, message = ProductionService.summarize_workorder_report(report)
 
         if count > 0:
-            return Response({"success": True, "message": message, "created_count": count})
-        return Response({"success": False, "message": message}, status=400)
+            return Response({
+                "success": True,
+                "message": message,
+                "created_count": count,
+                "results": report['results']
+            })
+        return Response({
+            "success": False,
+            "message": message,
+            "results": report.get('results', [])
+        }, status=400)
 
 class MachineAvailabilityCheckAPIView(APIView):
+    """
+    Free / busy check against the machine booking index.
+
+    ?machine_id=..               → one machine (legacy response shape)
+    ?machine_id omitted          → every machine of the organization
+    optional: manufacturing_order_id, start_date, end_date, required_hours
+    """
+    permission_classes = [IsAuthenticated]
+
     def get(self, request):
+        organization = request.user.organization
         machine_id = request.query_params.get('machine_id')
         order_id = request.query_params.get('manufacturing_order_id')  # optional, for better estimation
 
-        if not machine_id:
-            return Response({"error": "machine_id is required"}, status=400)
-
-        try:
-            machine = Machine.objects.get(id=machine_id)
-        except Machine.DoesNotExist:
-            return Response({"error": "Machine not found"}, status=404)
-
         # For simplicity, use today's date + estimated days (or fetch from order)
         proposed_start = timezone.now().date()
         proposed_end = proposed_start + timedelta(days=10)  # fallback
 
         if order_id:
-            try:
-                mo = ManufacturingOrder.objects.get(id=order_id, status='draft')
-                # Reuse your calculation logic here if needed
+            mo = ManufacturingOrder.objects.filter(
+                id=order_id, status='draft', product__organization=organization
+            ).first()
+            if mo:
                 proposed_start = mo.start_date or proposed_start
-                # ... calculate proposed_end similarly
-            except:
-                pass
+                proposed_end = mo.finish_date or proposed_start + timedelta(days=10)
+
+        try:
+            if request.query_params.get('start_date'):
+                proposed_start = datetime.strptime(request.query_params['start_date'], '%Y-%m-%d').date()
+            if request.query_params.get('end_date'):
+                proposed_end = datetime.strptime(request.query_params['end_date'], '%Y-%m-%d').date()
+            required_hours = float(request.query_params.get('required_hours', 0))
+        except ValueError:
+            return Response({"error": "Invalid date or required_hours"}, status=400)
+
+        index = get_booking_index(organization)
+
+        if machine_id:
+            try:
+                machine_id = int(machine_id)
+            except ValueError:
+                return Response({"error": "Machine not found"}, status=404)
+            if machine_id not in index.machines:
+                # The index holds active machines only
+                machine = Machine.objects.filter(
+                    id=machine_id, organization=organization
+                ).values('id', 'name').first()
+                if not machine:
+                    return Response({"error": "Machine not found"}, status=404)
+                return Response({
+                    "machine_id": machine['id'],
+                    "machine_name": machine['name'],
+                    "is_available": False,
+                    "is_active": False,
+                    "is_busy": False,
+                    "capacity_hours": 0.0,
+                    "booked_hours": 0.0,
+                    "available_hours": 0.0,
+                    "has_capacity": False,
+                    "reason": "Machine is inactive",
+                })
+            machine_ids = {machine_id}
+        else:
+            machine_ids = None
 
-        busy_info = ProductionService.get_machine_busy_info(machine, proposed_start, proposed_end)
+        availability = index.availability(proposed_start, proposed_end, required_hours, machine_ids)
+
+        data = []
+        for m_id, info in availability.items():
+            machine = index.machines[m_id]
+            conflicts = info.pop('conflicts')
+            busy_info = {'is_busy': info['is_busy']}
+            if conflicts:
+                busy_info.update({
+                    'current_work_order_id': conflicts[0].ref_id,
+                    'running_end_date': conflicts[0].finish,
+                    'running_start_date': conflicts[0].start,
+                    'status': conflicts[0].status,
+                })
+            data.append({
+                "machine_id": machine.id,
+                "machine_name": machine.name,
+                "is_available": not info['is_busy'] and machine.maintenance_status == 'operational',
+                "is_active": True,
+                **busy_info,
+                **{k: v for k, v in info.items() if k != 'is_busy'},
+            })
+
+        if machine_id:
+            return Response(data[0])
 
         return Response({
-            "machine_id": machine.id,
-            "machine_name": machine.name,
-            "is_available": not busy_info['is_busy'],
-            **busy_info
-        })        
-    
+            "start_date": proposed_start.isoformat(),
+            "end_date": proposed_end.isoformat(),
+            "required_hours": required_hours,
+            "machines": sorted(data, key=lambda d: (not d['is_available'], -d['available_hours'])),
+        })
+
 # apps/production/views.py
 
 from collections import defaultdict
@@ -992,142 +1037,18 @@ from .models import (
     BillOfMaterial, Routing, RoutingOperation
 )
 from apps.inventory.models import Item, StockLedger, ItemDependency
+from apps.inventory.services import get_stock_balance
 from apps.sales.models import SalesOrder, SalesOrderItem
+from .mrp import (
+    MRPEngine, NetChangeMRPEngine, MRPError,
+    get_bom_status, get_bom_status_bulk, run_single_item_mrp,
+)
+from .jobs import enqueue_mrp_job
 
 
 def get_stock_on_hand(item: Item) -> Decimal:
-    """Real stock from StockLedger (IN - OUT - ADJ negative)"""
-    aggregates = StockLedger.objects.filter(item=item).aggregate(
-        total_in=Sum('quantity', filter=Q(transaction_type='IN')),
-        total_out=Sum('quantity', filter=Q(transaction_type='OUT')),
-        total_adj=Sum('quantity', filter=Q(transaction_type='ADJ')),
-    )
-    
-    in_total  = aggregates['total_in']  or Decimal('0')
-    out_total = aggregates['total_out'] or Decimal('0')
-    adj_total = aggregates['total_adj'] or Decimal('0')
-    
-    return Decimal(in_total + adj_total - out_total)
-
-
-def explode_bom(product_id: int, qty: Decimal, demand_dict: dict):
-    """Recursive BOM explosion – accumulates gross dependent demand"""
-    demand_dict[product_id] = demand_dict.get(product_id, Decimal('0')) + qty
-    
-    bom = BillOfMaterial.objects.filter(
-        product_id=product_id,
-        is_active=True
-    ).order_by('-created_at').first()  # latest active version
-    
-    if not bom:
-        return
-    
-    for line in bom.lines.all():
-        component_qty = qty * line.quantity
-        explode_bom(line.component_id, component_qty, demand_dict)
-# Add this at the top of apps/production/views.py (after imports)
-from decimal import Decimal
-from django.db.models import Sum, Q
-from apps.inventory.models import StockLedger
-
-def get_stock_on_hand(item: Item) -> Decimal:
-    """Calculate real available stock from StockLedger"""
-    aggregates = StockLedger.objects.filter(item=item).aggregate(
-        total_in=Sum('quantity', filter=Q(transaction_type='IN')),
-        total_out=Sum('quantity', filter=Q(transaction_type='OUT')),
-        total_adj=Sum('quantity', filter=Q(transaction_type='ADJ')),
-    )
-    
-    in_total = aggregates['total_in'] or Decimal('0')
-    out_total = aggregates['total_out'] or Decimal('0')
-    adj_total = aggregates['total_adj'] or Decimal('0')
-    
-    return Decimal(in_total + adj_total - out_total)
-
-
-def get_bom_status(product, qty):
-    """
-    Returns BOM status using your actual ItemDependency model
-    """
-    # Get all dependent items (components) for this product
-    dependencies = ItemDependency.objects.filter(
-        parent_item=product
-    ).select_related('child_item')
-
-    if not dependencies.exists():
-        return []  # No dependent items
-
-    result = []
-
-    for dep in dependencies:
-        required = Decimal(str(qty)) * dep.quantity
-
-        # Current stock
-        stock = get_stock_on_hand(dep.child_item)
-
-        # Open planned orders for this component
-        planned = PlannedOrder.objects.filter(
-            product=dep.child_item,
-            status__in=["planned", "confirmed"]
-        ).aggregate(total=Sum("quantity"))["total"] or Decimal('0')
-
-        shortage = required - (stock + planned)
-
-        result.append({
-            "component": dep.child_item.name,
-            "component_code": dep.child_item.code,
-            "required": float(required),
-            "stock": float(stock),
-            "planned": float(planned),
-            "shortage": float(max(shortage, 0)),
-            "uom": dep.child_item.uom
-        })
-
-    return result
-def calculate_operation_time(product: Item, qty: Decimal) -> Decimal:
-    """Estimate total production time in hours from routing"""
-    routing = Routing.objects.filter(product=product, is_active=True).first()
-    if not routing:
-        return Decimal('8') * 3  # fallback 3 days × 8h
-    
-    total_hours = Decimal('0')
-    for op in routing.operations.all().order_by('sequence'):
-        if op.expected_hours:
-            total_hours += op.expected_hours * qty
-        # You can add setup + queue time from machine here later
-    
-    return total_hours
-
-
-def get_planned_dates(
-    item: Item,
-    qty: Decimal,
-    ref_date: date,
-    scheduling_type: str = 'lead_time'
-) -> tuple[date, date]:
-    """
-    Returns (planned_start, planned_finish)
-    Backward scheduling is used (finish date first)
-    """
-    if scheduling_type == 'basic_dates':
-        days = item.fixed_lead_time_days or 7
-        finish = ref_date + timedelta(days=days)
-        start = finish - timedelta(days=days)
-        return start, finish
-
-    # Lead time scheduling – based on routing time
-    total_hours = calculate_operation_time(item, qty)
-    
-    # Assume 8 productive hours per day
-    productive_days = math.ceil(total_hours / Decimal('8'))
-    
-    # Add safety buffer (queue/setup/inspection)
-    buffer_days = 2
-    
-    finish = ref_date + timedelta(days=buffer_days)  # need-by date
-    start = finish - timedelta(days=productive_days + buffer_days)
-    
-    return max(start, ref_date), finish
+    """Real stock across all departments, read from StockBalance (IN + ADJ - OUT)"""
+    return get_stock_balance(item)
 
 
 class RunMRPView(APIView):
@@ -1136,106 +1057,30 @@ class RunMRPView(APIView):
     def post(self, request):
         org = request.user.organization
         ref_date = timezone.now().date()  # MRP reference date
+        mode = request.data.get("mode", "regenerative")  # or "net_change"
 
-        # 1. Check if there is anything to plan
-        if not SalesOrder.objects.filter(
+        if mode not in ("regenerative", "net_change"):
+            return Response({"detail": f"Invalid mode '{mode}'"}, status=400)
+
+        # 1. Check if there is anything to plan (net change may only cancel)
+        if mode == "regenerative" and not SalesOrder.objects.filter(
             organization=org,
             status='approved'
         ).exists():
             return Response({"detail": "No approved sales orders found"}, status=400)
 
-        # 2. Create MRP run header
-        plan = ProductionPlan.objects.create(
-            organization=org,
-            created_by=request.user,
-            planned_date=ref_date,
-            status="mrp_done"
-        )
-
-        # 3. Collect top-level demand (sales orders)
-        top_demand = SalesOrderItem.objects.filter(
-            sales_order__organization=org,
-            sales_order__status='approved'
-        ).values('product_id').annotate(
-            total_demand=Sum('quantity')
-        )
-
-        # 4. Explode BOM → get gross requirements for all levels
-        gross_requirements = defaultdict(Decimal)
-        for row in top_demand:
-            explode_bom(row['product_id'], row['total_demand'] or Decimal('0'), gross_requirements)
-
-        # 5. Netting + proposal generation
-        created_planned = 0
-        created_requisitions = 0
-
-        for product_id, gross_qty in gross_requirements.items():
-            try:
-                product = Item.objects.get(id=product_id, organization=org)
-            except Item.DoesNotExist:
-                continue
-
-            # ── Supply ───────────────────────────────────────
-            on_hand = get_stock_on_hand(product)
-
-            # Open planned orders (not yet converted)
-            open_planned = PlannedOrder.objects.filter(
-                product=product,
-                production_plan__organization=org,
-                status__in=['planned', 'confirmed']
-            ).aggregate(total=Sum('quantity'))['total'] or Decimal('0')
-
-            # Open manufacturing orders (released but not finished)
-            open_mo = ManufacturingOrder.objects.filter(
-                product=product,
-                status__in=['in_progress']
-            ).aggregate(total=Sum('quantity'))['total'] or Decimal('0')
-
-            total_supply = on_hand + open_planned + open_mo
-
-            # ── Net Requirement ──────────────────────────────
-            net_qty = max(Decimal('0'), gross_qty - total_supply)
-
-            if net_qty <= 0:
-                continue  # covered by stock / open supply
-
-            # ── Decide make or buy ───────────────────────────
-            has_active_bom = BillOfMaterial.objects.filter(
-                product=product,
-                is_active=True
-            ).exists()
-
-            # ── Scheduling type ──────────────────────────────
-            scheduling = 'lead_time' if has_active_bom else 'basic_dates'
-
-            # ── Calculate dates (backward scheduling) ────────
-            start_date, finish_date = get_planned_dates(
-                product, net_qty, ref_date, scheduling
-            )
+        # 2. Load demand / BOMs / supply in bulk, explode + net in memory
+        if mode == "net_change":
+            engine = NetChangeMRPEngine(org, ref_date)
+        else:
+            engine = MRPEngine(org, ref_date)
+        try:
+            plan = engine.run(created_by=request.user)
+        except MRPError as e:
+            return Response({"detail": str(e)}, status=400)
 
-            # ── Create proposal ──────────────────────────────
-            if has_active_bom:
-                # Manufactured item → Planned Order
-                PlannedOrder.objects.create(
-                    production_plan=plan,
-                    product=product,
-                    quantity=net_qty,
-                    planned_start=start_date,
-                    planned_finish=finish_date,
-                    scheduling_type='production',
-                    status='planned'
-                )
-                created_planned += 1
-            else:
-                # Purchased / raw material → Purchase Requisition
-                PurchaseRequisition.objects.create(
-                    production_plan=plan,
-                    material=product,
-                    quantity=net_qty,
-                    required_date=finish_date,
-                    status='open'
-                )
-                created_requisitions += 1
+        created_planned = len(engine.planned_orders)
+        created_requisitions = len(engine.requisitions)
 
         msg = (
             f"MRP completed. "
@@ -1246,13 +1091,24 @@ class RunMRPView(APIView):
         if created_planned + created_requisitions == 0:
             msg += " (all demand covered by stock/open orders)"
 
-        return Response({
+        data = {
             "detail": msg,
+            "mode": mode,
             "production_plan_id": plan.id,
             "reference_date": ref_date.isoformat(),
-            "gross_items": len(gross_requirements),
+            "gross_items": len(engine.gross_requirements),
             "net_items_with_requirement": created_planned + created_requisitions
-        }, status=status.HTTP_201_CREATED)
+        }
+        if mode == "net_change":
+            data.update({
+                "changed_items": len(engine.changed),
+                "replanned_items": len(engine.affected),
+                "created": engine.created,
+                "updated": engine.updated,
+                "cancelled": engine.cancelled,
+            })
+
+        return Response(data, status=status.HTTP_201_CREATED)
 
 # apps/production/views.py
 
@@ -1270,96 +1126,183 @@ class RunSingleItemMRPView(APIView):
         except Item.DoesNotExist:
             return Response({"error": "Product not found"}, status=404)
 
-        # 1. Calculate net requirement from approved sales orders
-        sales_items = SalesOrderItem.objects.filter(
-            product=product,
-            sales_order__status="approved",
-            sales_order__organization=org
-        ).select_related('sales_order')
+        result = run_single_item_mrp(org, product, created_by=request.user, ref_date=ref_date)
+
+        if result.get("has_shortage"):
+            return Response(result, status=400)
+        if result.get("success"):
+            return Response(result, status=201)
+        return Response(result, status=200)
+
+
+
+class BOMAvailabilityView(APIView):
+    """
+    Batch BOM availability check.
+
+    POST {"items": [{"product_id": 1, "quantity": 10}, ...]}
+      or {"sales_order_id": 5}   (uses the order's lines)
+
+    Returns per-line component status (same rows as planned-order
+    bom_details) plus a combined view where lines sharing a component
+    compete for the same stock / planned supply.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        org = request.user.organization
+
+        if request.data.get("sales_order_id"):
+            so = get_object_or_404(SalesOrder, id=request.data["sales_order_id"], organization=org)
+            pairs = [
+                (line.product_id, line.quantity)
+                for line in so.items.filter(product__isnull=False)
+            ]
+        else:
+            pairs = []
+            for line in request.data.get("items") or []:
+                try:
+                    pairs.append((int(line["product_id"]), Decimal(str(line["quantity"]))))
+                except (KeyError, TypeError, ValueError, ArithmeticError):
+                    return Response(
+                        {"detail": "Each item needs a numeric product_id and quantity"},
+                        status=400
+                    )
+
+        if not pairs:
+            return Response({"detail": "No items to check"}, status=400)
+
+        products = Item.objects.filter(
+            organization=org, id__in={product_id for product_id, _ in pairs}
+        ).in_bulk()
+        missing = {product_id for product_id, _ in pairs} - set(products)
+        if missing:
+            return Response({"error": f"Product(s) not found: {sorted(missing)}"}, status=404)
+
+        bom_status = get_bom_status_bulk(org, pairs)
+
+        lines = []
+        combined = {}
+        for (product_id, qty), components in zip(pairs, bom_status):
+            lines.append({
+                "product_id": product_id,
+                "product_name": products[product_id].name,
+                "quantity": float(qty),
+                "has_shortage": any(c["shortage"] > 0 for c in components),
+                "components": components,
+            })
+            for c in components:
+                row = combined.setdefault(c["component_id"], {
+                    **c, "required": 0.0, "shortage": 0.0
+                })
+                row["required"] += c["required"]
+
+        for row in combined.values():
+            row["shortage"] = max(row["required"] - (row["stock"] + row["planned"]), 0.0)
 
-        demand = sales_items.aggregate(total=Sum("quantity"))["total"] or Decimal('0')
-        stock = get_stock_on_hand(product)
+        return Response({
+            "has_shortage": any(row["shortage"] > 0 for row in combined.values()),
+            "lines": lines,
+            "components": list(combined.values()),
+        })
 
-        planned_qty = PlannedOrder.objects.filter(
-            product=product,
-            status__in=["planned", "confirmed"]
-        ).aggregate(total=Sum("quantity"))["total"] or Decimal('0')
+# ====================== MRP JOBS (BACKGROUND) ======================
 
-        required = Decimal(str(demand)) - Decimal(str(stock)) - Decimal(str(planned_qty))
+class MRPJobListCreateView(APIView):
+    """
+    GET  → recent MRP jobs for the organization
+    POST → queue a run: {"job_type": "full" | "net_change"} or
+           {"job_type": "single_item", "item_id": 5}
+    Returns 202 with the job id; poll MRPJobDetailView for progress.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        jobs = MRPJob.objects.filter(
+            organization=request.user.organization
+        ).select_related("item")[:50]
+        return Response(MRPJobSerializer(jobs, many=True).data)
+
+    def post(self, request):
+        org = request.user.organization
+        job_type = request.data.get("job_type", "full")
 
-        if required <= 0:
-            return Response({"detail": "No additional production required"}, status=200)
+        if job_type not in dict(MRPJob.JOB_TYPE_CHOICES):
+            return Response({"detail": f"Invalid job_type '{job_type}'"}, status=400)
 
-        # 2. Check for material shortages
-        bom_details = get_bom_status(product, required)
-        has_shortage = any(float(item.get('shortage', 0)) > 0 for item in bom_details)
+        item = None
+        if job_type == "single_item":
+            item_id = request.data.get("item_id")
+            if not item_id:
+                return Response({"detail": "item_id is required for single_item jobs"}, status=400)
+            try:
+                item = Item.objects.get(id=item_id, organization=org)
+            except Item.DoesNotExist:
+                return Response({"error": "Product not found"}, status=404)
+        elif job_type == "full" and not SalesOrder.objects.filter(organization=org, status='approved').exists():
+            return Response({"detail": "No approved sales orders found"}, status=400)
 
-        if has_shortage:
+        # One active run per organization/item is enough
+        active = MRPJob.objects.filter(
+            organization=org,
+            job_type=job_type,
+            item=item,
+            status__in=["queued", "running"]
+        ).first()
+        if active:
             return Response({
-                "detail": "Cannot create Production Order - Material shortage detected",
-                "has_shortage": True,
-                "shortages": [d for d in bom_details if float(d.get('shortage', 0)) > 0]
-            }, status=400)
+                "detail": "An MRP job is already in progress",
+                "job_id": active.id,
+                "status": active.status
+            }, status=status.HTTP_409_CONFLICT)
 
-        # 3. Get or create Production Plan
-        production_plan = ProductionPlan.objects.filter(
-            organization=org
-        ).order_by("-created_at").first()
-
-        if not production_plan:
-            production_plan = ProductionPlan.objects.create(
-                organization=org,
-                created_by=request.user,
-                planned_date=ref_date,
-                status="mrp_done"
-            )
+        job = enqueue_mrp_job(org, job_type=job_type, item=item, created_by=request.user)
+        return Response({
+            "detail": "MRP job queued",
+            "job_id": job.id,
+            "status": job.status
+        }, status=status.HTTP_202_ACCEPTED)
 
-        # 4. Create Planned Order
-        planned_order = PlannedOrder.objects.create(
-            production_plan=production_plan,
-            product=product,
-            quantity=required,
-            planned_start=ref_date,
-            planned_finish=ref_date + timedelta(days=5),
-            status="planned",
-            scheduling_type="production"
-        )
 
-        # Link to Sales Orders
-        so_ids = [item.sales_order_id for item in sales_items]
-        planned_order.sales_orders.set(so_ids)
-
-        # 5. Create ManufacturingOrder (This is your Production Order)
-        manufacturing_order = ManufacturingOrder.objects.create(
-            planned_order=planned_order,
-            product=product,
-            quantity=required,
-            status="draft",
-            start_date=ref_date,
-        )
-        routing = Routing.objects.filter(product=product, is_active=True).first()
-        if routing:
-            for op in routing.operations.all().order_by('sequence'):
-                MOOperation.objects.create(
-                    manufacturing_order=manufacturing_order,
-                    machine=op.machine,
-                    operation_name=op.operation_name,
-                    sequence=op.sequence,
-                    status="pending"
-                )
+class MRPJobDetailView(APIView):
+    """Status / progress / result of one MRP job"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(MRPJob, pk=pk, organization=request.user.organization)
+        return Response(MRPJobSerializer(job).data)
+
 
-        # Mark planned order as converted
-        planned_order.status = "converted"
-        planned_order.save()
+class MRPJobCancelView(APIView):
+    """
+    Queued jobs are cancelled immediately; running jobs stop at the next
+    progress checkpoint without saving any proposals.
+    """
+    permission_classes = [IsAuthenticated]
 
+    def post(self, request, pk):
+        job = get_object_or_404(MRPJob, pk=pk, organization=request.user.organization)
+
+        if job.is_finished:
+            return Response({"detail": f"Job already {job.status}"}, status=400)
+
+        cancelled = MRPJob.objects.filter(id=job.id, status="queued").update(
+            status="cancelled",
+            stage="Cancelled",
+            cancel_requested=True,
+            finished_at=timezone.now()
+        )
+        if not cancelled:
+            MRPJob.objects.filter(id=job.id).update(cancel_requested=True)
+
+        job.refresh_from_db()
         return Response({
-            "success": True,
-            "detail": f"Production Order created successfully for {product.name}",
-            "planned_order_id": planned_order.id,
-            "manufacturing_order_id": manufacturing_order.id,
-            "quantity": float(required),
-            "linked_sales_order_ids": so_ids
-        }, status=201)
+            "detail": "Job cancelled" if cancelled else "Cancellation requested",
+            "job_id": job.id,
+            "status": job.status
+        })
+
+
 # ====================== WORK ORDERS ======================
 
 class WorkOrderListView(APIView):
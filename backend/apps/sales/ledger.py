@@ -0,0 +1,194 @@
+# apps/sales/ledger.py
+
+from datetime import date
+from decimal import Decimal
+
+from django.core import signing
+from django.db import connection
+from django.db.models import DecimalField, F, IntegerField, Q, Value, CharField
+from django.db.models.functions import Coalesce, TruncDate
+
+from .models import SalesInvoice, SalesPayment, SalesReturn
+
+
+ZERO = Decimal('0.00')
+
+# Entries are ordered by (date, kind, id): on the same day an invoice
+# comes before the payments and returns made against it
+INVOICE, PAYMENT, RETURN = 0, 1, 2
+KIND_LABELS = {INVOICE: "Invoice", PAYMENT: "Payment", RETURN: "Return"}
+
+CURSOR_SALT = "sales.customer_ledger"
+
+_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+
+def _after(position, kind, date_field, id_field):
+    """Filter for one source's rows that come after `position` = (date, kind, id)"""
+    day, after_kind, after_id = position
+    q = Q(**{f"{date_field}__gt": day})
+    if kind > after_kind:
+        q |= Q(**{date_field: day})
+    elif kind == after_kind:
+        q |= Q(**{date_field: day, f"{id_field}__gt": after_id})
+    return q
+
+
+def ledger_union(organization, customer_id, start=None, end=None, after=None):
+    """
+    Invoices (debit), payments and returns (credit) of a customer as one
+    UNION ALL queryset of (entry_date, kind, doc_id, ref, debit, credit).
+    Date bounds and the cursor position are applied inside each branch.
+    """
+    invoices = SalesInvoice.objects.filter(
+        organization=organization, customer_id=customer_id
+    ).annotate(
+        entry_date=F('invoice_date'),
+        kind=Value(INVOICE, output_field=IntegerField()),
+        doc_id=F('id'),
+        ref=F('invoice_number'),
+        debit=Coalesce('grand_total', Value(ZERO), output_field=_AMOUNT),
+        credit=Value(ZERO, output_field=_AMOUNT),
+    )
+    payments = SalesPayment.objects.filter(
+        invoice__organization=organization, invoice__customer_id=customer_id
+    ).annotate(
+        entry_date=TruncDate('payment_date'),
+        kind=Value(PAYMENT, output_field=IntegerField()),
+        doc_id=F('id'),
+        ref=Value('', output_field=CharField()),
+        debit=Value(ZERO, output_field=_AMOUNT),
+        credit=Coalesce('amount', Value(ZERO), output_field=_AMOUNT),
+    )
+    returns = SalesReturn.objects.filter(
+        invoice__organization=organization, customer_id=customer_id
+    ).annotate(
+        entry_date=F('return_date'),
+        kind=Value(RETURN, output_field=IntegerField()),
+        doc_id=F('id'),
+        ref=Value('', output_field=CharField()),
+        debit=Value(ZERO, output_field=_AMOUNT),
+        credit=Coalesce('total_amount', Value(ZERO), output_field=_AMOUNT),
+    )
+
+    branches = []
+    for qs, kind in ((invoices, INVOICE), (payments, PAYMENT), (returns, RETURN)):
+        if start:
+            qs = qs.filter(entry_date__gte=start)
+        if end:
+            qs = qs.filter(entry_date__lte=end)
+        if after:
+            qs = qs.filter(_after(after, kind, 'entry_date', 'id'))
+        branches.append(
+            qs.order_by().values('entry_date', 'kind', 'doc_id', 'ref', 'debit', 'credit')
+        )
+    return branches[0].union(*branches[1:], all=True)
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def ledger_summary(organization, customer_id, start=None, end=None):
+    """
+    Opening balance (everything before `start`) and the period's debit /
+    credit totals, in one aggregate over the merged entries.
+    """
+    union_sql, params = ledger_union(organization, customer_id, end=end).query.sql_with_params()
+    start = start or date.min
+    (opening, debit, credit), = _execute(
+        f"""
+        SELECT
+            COALESCE(SUM(CASE WHEN ledger.entry_date < %s THEN ledger.debit - ledger.credit END), 0),
+            COALESCE(SUM(CASE WHEN ledger.entry_date >= %s THEN ledger.debit END), 0),
+            COALESCE(SUM(CASE WHEN ledger.entry_date >= %s THEN ledger.credit END), 0)
+        FROM ({union_sql}) ledger
+        """,
+        (start, start, start, *params),
+    )
+    opening, debit, credit = _decimal(opening), _decimal(debit), _decimal(credit)
+    return {
+        'opening_balance': opening,
+        'total_debit': debit,
+        'total_credit': credit,
+        'closing_balance': opening + debit - credit,
+    }
+
+
+def ledger_page(organization, customer_id, start=None, end=None, after=None,
+                balance=ZERO, limit=100):
+    """
+    Up to `limit` entries after the position `after`, with the running
+    balance computed by a window over the merged rows and carried on
+    from `balance` (the balance at `after`, or the opening balance).
+    Returns (entries, has_more).
+    """
+    union_sql, params = ledger_union(
+        organization, customer_id, start, end, after
+    ).query.sql_with_params()
+
+    rows = _execute(
+        f"""
+        SELECT
+            ledger.entry_date, ledger.kind, ledger.doc_id, ledger.ref,
+            ledger.debit, ledger.credit,
+            SUM(ledger.debit - ledger.credit) OVER (
+                ORDER BY ledger.entry_date, ledger.kind, ledger.doc_id
+                ROWS UNBOUNDED PRECEDING
+            )
+        FROM ({union_sql}) ledger
+        ORDER BY ledger.entry_date, ledger.kind, ledger.doc_id
+        LIMIT %s
+        """,
+        (*params, limit + 1),
+    )
+
+    entries = []
+    for day, kind, doc_id, ref, debit, credit, running in rows[:limit]:
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        if kind == PAYMENT:
+            ref = f"PAY-{doc_id}"
+        elif kind == RETURN:
+            ref = f"SR-{str(doc_id).zfill(5)}"
+        entries.append({
+            "date": day,
+            "type": KIND_LABELS[kind],
+            "kind": kind,
+            "id": doc_id,
+            "ref": ref,
+            "debit": _decimal(debit),
+            "credit": _decimal(credit),
+            "balance": balance + _decimal(running),
+        })
+    return entries, len(rows) > limit
+
+
+def encode_cursor(entry, start, end):
+    """Signed position (and balance) of the last entry sent"""
+    return signing.dumps({
+        'd': entry['date'].isoformat(),
+        'k': entry['kind'],
+        'i': entry['id'],
+        'b': str(entry['balance']),
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+    }, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """(after, balance, start, end) from a cursor; raises ValueError"""
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        after = (date.fromisoformat(data['d']), int(data['k']), int(data['i']))
+        start = date.fromisoformat(data['from']) if data['from'] else None
+        end = date.fromisoformat(data['to']) if data['to'] else None
+        return after, Decimal(data['b']), start, end
+    except (signing.BadSignature, KeyError, TypeError, ValueError, ArithmeticError):
+        raise ValueError("Invalid cursor")
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_salesinvoiceitem_returned_qty'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='salesinvoice',
+            name='invoice_number',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='salesinvoice',
+            constraint=models.UniqueConstraint(fields=('organization', 'invoice_number'), name='unique_sales_invoice_number_per_organization'),
+        ),
+    ]
@@ -1,9 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from apps.crm.models import Customer
 from apps.inventory.models import Item
 from apps.organizations.models import Organization
+from apps.organizations.sequences import next_document_number
 
 class SalesOrder(models.Model):
     ORDER_STATUS = [
@@ -323,7 +324,7 @@ class SalesInvoice(models.Model):
         ('cancelled', 'Cancelled'),
     ]
 
-    invoice_number = models.CharField(max_length=50, unique=True, blank=True)
+    invoice_number = models.CharField(max_length=50, blank=True)
 
     customer = models.ForeignKey(
         Customer,
@@ -370,6 +371,13 @@ class SalesInvoice(models.Model):
         ordering = ['-invoice_date']
         verbose_name = "Sales Invoice"
         verbose_name_plural = "Sales Invoices"
+        constraints = [
+            # Numbers come from per-organization sequences (INV-YYYYMM-NNNN)
+            models.UniqueConstraint(
+                fields=['organization', 'invoice_number'],
+                name='unique_sales_invoice_number_per_organization'
+            ),
+        ]
     def update_totals(self):
         totals = self.items.aggregate(
             taxable=models.Sum('taxable_value'),
@@ -382,16 +390,22 @@ class SalesInvoice(models.Model):
         self.grand_total = totals['total'] or 0
         self.save()
     def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            last = SalesInvoice.objects.filter(
-                organization=self.organization
-            ).order_by('-id').first()
-
-            num = 1 if not last else int(last.invoice_number.split('-')[-1]) + 1
-
-            self.invoice_number = f"INV-{timezone.now().strftime('%Y%m')}-{num:04d}"
-
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.invoice_number:
+                self.invoice_number = next_document_number(
+                    self.organization_id, "INV", seed=self._last_invoice_sequence
+                )
+            super().save(*args, **kwargs)
+
+    def _last_invoice_sequence(self):
+        """Suffix of the latest INV-YYYYMM-NNNN number (seeds the sequence)"""
+        last = SalesInvoice.objects.filter(
+            organization_id=self.organization_id
+        ).order_by('-id').values_list('invoice_number', flat=True).first()
+        try:
+            return int(last.split('-')[-1])
+        except (AttributeError, ValueError):
+            return 0
 
     def __str__(self):
         return self.invoice_number
@@ -1092,66 +1092,79 @@ class SalesPaymentViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
-from decimal import Decimal
-from datetime import date, datetime
-from django.db.models import Q
-from .models import SalesInvoice, SalesPayment, SalesReturn
-def normalize_date(d):
-    if isinstance(d, datetime):
-        return d.date()
-    return d
+from django.utils.dateparse import parse_date
+from rest_framework.utils.urls import replace_query_param
+from .ledger import ledger_summary, ledger_page, encode_cursor, decode_cursor
+
+
+def _ledger_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"'{name}' must be a date (YYYY-MM-DD)")
+    return day
+
+
 class CustomerLedgerView(APIView):
+    """
+    GET /sale/customer-ledger/<customer_id>/?from=YYYY-MM-DD&to=YYYY-MM-DD
+
+    Invoices, payments and returns in date order with a running balance
+    that starts from the balance brought forward. The first page also
+    carries the opening / closing balance and the period's totals.
+    Paging: ?cursor=...&page_size=N (default 100, max 1000)
+    """
+    permission_classes = [IsAuthenticated]
+
+    page_size = 100
+    max_page_size = 1000
+
     def get(self, request, customer_id):
         org = request.user.organization
-        ledger = []
-        invoices = SalesInvoice.objects.filter(
-            customer_id=customer_id,
-            organization=org
-        )
-        for inv in invoices:
-            amount = inv.grand_total or Decimal('0.00')
-            ledger.append({
-                "date": normalize_date(inv.invoice_date),
-                "type": "Invoice",
-                "ref": inv.invoice_number,
-                "debit": float(amount),
-                "credit": 0,
-            })
-        payments = SalesPayment.objects.filter(
-            invoice__customer_id=customer_id,
-            invoice__organization=org
-        )
-        for pay in payments:
-            amount = pay.amount or Decimal('0.00')
-            ledger.append({
-                "date": normalize_date(pay.payment_date),
-                "type": "Payment",
-                "ref": f"PAY-{pay.id}",
-                "debit": 0,
-                "credit": float(amount),
-            })
-        returns = SalesReturn.objects.filter(
-            customer_id=customer_id,
-            invoice__organization=org
+        params = request.query_params
+
+        try:
+            page_size = min(int(params.get('page_size', self.page_size)), self.max_page_size)
+            if page_size < 1:
+                raise ValueError("page_size must be positive")
+
+            cursor = params.get('cursor')
+            summary = None
+            if cursor:
+                after, balance, start, end = decode_cursor(cursor)
+            else:
+                start, end = (_ledger_date(params, p) for p in ('from', 'to'))
+                if start and end and start > end:
+                    raise ValueError("'from' must not be after 'to'")
+                after = None
+                summary = ledger_summary(org, customer_id, start, end)
+                balance = summary['opening_balance']
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        entries, has_more = ledger_page(
+            org, customer_id, start, end, after, balance, page_size
         )
-        for ret in returns:
-            amount = ret.total_amount or Decimal('0.00')
-            ledger.append({
-                "date": normalize_date(ret.return_date),
-                "type": "Return",
-                "ref": f"SR-{str(ret.id).zfill(5)}",
-                "debit": 0,
-                "credit": float(amount),   # 🔥 IMPORTANT
-            })
-        ledger.sort(key=lambda x: x["date"] or date.min)
-        running_balance = Decimal('0.00')
-        for row in ledger:
-            debit = Decimal(str(row["debit"]))
-            credit = Decimal(str(row["credit"]))
-            running_balance += debit
-            running_balance -= credit
-            row["balance"] = float(running_balance)
-        return Response(ledger)
+
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_cursor(entries[-1], start, end)
+            )
+
+        return Response({
+            "customer_id": customer_id,
+            "from": start,
+            "to": end,
+            **(summary or {}),
+            "next": next_url,
+            "results": [
+                {k: row[k] for k in ("date", "type", "ref", "debit", "credit", "balance")}
+                for row in entries
+            ],
+        })
 # from .models import PurchaseInvoice, VendorPayment, PurchaseReturn
 # def normalize_date(d):
 #     if isinstance(d, datetime):
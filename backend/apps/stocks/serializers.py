@@ -2,7 +2,7 @@
 from rest_framework import serializers
 from decimal import Decimal
 from apps.inventory.models import Item, StockLedger   # ← import from inventory app
-from django.db.models import Sum
+from apps.inventory.services import get_stock_balance
 
 class StockLedgerSerializer(serializers.ModelSerializer):
     item_code = serializers.CharField(source='item.code', read_only=True)
@@ -26,30 +26,40 @@ class StockLedgerSerializer(serializers.ModelSerializer):
 
 
 class ItemStockSerializer(serializers.ModelSerializer):
+    """
+    Expects a queryset from Item.objects.with_stock(); items without the
+    annotations fall back to a StockBalance lookup.
+    """
     current_stock    = serializers.SerializerMethodField()
     available_stock  = serializers.SerializerMethodField()
+    stock_value      = serializers.SerializerMethodField()
 
     class Meta:
         model = Item
         fields = [
             'id', 'name', 'code', 'category', 'uom',
             'standard_price', 'created_at',
-            'current_stock', 'available_stock',
+            'current_stock', 'available_stock', 'stock_value',
         ]
         read_only_fields = [
             'id', 'code', 'created_at',
-            'current_stock', 'available_stock'
+            'current_stock', 'available_stock', 'stock_value'
         ]
 
     def get_current_stock(self, obj: Item) -> Decimal:
-        in_sum = obj.stock_movements.filter(transaction_type='IN')\
-                                   .aggregate(s=Sum('quantity'))['s'] or Decimal('0.00')
-        out_sum = obj.stock_movements.filter(transaction_type='OUT')\
-                                    .aggregate(s=Sum('quantity'))['s'] or Decimal('0.00')
-        adj_sum = obj.stock_movements.filter(transaction_type='ADJ')\
-                                    .aggregate(s=Sum('quantity'))['s'] or Decimal('0.00')
-
-        return in_sum + adj_sum - out_sum
+        on_hand = getattr(obj, 'on_hand', None)
+        if on_hand is None:
+            on_hand = get_stock_balance(obj)
+        return on_hand
 
     def get_available_stock(self, obj: Item) -> Decimal:
-        return max(self.get_current_stock(obj), Decimal('0.00'))
\ No newline at end of file
+        available = getattr(obj, 'available', None)
+        if available is None:
+            available = max(self.get_current_stock(obj), Decimal('0.00'))
+        return available
+
+    def get_stock_value(self, obj: Item) -> Decimal:
+        value = getattr(obj, 'on_hand_value', None)
+        if value is None:
+            value = self.get_current_stock(obj) * obj.standard_price
+        return value
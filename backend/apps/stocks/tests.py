@@ -1,3 +1,47 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.inventory.models import Item
+from apps.organizations.models import Organization
+from apps.stocks.views import StockItemPagination
+
+
+class StockItemPaginationTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Org", subdomain="org", email="org@example.com")
+        user = get_user_model().objects.create(
+            username="stock", email="stock@example.com", organization=self.org
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.total = StockItemPagination.page_size + 5
+        Item.objects.bulk_create([
+            Item(organization=self.org, name=f"Item {i:03d}", code=f"C{i:03d}", uom="nos")
+            for i in range(self.total)
+        ])
+
+    def test_list_is_paginated(self):
+        response = self.client.get("/api/stock/items/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], self.total)
+        self.assertEqual(len(response.data["results"]), StockItemPagination.page_size)
+        self.assertIn("page=2", response.data["next"])
+        self.assertIsNone(response.data["previous"])
+
+    def test_pages_follow_ordering(self):
+        first = self.client.get("/api/stock/items/", {"ordering": "-code", "page_size": 3})
+
+        self.assertEqual(
+            [row["code"] for row in first.data["results"]],
+            [f"C{i:03d}" for i in range(self.total - 1, self.total - 4, -1)],
+        )
+        self.assertIn("ordering=-code", first.data["next"])
+        self.assertIn("page_size=3", first.data["next"])
+
+        last = self.client.get(first.data["next"].replace("page=2", f"page={self.total // 3 + 1}"))
+
+        self.assertIsNone(last.data["next"])
+        self.assertEqual(last.data["results"][-1]["code"], "C000")
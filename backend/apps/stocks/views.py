@@ -2,6 +2,7 @@
 
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q
@@ -11,15 +12,26 @@ from apps.inventory.models import Item, StockLedger
 from .serializers import ItemStockSerializer, StockLedgerSerializer
 
 
+class StockItemPagination(PageNumberPagination):
+    """Pages follow the list's ?ordering (ties broken by id, so pages never overlap)"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
 class StockItemViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API Endpoints:
-    - GET /api/stock/items/                  → List all items with current stock (from approved GRNs)
+    - GET /api/stock/items/                  → List all items with current stock (from StockBalance), paginated
     - GET /api/stock/items/<id>/              → Detail of one item
     - GET /api/stock/items/<id>/ledger/       → Full movement history for an item
     """
     serializer_class = ItemStockSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StockItemPagination
+
+    LOW_STOCK_THRESHOLD = 10
+    ORDERING_FIELDS = {'name', 'code', 'category', 'on_hand', 'available', 'on_hand_value'}
 
     def get_queryset(self):
         """
@@ -32,7 +44,7 @@ class StockItemViewSet(viewsets.ReadOnlyModelViewSet):
         if not hasattr(user, 'organization') or not user.organization:
             return Item.objects.none()
 
-        qs = Item.objects.filter(organization=user.organization)
+        qs = Item.objects.filter(organization=user.organization).with_stock()
 
         # Search by name or code
         search = self.request.query_params.get('search')
@@ -47,14 +59,17 @@ class StockItemViewSet(viewsets.ReadOnlyModelViewSet):
         if category:
             qs = qs.filter(category=category)
 
-        # Low stock filter (client-side because current_stock is a property)
+        # Low stock filter (on the annotated balance, stays in SQL)
         low_stock_only = self.request.query_params.get('low_stock', 'false').lower() == 'true'
         if low_stock_only:
-            # Load into memory and filter based on computed current_stock
-            items = list(qs)
-            return [item for item in items if float(item.current_stock) <= 10.0]
+            qs = qs.filter(on_hand__lte=self.LOW_STOCK_THRESHOLD)
 
-        return qs.order_by('name')
+        # Sorting: ?ordering=on_hand_value or ?ordering=-on_hand
+        ordering = self.request.query_params.get('ordering', 'name')
+        if ordering.lstrip('-') not in self.ORDERING_FIELDS:
+            ordering = 'name'
+
+        return qs.order_by(ordering, 'id')
 
 
     @action(detail=True, methods=['get'], url_path='ledger')
@@ -66,17 +81,12 @@ class StockItemViewSet(viewsets.ReadOnlyModelViewSet):
 
         movements = item.stock_movements.select_related('created_by').order_by('-created_at')
 
-        # Handle pagination if enabled
-        page = self.paginate_queryset(movements)
-        if page is not None:
-            serializer = StockLedgerSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
+        # Item pagination does not apply here: the history is one item's own
         serializer = StockLedgerSerializer(movements, many=True)
         return Response({
             'item': self.get_serializer(item).data,
-            'current_stock': str(item.current_stock),      # ensure Decimal → str for JSON
-            'available_stock': str(item.available_stock),
+            'current_stock': str(item.on_hand),      # ensure Decimal → str for JSON
+            'available_stock': str(item.available),
             'movements': serializer.data
         })
 
@@ -27,6 +27,8 @@ export default function TransactionHistory() {
   const [toDate, setToDate] = useState("");
 
   const [currentPage, setCurrentPage] = useState(1);
+  const [nextPageUrl, setNextPageUrl] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const itemsPerPage = 10;
 
   const [selectedTransfer, setSelectedTransfer] = useState(null);
@@ -40,9 +42,14 @@ export default function TransactionHistory() {
     setError("");
 
     try {
-      const res = await api.get("/inventory/material-transfer/");
-      setTransactions(res.data || []);
-      setFilteredTransactions(res.data || []);
+      // Cursor-paginated: newest page first, older pages via "Load older"
+      const res = await api.get("/inventory/material-transfer/", {
+        params: { page_size: 500 },
+      });
+      const rows = res.data?.results || [];
+      setTransactions(rows);
+      setFilteredTransactions(rows);
+      setNextPageUrl(res.data?.next || null);
       setCurrentPage(1);
     } catch (err) {
       setError("Could not load transfer history");
@@ -52,6 +59,22 @@ export default function TransactionHistory() {
     }
   };
 
+  const loadOlderTransactions = async () => {
+    if (!nextPageUrl) return;
+    setLoadingMore(true);
+
+    try {
+      const res = await api.get(nextPageUrl);
+      setTransactions((prev) => [...prev, ...(res.data?.results || [])]);
+      setNextPageUrl(res.data?.next || null);
+    } catch (err) {
+      setError("Could not load older transfers");
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     let result = [...transactions];
 
@@ -421,6 +444,18 @@ export default function TransactionHistory() {
                 </div>
               </div>
             )}
+
+            {nextPageUrl && (
+              <div className="flex justify-center mt-4">
+                <button
+                  onClick={loadOlderTransactions}
+                  disabled={loadingMore}
+                  className="h-10 px-5 rounded-xl border border-zinc-200 bg-white hover:bg-zinc-50 disabled:opacity-50 text-sm"
+                >
+                  {loadingMore ? "Loading..." : "Load older transfers"}
+                </button>
+              </div>
+            )}
           </>
         )}
       </div>
@@ -9,66 +9,62 @@ export default function CustomerLedger() {
   const navigate = useNavigate();
 
   const [ledger, setLedger] = useState([]);
-  const [filteredLedger, setFilteredLedger] = useState([]);
 
   const [fromDate, setFromDate] = useState("");
   const [toDate, setToDate] = useState("");
 
+  const [nextPageUrl, setNextPageUrl] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
   const [summary, setSummary] = useState({
+    opening: 0,
     debit: 0,
     credit: 0,
     balance: 0,
   });
 
   // ================= FETCH =================
+  // The server filters by date, pages by cursor and sends the running
+  // balance and period totals, so only the visible page is loaded
   useEffect(() => {
     fetchLedger();
-  }, []);
+  }, [fromDate, toDate]);
 
   const fetchLedger = async () => {
     try {
-      const res = await api.get(`/sale/customer-ledger/${id}/`);
-      const data = res.data || [];
-
-      setLedger(data);
-      setFilteredLedger(data);
-      calculateSummary(data);
+      const params = {};
+      if (fromDate) params.from = fromDate;
+      if (toDate) params.to = toDate;
+
+      const res = await api.get(`/sale/customer-ledger/${id}/`, { params });
+      const data = res.data || {};
+
+      setLedger(data.results || []);
+      setNextPageUrl(data.next || null);
+      setSummary({
+        opening: data.opening_balance || 0,
+        debit: data.total_debit || 0,
+        credit: data.total_credit || 0,
+        balance: data.closing_balance || 0,
+      });
     } catch (err) {
       console.error(err);
     }
   };
 
-  // ================= FILTER =================
-  useEffect(() => {
-    let data = [...ledger];
-
-    if (fromDate) {
-      data = data.filter((row) => new Date(row.date) >= new Date(fromDate));
-    }
+  const loadMoreEntries = async () => {
+    if (!nextPageUrl) return;
+    setLoadingMore(true);
 
-    if (toDate) {
-      data = data.filter((row) => new Date(row.date) <= new Date(toDate));
+    try {
+      const res = await api.get(nextPageUrl);
+      setLedger((prev) => [...prev, ...(res.data?.results || [])]);
+      setNextPageUrl(res.data?.next || null);
+    } catch (err) {
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
     }
-
-    setFilteredLedger(data);
-    calculateSummary(data);
-  }, [fromDate, toDate, ledger]);
-
-  // ================= SUMMARY =================
-  const calculateSummary = (data) => {
-    let debit = 0;
-    let credit = 0;
-
-    data.forEach((row) => {
-      debit += Number(row.debit || 0);
-      credit += Number(row.credit || 0);
-    });
-
-    setSummary({
-      debit,
-      credit,
-      balance: debit - credit,
-    });
   };
 
   // ================= FORMAT =================
@@ -94,7 +90,14 @@ export default function CustomerLedger() {
       </div>
 
       {/* SUMMARY CARDS */}
-      <div className="grid grid-cols-3 gap-4 mb-6">
+      <div className="grid grid-cols-4 gap-4 mb-6">
+        <div className="bg-white p-5 rounded-lg shadow">
+          <p className="text-gray-500 text-sm">Opening Balance</p>
+          <h2 className="text-xl font-bold text-gray-700">
+            {formatCurrency(summary.opening)}
+          </h2>
+        </div>
+
         <div className="bg-white p-5 rounded-lg shadow">
           <p className="text-gray-500 text-sm">Total Debit</p>
           <h2 className="text-xl font-bold text-red-600">
@@ -110,7 +113,7 @@ export default function CustomerLedger() {
         </div>
 
         <div className="bg-white p-5 rounded-lg shadow">
-          <p className="text-gray-500 text-sm">Balance</p>
+          <p className="text-gray-500 text-sm">Closing Balance</p>
           <h2 className="text-xl font-bold text-blue-600">
             {formatCurrency(summary.balance)}
           </h2>
@@ -149,7 +152,7 @@ export default function CustomerLedger() {
           </thead>
 
           <tbody>
-            {filteredLedger.map((row, idx) => (
+            {ledger.map((row, idx) => (
               <tr key={idx} className="border-b hover:bg-gray-50">
                 <td className="p-4">{formatDate(row.date)}</td>
 
@@ -186,9 +189,21 @@ export default function CustomerLedger() {
         </table>
       </div>
 
+      {nextPageUrl && (
+        <div className="flex justify-center mt-4">
+          <button
+            onClick={loadMoreEntries}
+            disabled={loadingMore}
+            className="px-5 py-2 rounded-lg border bg-white hover:bg-gray-50 disabled:opacity-50 text-sm"
+          >
+            {loadingMore ? "Loading..." : "Load more entries"}
+          </button>
+        </div>
+      )}
+
       {/* FOOTER */}
       <div className="mt-4 text-right text-sm text-gray-600">
-        Showing {filteredLedger.length} entries
+        Showing {ledger.length} entries
       </div>
     </div>
   );
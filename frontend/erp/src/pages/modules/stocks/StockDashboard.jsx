@@ -43,14 +43,9 @@ export default function StockDashboard() {
     setError(null);
 
     try {
-      const itemsRes = await api.get("/stock/items/");
-      const items = itemsRes.data.results || itemsRes.data;
-
-      const lowStockCount = items.filter((item) => item.available_stock <= 10).length;
-      const stockValue = items.reduce(
-        (sum, item) => sum + Number(item.current_stock || 0) * Number(item.standard_price || 0),
-        0
-      );
+      // The item list is paginated, so the totals come from the server
+      const statsRes = await api.get("/inventory/dashboard-stats/");
+      const itemStats = statsRes.data;
 
       const ledgerRes = await api.get("/stock/ledger/", { params: { limit: 100 } });
       const movements = ledgerRes.data.results || ledgerRes.data;
@@ -67,9 +62,9 @@ export default function StockDashboard() {
         .reduce((sum, m) => sum + Number(m.quantity), 0);
 
       setStats({
-        total_items: items.length,
-        low_stock_items: lowStockCount,
-        total_stock_value: stockValue.toFixed(2),
+        total_items: itemStats.totalItems,
+        low_stock_items: itemStats.lowStock + itemStats.outOfStock,
+        total_stock_value: Number(itemStats.inventoryValue || 0).toFixed(2),
         recent_received: recentReceived.toFixed(0),
         recent_issued: recentIssued.toFixed(0),
       });